@@ -0,0 +1,195 @@
+from typing import Union, List, Dict, Tuple
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future, CancelledError
+import numpy as np
+
+
+default_max_cache_bytes = 256 * 1024 * 1024
+# When the dataset is not chunked (or its chunks are tiny), read blocks of at least this size
+default_min_block_bytes = 4 * 1024 * 1024
+
+
+class ChunkedTraceReader:
+    """Reads frame ranges of a (frames, channels) dataset in chunk-aligned blocks.
+
+    Requests are expanded to whole blocks along the frame axis, aligned to the
+    HDF5 chunk shape, and the decoded blocks are kept in a bounded LRU cache,
+    so walking the recording in small windows decompresses each chunk once.
+    When the dataset is chunked along the channel axis, blocks are also split
+    into whole channel chunks, so that a request for a few channels only
+    decodes the chunks that hold them. Otherwise blocks span all channels
+    (rows of a contiguous dataset are stored together, so reading part of a
+    row costs about as much as reading all of it).
+    When consecutive blocks are requested, the next block is read on a
+    background thread while the caller works on the current one. Call close()
+    (or use the reader as a context manager) to stop the background thread.
+    """
+    def __init__(
+        self,
+        dataset,
+        *,
+        max_cache_bytes: int = default_max_cache_bytes,
+        prefetch: bool = True
+    ):
+        """
+        Args:
+            dataset: An h5py.Dataset (or array-like) with shape (frames, channels).
+            max_cache_bytes (int): Memory budget for decoded blocks.
+            prefetch (bool): Whether to read ahead on sequential access.
+        """
+        self._dataset = dataset
+        self._num_frames = int(dataset.shape[0])
+        self._num_channels = int(dataset.shape[1])
+        self._block_channels = _get_block_channels(dataset)
+        self._block_frames = _get_block_frames(dataset, self._block_channels)
+        self._max_cache_bytes = max_cache_bytes
+        self._prefetch = prefetch
+        self._lock = threading.Lock()
+        self._cache: 'OrderedDict[Tuple[int, int], np.ndarray]' = OrderedDict()
+        self._cache_bytes = 0
+        self._pending: Dict[Tuple[int, int], Future] = {}
+        self._executor: Union[ThreadPoolExecutor, None] = None
+        self._closed = False
+        self._last_block = -2
+
+    @property
+    def block_frames(self) -> int:
+        return self._block_frames
+
+    @property
+    def block_channels(self) -> int:
+        return self._block_channels
+
+    def get_traces(
+        self,
+        start_frame: int,
+        end_frame: int,
+        channel_indices: Union[List[int], np.ndarray, slice, None] = None
+    ) -> np.ndarray:
+        if channel_indices is None:
+            channel_indices = slice(None)
+        if isinstance(channel_indices, slice):
+            channel_indices = np.arange(self._num_channels)[channel_indices]
+        else:
+            channel_indices = np.asarray(channel_indices, dtype=np.int64).reshape(-1)
+            if np.any((channel_indices < -self._num_channels) | (channel_indices >= self._num_channels)):
+                raise IndexError(f'Channel index out of range for {self._num_channels} channels')
+            channel_indices = channel_indices % max(1, self._num_channels)
+        start_frame = max(0, start_frame)
+        end_frame = min(self._num_frames, end_frame)
+        if end_frame <= start_frame:
+            return np.zeros((0, len(channel_indices)), dtype=self._dataset.dtype)
+        first_block = start_frame // self._block_frames
+        last_block = (end_frame - 1) // self._block_frames
+        sequential = first_block in (self._last_block, self._last_block + 1)
+        channel_blocks = channel_indices // self._block_channels
+        # always a new array, so that callers can't modify the cached blocks
+        traces = np.empty((end_frame - start_frame, len(channel_indices)), dtype=self._dataset.dtype)
+        for cb in np.unique(channel_blocks):
+            cb = int(cb)
+            positions = np.flatnonzero(channel_blocks == cb)
+            columns = channel_indices[positions] - cb * self._block_channels
+            for b in range(first_block, last_block + 1):
+                block = self._get_block((b, cb))
+                block_start = b * self._block_frames
+                i1 = max(start_frame, block_start) - block_start
+                i2 = min(end_frame, block_start + len(block)) - block_start
+                o1 = block_start + i1 - start_frame
+                traces[o1:o1 + i2 - i1, positions] = block[i1:i2][:, columns]
+        self._last_block = last_block
+        if sequential and self._prefetch:
+            for cb in np.unique(channel_blocks):
+                self._start_prefetch((last_block + 1, int(cb)))
+        return traces
+
+    def close(self):
+        """Stops the read-ahead thread. The reader can still be used, without read-ahead."""
+        with self._lock:
+            self._closed = True
+            executor = self._executor
+            self._executor = None
+            pending = self._pending
+            self._pending = {}
+        for future in pending.values():
+            future.cancel()
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __del__(self):
+        # the executor may not exist if __init__ failed
+        if getattr(self, '_executor', None) is not None:
+            self._executor.shutdown(wait=False)
+
+    def _get_block(self, key: Tuple[int, int]) -> np.ndarray:
+        with self._lock:
+            block = self._cache.get(key)
+            if block is not None:
+                self._cache.move_to_end(key)
+                return block
+            future = self._pending.get(key)
+        if future is not None and not future.cancelled():
+            try:
+                return future.result()
+            except CancelledError:
+                pass
+        return self._read_block(key)
+
+    def _read_block(self, key: Tuple[int, int]) -> np.ndarray:
+        block_index, channel_block_index = key
+        start = block_index * self._block_frames
+        end = min(start + self._block_frames, self._num_frames)
+        channel_start = channel_block_index * self._block_channels
+        channel_end = min(channel_start + self._block_channels, self._num_channels)
+        if channel_start == 0 and channel_end == self._num_channels:
+            block = np.asarray(self._dataset[start:end, :])
+        else:
+            block = np.asarray(self._dataset[start:end, channel_start:channel_end])
+        with self._lock:
+            self._pending.pop(key, None)
+            self._put(key, block)
+        return block
+
+    def _put(self, key: Tuple[int, int], block: np.ndarray):
+        if key in self._cache:
+            return
+        self._cache[key] = block
+        self._cache_bytes += block.nbytes
+        while self._cache_bytes > self._max_cache_bytes and len(self._cache) > 1:
+            _, evicted = self._cache.popitem(last=False)
+            self._cache_bytes -= evicted.nbytes
+
+    def _start_prefetch(self, key: Tuple[int, int]):
+        if key[0] * self._block_frames >= self._num_frames:
+            return
+        with self._lock:
+            if self._closed or key in self._cache or key in self._pending:
+                return
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+            self._pending[key] = self._executor.submit(self._read_block, key)
+
+
+def _get_block_channels(dataset) -> int:
+    num_channels = int(dataset.shape[1])
+    chunks = getattr(dataset, 'chunks', None)
+    if chunks is None or int(chunks[1]) >= num_channels:
+        return max(1, num_channels)
+    return int(chunks[1])
+
+
+def _get_block_frames(dataset, block_channels: int) -> int:
+    bytes_per_frame = max(1, block_channels * np.dtype(dataset.dtype).itemsize)
+    min_block_frames = max(1, default_min_block_bytes // bytes_per_frame)
+    chunks = getattr(dataset, 'chunks', None)
+    if chunks is None:
+        return min_block_frames
+    # a whole number of chunks along the frame axis
+    chunk_frames = int(chunks[0])
+    return chunk_frames * max(1, -(-min_block_frames // chunk_frames))
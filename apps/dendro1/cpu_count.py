@@ -0,0 +1,8 @@
+import os
+
+
+def get_num_available_cpus() -> int:
+    """Returns the number of CPUs this process may run on (which may be fewer than the machine has)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
@@ -2,6 +2,7 @@
 
 
 import os
+import tarfile
 from tempfile import TemporaryDirectory
 from dendro.sdk import (
     ProcessorBase,
@@ -42,6 +43,18 @@ class CreateSampleFolderProcessor(ProcessorBase):
 class TarContext(BaseModel):
     input: InputFolder = Field(description="Input folder")
     output: OutputFile = Field(description="Output .tar file")
+    compression: str = Field(
+        default="",
+        description="Compression of the tar file: '' (none), 'gzip' or 'zstd'. Compression is multithreaded",
+    )
+    streaming: bool = Field(
+        default=False,
+        description="Download the files concurrently straight into the tar file, rather than downloading the whole folder first",
+    )
+    num_workers: int = Field(
+        default=8,
+        description="Number of concurrent downloads when streaming, and of compression threads",
+    )
 
 
 class TarProcessor(ProcessorBase):
@@ -53,25 +66,38 @@ class TarProcessor(ProcessorBase):
 
     @staticmethod
     def run(context: TarContext):
-        import tarfile
+        from .streaming_tar import get_input_folder_sources, write_tar_from_sources, open_tar_output_stream
 
         input = context.input
         output = context.output
-        print("Downloading input folder")
-        input.download("input_folder")
-        output_fname = "output.tar"
-        print(f"Creating tar file: {output_fname}")
-        with tarfile.open(output_fname, "w") as tar:
-            # add each of the files and directories inside input_folder
-            for name in os.listdir("input_folder"):
-                tar.add(f"input_folder/{name}", arcname=name)
+        compression = context.compression
+        output_fname = {"": "output.tar", "gzip": "output.tar.gz", "zstd": "output.tar.zst"}[compression]
+        if context.streaming:
+            sources = get_input_folder_sources(input)
+            print(f"Creating tar file from {len(sources)} streamed input files: {output_fname}")
+            write_tar_from_sources(
+                sources, output_fname, compression=compression, num_workers=context.num_workers
+            )
+        else:
+            print("Downloading input folder")
+            input.download("input_folder")
+            print(f"Creating tar file: {output_fname}")
+            with open_tar_output_stream(output_fname, compression=compression, num_threads=context.num_workers) as f:
+                with tarfile.open(fileobj=f, mode="w|") as tar:
+                    # add each of the files and directories inside input_folder
+                    for name in sorted(os.listdir("input_folder")):
+                        tar.add(f"input_folder/{name}", arcname=name)
         print(f"Uploading tar file: {output_fname}")
         output.upload(output_fname)
 
 
 class UntarContext(BaseModel):
-    input: InputFile = Field(description="Input .tar file")
+    input: InputFile = Field(description="Input .tar file (optionally gzip or zstd compressed)")
     output: OutputFolder = Field(description="Output folder")
+    streaming: bool = Field(
+        default=False,
+        description="Extract the tar file while it is being downloaded, rather than downloading it first",
+    )
 
 
 class UntarProcessor(ProcessorBase):
@@ -83,15 +109,22 @@ class UntarProcessor(ProcessorBase):
 
     @staticmethod
     def run(context: UntarContext):
-        import tarfile
+        from .streaming_tar import extract_tar_stream, iter_url_chunks
 
         input = context.input
         output = context.output
-        print("Downloading input tar file")
-        input.download("input.tar")
         output_folder = "output_folder"
-        print("Extracting tar file: input.tar")
-        with tarfile.open("input.tar", "r") as tar:
-            tar.extractall(output_folder)
+        if context.streaming:
+            print("Extracting input tar file while downloading")
+            if input.local_file_name is not None:
+                chunks = iter_url_chunks(input.local_file_name)
+            else:
+                chunks = iter_url_chunks(input.get_url())
+            extract_tar_stream(chunks, output_folder)
+        else:
+            print("Downloading input tar file")
+            input.download("input.tar")
+            print("Extracting tar file: input.tar")
+            extract_tar_stream(iter_url_chunks("input.tar"), output_folder)
         print(f"Uploading output folder: {output_folder}")
         output.upload(output_folder)
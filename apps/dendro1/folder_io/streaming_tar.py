@@ -0,0 +1,341 @@
+from typing import List, Tuple, Iterator, Union
+import os
+import io
+import gzip
+import time
+import queue
+import tarfile
+import tempfile
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+
+default_num_workers = 8
+default_max_buffered_bytes = 512 * 1024 * 1024
+default_chunk_size = 1024 * 1024
+default_gzip_block_size = 4 * 1024 * 1024
+
+compressions = ['', 'gzip', 'zstd']
+
+# Modification time of the members of a streamed tar whose content comes
+# from a URL (there is no modification time in the file manifest). It is
+# fixed so that the same folder always gives the same tar file.
+streamed_member_mtime = 0
+
+
+def get_input_folder_sources(input_folder) -> List[Tuple[str, str]]:
+    """Returns (relative file name, URL or local path) for each file of a dendro InputFolder.
+
+    Args:
+        input_folder (InputFolder): The input folder.
+
+    Returns:
+        List[Tuple[str, str]]: The files, in the order of the folder's file manifest.
+    """
+    if input_folder.local_folder_name is not None:
+        sources = []
+        for root, dirs, files in os.walk(input_folder.local_folder_name):
+            dirs.sort()
+            for file in sorted(files):
+                path = os.path.join(root, file)
+                sources.append((os.path.relpath(path, input_folder.local_folder_name), path))
+        return sources
+    # dendro (pinned to 0.1.32 in the Dockerfile) has no public way to list
+    # the files of an input folder, so this uses the file manifest function
+    # that InputFolder.download and InputFolder.get_url use. Check it when
+    # upgrading dendro.
+    try:
+        from dendro.sdk.Job import _get_file_manifest_for_input_folder
+    except ImportError:
+        raise ImportError(
+            'Streaming an input folder requires dendro.sdk.Job._get_file_manifest_for_input_folder (dendro 0.1.32). '
+            'Use streaming=False with this version of dendro.'
+        )
+
+    manifest = _get_file_manifest_for_input_folder(
+        name=input_folder.name, job_id=input_folder.job_id, job_private_key=input_folder.job_private_key
+    )
+    return [(f.name, f.url) for f in manifest.files]
+
+
+def write_tar_from_sources(
+    sources: List[Tuple[str, str]],
+    output_fname: str,
+    *,
+    compression: str = '',
+    num_workers: int = default_num_workers,
+    max_buffered_bytes: int = default_max_buffered_bytes
+):
+    """Writes a tar file whose members are downloaded concurrently, without first downloading the whole folder.
+
+    The files are fetched on a thread pool, with at most 2 * num_workers
+    files in flight, each buffered in memory up to its share of
+    max_buffered_bytes (and spilled to a temporary file beyond that). The
+    members are appended to the tar stream in order as their downloads
+    complete.
+
+    Args:
+        sources (List[Tuple[str, str]]): (member name, URL or local path) of each file.
+        output_fname (str): The output tar file.
+        compression (str): '' (none), 'gzip' or 'zstd'.
+        num_workers (int): Number of concurrent downloads, and of compression threads.
+        max_buffered_bytes (int): Memory budget of the files in flight.
+    """
+    max_in_flight = 2 * max(1, num_workers)
+    spool_max_bytes = max(1, max_buffered_bytes // max_in_flight)
+    # the mode that a downloaded file gets, as in the tar written from the downloaded folder
+    umask = os.umask(0)
+    os.umask(umask)
+    downloaded_file_mode = 0o666 & ~umask
+    timer = time.time()
+    num_bytes = 0
+    with open_tar_output_stream(output_fname, compression=compression, num_threads=num_workers) as f:
+        with tarfile.open(fileobj=f, mode='w|') as tar:
+            with ThreadPoolExecutor(max_workers=max(1, num_workers)) as executor:
+                pending = deque()
+                for name, source in sources:
+                    pending.append((name, source, executor.submit(_fetch_to_spooled_file, source, spool_max_bytes)))
+                    if len(pending) >= max_in_flight:
+                        num_bytes += _add_fetched_member(tar, *pending.popleft(), default_mode=downloaded_file_mode)
+                while pending:
+                    num_bytes += _add_fetched_member(tar, *pending.popleft(), default_mode=downloaded_file_mode)
+    elapsed = time.time() - timer
+    print(f'Wrote {len(sources)} files ({num_bytes / 1e6:.1f} MB) to {output_fname} in {elapsed:.1f} sec')
+
+
+def extract_tar_stream(chunks: Iterator[bytes], output_folder: str, *, max_buffered_bytes: int = default_max_buffered_bytes):
+    """Extracts a (possibly gzip or zstd compressed) tar stream while it is being read.
+
+    The chunks are read ahead on a background thread, up to
+    max_buffered_bytes, so that the download overlaps with decompression
+    and writing the members.
+
+    Members that would be written outside of output_folder (absolute paths,
+    '..' components, or links pointing outside of it) and special files are
+    rejected, with tarfile's 'data' filter where available and otherwise
+    with the same checks done here.
+
+    Args:
+        chunks (Iterator[bytes]): The tar data, e.g. from iter_url_chunks.
+        output_folder (str): The folder to extract into.
+        max_buffered_bytes (int): Maximum number of bytes read ahead.
+    """
+    timer = time.time()
+    reader = io.BufferedReader(_PrefetchingReader(chunks, max_buffered_bytes=max_buffered_bytes), buffer_size=default_chunk_size)
+    magic = reader.peek(4)[:4]
+    if magic[:2] == b'\x1f\x8b':
+        # also reads the concatenated gzip members written by _ParallelGzipWriter
+        fileobj = gzip.GzipFile(fileobj=reader, mode='rb')
+    elif magic == b'\x28\xb5\x2f\xfd':
+        zstandard = _import_zstandard()
+        fileobj = zstandard.ZstdDecompressor().stream_reader(reader, read_across_frames=True)
+    else:
+        fileobj = reader
+    with tarfile.open(fileobj=fileobj, mode='r|') as tar:
+        if hasattr(tarfile, 'data_filter'):
+            tar.extractall(output_folder, filter='data')
+        else:
+            # Python versions without extraction filters (e.g. 3.9)
+            tar.extractall(output_folder, members=_iter_checked_members(tar, output_folder))
+    print(f'Extracted tar stream to {output_folder} in {time.time() - timer:.1f} sec')
+
+
+def iter_url_chunks(url_or_path: str, *, chunk_size: int = default_chunk_size) -> Iterator[bytes]:
+    """Yields the content of a URL (streamed) or local file in chunks."""
+    if not _is_url(url_or_path):
+        with open(url_or_path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+    r = requests.get(url_or_path, stream=True, timeout=60 * 60 * 24 * 7)
+    try:
+        if r.status_code != 200:
+            raise Exception(f'Error downloading file {url_or_path}: {r.status_code} {r.reason}')
+        for chunk in r.iter_content(chunk_size=chunk_size):
+            if chunk:
+                yield chunk
+    finally:
+        r.close()
+
+
+@contextmanager
+def open_tar_output_stream(output_fname: str, *, compression: str = '', num_threads: int = default_num_workers):
+    """Opens a file for writing a tar stream, compressing on num_threads threads if compression is 'gzip' or 'zstd'."""
+    if compression not in compressions:
+        raise ValueError(f'Unexpected compression: {compression}')
+    with open(output_fname, 'wb') as f:
+        if compression == 'gzip':
+            w = _ParallelGzipWriter(f, num_threads=num_threads)
+            try:
+                yield w
+            finally:
+                w.close()
+        elif compression == 'zstd':
+            zstandard = _import_zstandard()
+            w = zstandard.ZstdCompressor(threads=num_threads).stream_writer(f, closefd=False)
+            try:
+                yield w
+            finally:
+                w.close()
+        else:
+            yield f
+
+
+def _fetch_to_spooled_file(source: str, spool_max_bytes: int):
+    f = tempfile.SpooledTemporaryFile(max_size=spool_max_bytes)
+    try:
+        for chunk in iter_url_chunks(source):
+            f.write(chunk)
+        size = f.tell()
+        f.seek(0)
+    except Exception:
+        f.close()
+        raise
+    return f, size
+
+
+def _add_fetched_member(tar: tarfile.TarFile, name: str, source: str, future, *, default_mode: int) -> int:
+    f, size = future.result()
+    with f:
+        info = tarfile.TarInfo(name=name)
+        info.size = size
+        if _is_url(source):
+            info.mtime = streamed_member_mtime
+            info.mode = default_mode
+        else:
+            # a local file, as tar.add would record it
+            st = os.stat(source)
+            info.mtime = int(st.st_mtime)
+            info.mode = st.st_mode & 0o7777
+        tar.addfile(info, fileobj=f)
+    return size
+
+
+def _iter_checked_members(tar: tarfile.TarFile, output_folder: str) -> Iterator[tarfile.TarInfo]:
+    # The checks of tarfile's 'data' filter that matter for safety: every
+    # member, and the target of every link, must be inside output_folder,
+    # and only regular files, directories and links are extracted.
+    root = os.path.realpath(output_folder)
+    for member in tar:
+        name = member.name
+        if os.path.isabs(name) or '..' in name.replace('\\', '/').split('/'):
+            raise Exception(f'Refusing to extract {name!r}: outside of the output folder')
+        dest = os.path.realpath(os.path.join(root, name))
+        if os.path.commonpath([root, dest]) != root:
+            raise Exception(f'Refusing to extract {name!r}: outside of the output folder')
+        if member.issym() or member.islnk():
+            if os.path.isabs(member.linkname):
+                raise Exception(f'Refusing to extract link {name!r} to an absolute path: {member.linkname!r}')
+            if member.issym():
+                target = os.path.join(os.path.dirname(dest), member.linkname)
+            else:
+                target = os.path.join(root, member.linkname)
+            target = os.path.realpath(target)
+            if os.path.commonpath([root, target]) != root:
+                raise Exception(f'Refusing to extract link {name!r}: its target {member.linkname!r} is outside of the output folder')
+        elif not (member.isfile() or member.isdir()):
+            raise Exception(f'Refusing to extract {name!r}: not a regular file, directory or link')
+        yield member
+
+
+def _is_url(source: str) -> bool:
+    return source.startswith('http://') or source.startswith('https://')
+
+
+class _ParallelGzipWriter:
+    """Gzip compression on a thread pool.
+
+    The data is split into blocks that are compressed independently and
+    written in order as separate gzip members, which together are a valid
+    gzip stream (as written by pigz). zlib releases the GIL while
+    compressing, so the blocks are compressed in parallel.
+    """
+    def __init__(self, fileobj, *, num_threads: int, block_size: int = default_gzip_block_size):
+        self._fileobj = fileobj
+        self._block_size = block_size
+        self._buffer = bytearray()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, num_threads))
+        self._max_pending = 2 * max(1, num_threads)
+        self._pending = deque()
+        self._num_blocks = 0
+        self._closed = False
+
+    def write(self, data) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self._block_size:
+            block = bytes(self._buffer[:self._block_size])
+            del self._buffer[:self._block_size]
+            self._submit(block)
+        return len(data)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if len(self._buffer) > 0 or self._num_blocks == 0:
+                self._submit(bytes(self._buffer))
+                self._buffer = bytearray()
+            while self._pending:
+                self._fileobj.write(self._pending.popleft().result())
+        finally:
+            self._executor.shutdown()
+
+    def _submit(self, block: bytes):
+        self._pending.append(self._executor.submit(gzip.compress, block, 6))
+        self._num_blocks += 1
+        while len(self._pending) >= self._max_pending:
+            self._fileobj.write(self._pending.popleft().result())
+
+
+class _PrefetchingReader(io.RawIOBase):
+    """Reads chunks from an iterator on a background thread, into a bounded queue."""
+    def __init__(self, chunks: Iterator[bytes], *, max_buffered_bytes: int):
+        self._queue: 'queue.Queue[Union[bytes, BaseException, None]]' = queue.Queue(
+            maxsize=max(1, max_buffered_bytes // default_chunk_size)
+        )
+        self._current = memoryview(b'')
+        self._done = False
+        self._thread = threading.Thread(target=self._run, args=(chunks,), daemon=True)
+        self._thread.start()
+
+    def _run(self, chunks: Iterator[bytes]):
+        try:
+            for chunk in chunks:
+                self._queue.put(chunk)
+            self._queue.put(None)
+        except BaseException as e:
+            self._queue.put(e)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b) -> int:
+        while len(self._current) == 0:
+            if self._done:
+                return 0
+            item = self._queue.get()
+            if item is None:
+                self._done = True
+                return 0
+            if isinstance(item, BaseException):
+                self._done = True
+                raise item
+            self._current = memoryview(item)
+        n = min(len(b), len(self._current))
+        b[:n] = self._current[:n]
+        self._current = self._current[n:]
+        return n
+
+
+def _import_zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError('To use zstd compression, install zstandard: \n\n pip install zstandard\n\n')
+    return zstandard
@@ -4,12 +4,17 @@ import numpy as np
 import h5py
 
 
-def h5_to_nh5(h5_path: str, nh5_path: str) -> str:
+def h5_to_nh5(h5_path: str, nh5_path: str, *, max_block_bytes: int = 64 * 1024 * 1024) -> str:
     """Converts an h5 file to an nh5 file.
 
+    Datasets are copied in blocks of at most max_block_bytes (aligned to the
+    HDF5 chunks when the dataset is chunked), so the full dataset is never
+    held in memory.
+
     Args:
         h5_path (str): Path to the h5 file.
         nh5_path (str): Path to the nh5 file.
+        max_block_bytes (int): Maximum number of bytes to read from a dataset at a time.
     """
     with h5py.File(h5_path, 'r') as h5_file:
         with open(nh5_path, 'wb') as nh5_file:
@@ -37,10 +42,40 @@ def h5_to_nh5(h5_path: str, nh5_path: str) -> str:
             header_json = json.dumps(header).encode('utf-8')
             nh5_file.write(f'nh5|1|{len(header_json)}|'.encode('utf-8'))
             nh5_file.write(header_json)
-            position = 0
             for dataset in all_datasets_in_h5_file:
-                nh5_file.write(dataset[...].tobytes())
-                position += _get_dataset_byte_count(dataset)
+                for block in _iter_dataset_blocks(dataset, max_block_bytes):
+                    nh5_file.write(np.ascontiguousarray(block).data)
+
+def _iter_dataset_blocks(dataset: h5py.Dataset, max_block_bytes: int):
+    """Yields the contents of an HDF5 dataset as consecutive blocks in C order.
+
+    Args:
+        dataset (h5py.Dataset): The dataset.
+        max_block_bytes (int): Maximum number of bytes in a block. A single
+            element is always yielded even if it exceeds this size.
+    """
+    if dataset.ndim == 0 or _get_dataset_byte_count(dataset) <= max_block_bytes:
+        yield dataset[()]
+        return
+    yield from _iter_dataset_blocks_along_axis(dataset, (), max_block_bytes)
+
+def _iter_dataset_blocks_along_axis(dataset: h5py.Dataset, prefix: tuple, max_block_bytes: int):
+    axis = len(prefix)
+    num_slices = dataset.shape[axis]
+    slice_byte_count = int(np.prod(dataset.shape[axis + 1:])) * dataset.dtype.itemsize
+    if slice_byte_count > max_block_bytes and axis + 1 < dataset.ndim:
+        # a single slice along this axis is too large, so split it further
+        for i in range(num_slices):
+            yield from _iter_dataset_blocks_along_axis(dataset, prefix + (i,), max_block_bytes)
+        return
+    step = max(1, max_block_bytes // max(1, slice_byte_count))
+    chunk_size = dataset.chunks[axis] if dataset.chunks is not None else None
+    if chunk_size is not None and step >= chunk_size:
+        # read whole chunks so that each chunk is only decompressed once
+        step = (step // chunk_size) * chunk_size
+    for start in range(0, num_slices, step):
+        end = min(start + step, num_slices)
+        yield dataset[prefix + (slice(start, end),)]
 
 def _get_h5_groups(h5_file: h5py.File) -> list:
     """Returns a list of all groups in an h5 file.
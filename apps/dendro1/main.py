@@ -4,7 +4,7 @@
 from dendro.sdk import (
     App,
 )
-from tuning_curves_2d.tuning_curves_2d import TuningCurves2DProcessor
+from tuning_curves_2d.tuning_curves_2d import TuningCurves2DProcessor, TuningCurves2DBatchProcessor
 from folder_io.folder_io import (
     CreateSampleFolderProcessor,
     TarProcessor,
@@ -22,6 +22,7 @@ app = App(
 
 
 app.add_processor(TuningCurves2DProcessor)
+app.add_processor(TuningCurves2DBatchProcessor)
 app.add_processor(CreateSampleFolderProcessor)
 app.add_processor(TarProcessor)
 app.add_processor(UntarProcessor)
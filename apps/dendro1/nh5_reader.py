@@ -0,0 +1,144 @@
+from typing import Union
+import json
+import mmap
+import numpy as np
+
+
+class Nh5File:
+    """Read-only access to an nh5 file.
+
+    The header is parsed once when the file is opened. Datasets are returned
+    as NumPy views into a memory map of the file, so no data is read until
+    the corresponding elements are accessed.
+
+    Example:
+        with Nh5File('output.nh5') as f:
+            rate_maps = f['/rate_maps']
+            unit_ids = f.attrs('/')['unit_ids']
+    """
+    def __init__(self, nh5_path: str):
+        """
+        Args:
+            nh5_path (str): Path to the nh5 file.
+        """
+        self._file = open(nh5_path, 'rb')
+        try:
+            self._header, self._data_offset = _read_nh5_header(self._file)
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        self._datasets = {d['path']: d for d in self._header['datasets']}
+        self._groups = {g['path']: g for g in self._header['groups']}
+
+    @property
+    def dataset_paths(self) -> list:
+        return list(self._datasets.keys())
+
+    @property
+    def group_paths(self) -> list:
+        return list(self._groups.keys())
+
+    def attrs(self, path: str) -> dict:
+        """Returns the attributes of a group or dataset."""
+        path = _normalize_path(path)
+        if path in self._datasets:
+            return self._datasets[path]['attrs']
+        if path in self._groups:
+            return self._groups[path]['attrs']
+        raise KeyError(f'No such group or dataset: {path}')
+
+    def get_dataset(self, path: str) -> np.ndarray:
+        """Returns a read-only, zero-copy view of a dataset.
+
+        Args:
+            path (str): Path of the dataset within the file, e.g. '/rate_maps'.
+
+        Returns:
+            np.ndarray: An array backed by the memory-mapped file.
+        """
+        path = _normalize_path(path)
+        if path not in self._datasets:
+            raise KeyError(f'No such dataset: {path}')
+        d = self._datasets[path]
+        dtype = np.dtype(d['dtype'])
+        shape = tuple(d['shape'])
+        count = int(np.prod(shape))
+        return np.frombuffer(
+            self._mmap,
+            dtype=dtype,
+            count=count,
+            offset=self._data_offset + d['position']
+        ).reshape(shape)
+
+    def __getitem__(self, path: str) -> np.ndarray:
+        return self.get_dataset(path)
+
+    def __contains__(self, path: str) -> bool:
+        path = _normalize_path(path)
+        return path in self._datasets or path in self._groups
+
+    def close(self):
+        # The memory map can only be closed once no views reference it. Views
+        # that are still alive keep it open until they are garbage collected.
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def read_nh5_header(nh5_path: str) -> dict:
+    """Returns the parsed JSON header of an nh5 file without mapping the data.
+
+    Args:
+        nh5_path (str): Path to the nh5 file.
+    """
+    with open(nh5_path, 'rb') as f:
+        header, _ = _read_nh5_header(f)
+    return header
+
+
+def _read_nh5_header(f) -> tuple:
+    """Parses the nh5|1|<len>| prefix and JSON header.
+
+    Returns:
+        tuple: The header dict and the byte offset at which the data begins.
+    """
+    prefix = b''
+    num_separators = 0
+    # The prefix is short (nh5|1|<len>|), so read it one byte at a time
+    while num_separators < 3:
+        c = f.read(1)
+        if not c:
+            raise ValueError('Unexpected end of file while reading nh5 header')
+        prefix += c
+        if c == b'|':
+            num_separators += 1
+        if len(prefix) > 64:
+            raise ValueError('Not an nh5 file')
+    parts = prefix.decode('utf-8').split('|')
+    if parts[0] != 'nh5':
+        raise ValueError('Not an nh5 file')
+    if parts[1] != '1':
+        raise ValueError(f'Unsupported nh5 format version: {parts[1]}')
+    header_length = int(parts[2])
+    header_json = f.read(header_length)
+    if len(header_json) != header_length:
+        raise ValueError('Unexpected end of file while reading nh5 header')
+    header = json.loads(header_json.decode('utf-8'))
+    return header, len(prefix) + header_length
+
+
+def _normalize_path(path: Union[str, None]) -> str:
+    if not path:
+        return '/'
+    if not path.startswith('/'):
+        path = '/' + path
+    return path
@@ -0,0 +1,99 @@
+from typing import Union, Dict
+import threading
+import weakref
+
+
+class NwbObjectIndex:
+    """Resolves objects within an open NWBFile, caching the lookups.
+
+    The ElectricalSeries name index is built with a single walk over
+    nwbfile.all_children() the first time it is needed, and resolved paths
+    are memoized, so that creating several extractors for the same open
+    file does not walk the object tree again.
+    """
+    def __init__(self, nwbfile):
+        """
+        Args:
+            nwbfile (pynwb.NWBFile): The open NWB file.
+        """
+        self._nwbfile_ref = weakref.ref(nwbfile)
+        self._lock = threading.Lock()
+        self._electrical_series_by_name: Union[Dict[str, object], None] = None
+        self._objects_by_path: Dict[str, object] = {}
+
+    @property
+    def nwbfile(self):
+        nwbfile = self._nwbfile_ref()
+        if nwbfile is None:
+            raise ValueError('The NWB file is no longer available')
+        return nwbfile
+
+    def get_electrical_series_by_name(self) -> Dict[str, object]:
+        """Returns a dict of all ElectricalSeries objects in the file, keyed by name."""
+        with self._lock:
+            if self._electrical_series_by_name is None:
+                from pynwb.ecephys import ElectricalSeries
+                self._electrical_series_by_name = {
+                    item.name: item for item in self.nwbfile.all_children() if isinstance(item, ElectricalSeries)
+                }
+            return self._electrical_series_by_name
+
+    def get_object(self, path: str):
+        """Returns the object at a path such as 'units' or 'processing/ecephys/units'.
+
+        The first path component may be 'processing' or 'units'; other
+        components are looked up by name within their parent.
+        """
+        parts = [p for p in path.split('/') if p]
+        key = '/'.join(parts)
+        with self._lock:
+            if key in self._objects_by_path:
+                return self._objects_by_path[key]
+        obj = self.nwbfile
+        for i, part in enumerate(parts):
+            prefix = '/'.join(parts[:i + 1])
+            with self._lock:
+                cached = self._objects_by_path.get(prefix)
+            if cached is not None:
+                obj = cached
+                continue
+            if i == 0 and part == 'processing':
+                obj = obj.processing
+            elif i == 0 and part == 'units':
+                obj = obj.units
+            else:
+                obj = obj[part]
+            with self._lock:
+                self._objects_by_path[prefix] = obj
+        return obj
+
+
+_index_attr = '_dendro_object_index'
+_indexes_lock = threading.Lock()
+
+
+def get_nwb_object_index(nwbfile) -> NwbObjectIndex:
+    """Returns the object index of an open NWBFile, creating it on first use.
+
+    The index is stored as an attribute of the NWBFile rather than in a
+    module-level mapping: the resolved objects refer back to the file
+    through their parents, so a global mapping would keep every file (and
+    the h5py file behind it) alive.
+
+    Args:
+        nwbfile (pynwb.NWBFile): The open NWB file.
+
+    Returns:
+        NwbObjectIndex: The index shared by all callers using this NWBFile.
+    """
+    with _indexes_lock:
+        index = getattr(nwbfile, _index_attr, None)
+        if index is None:
+            index = NwbObjectIndex(nwbfile)
+            setattr(nwbfile, _index_attr, index)
+        return index
+
+
+def get_nwb_object(nwbfile, path: str):
+    """Returns the object at a path within an open NWBFile, see NwbObjectIndex.get_object."""
+    return get_nwb_object_index(nwbfile).get_object(path)
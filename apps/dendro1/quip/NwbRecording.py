@@ -28,50 +28,17 @@ class NwbRecording(si.BaseRecording):
         # Get channel ids
         electrode_indices = electrical_series['electrodes'][:]
         electrodes_table = h5_file['/general/extracellular_ephys/electrodes']
-        channel_ids = [electrodes_table['id'][i] for i in electrode_indices]
+        channel_ids, locations, group_names, group_ids = _read_electrode_properties(electrodes_table, electrode_indices)
 
         si.BaseRecording.__init__(self, channel_ids=channel_ids, sampling_frequency=sampling_frequency, dtype=dtype)
 
         # Set electrode locations
-        if 'rel_x' in electrodes_table:
-            channel_loc_x = [electrodes_table['rel_x'][i] for i in electrode_indices]
-            channel_loc_y = [electrodes_table['rel_y'][i] for i in electrode_indices]
-            if 'rel_z' in electrodes_table:
-                channel_loc_z = [electrodes_table['rel_z'][i] for i in electrode_indices]
-            else:
-                channel_loc_z = None
-        elif 'x' in electrodes_table:
-            channel_loc_x = [electrodes_table['x'][i] for i in electrode_indices]
-            channel_loc_y = [electrodes_table['y'][i] for i in electrode_indices]
-            if 'z' in electrodes_table:
-                channel_loc_z = [electrodes_table['z'][i] for i in electrode_indices]
-            else:
-                channel_loc_z = None
-        else:
-            channel_loc_x = None
-            channel_loc_y = None
-            channel_loc_z = None
-        if channel_loc_x is not None:
-            ndim = 2 if channel_loc_z is None else 3
-            locations = np.zeros((len(electrode_indices), ndim), dtype=float)
-            for i, electrode_index in enumerate(electrode_indices):
-                locations[i, 0] = channel_loc_x[electrode_index]
-                locations[i, 1] = channel_loc_y[electrode_index]
-                if channel_loc_z is not None:
-                    locations[i, 2] = channel_loc_z[electrode_index]
+        if locations is not None:
             self.set_dummy_probe_from_locations(locations)
 
         # Extractors channel groups must be integers, but Nwb electrodes group_name can be strings
-        if "group_name" in electrodes_table:
-            unique_electrode_group_names = list(np.unique(electrodes_table["group_name"][:]))
-            print(unique_electrode_group_names)
-
-            groups = []
-            for electrode_index in electrode_indices:
-                group_name = electrodes_table["group_name"][electrode_index]
-                group_id = unique_electrode_group_names.index(group_name)
-                groups.append(group_id)
-            self.set_channel_groups(groups)
+        if group_ids is not None:
+            self.set_channel_groups(group_ids)
 
         recording_segment = NwbRecordingSegment(
             electrical_series_data=electrical_series_data,
@@ -79,16 +46,59 @@ class NwbRecording(si.BaseRecording):
         )
         self.add_recording_segment(recording_segment)
 
+
+def _read_electrode_properties(electrodes_table: h5py.Group, electrode_indices: np.ndarray):
+    """Returns the channel ids, locations, unique group names and group ids of the electrical series channels.
+
+    Each electrodes table column is read once and indexed by
+    electrode_indices. The locations and groups are None if the table has no
+    such columns.
+    """
+    channel_ids = list(electrodes_table['id'][:][electrode_indices])
+    if 'rel_x' in electrodes_table:
+        location_columns = ['rel_x', 'rel_y', 'rel_z'] if 'rel_z' in electrodes_table else ['rel_x', 'rel_y']
+    elif 'x' in electrodes_table:
+        location_columns = ['x', 'y', 'z'] if 'z' in electrodes_table else ['x', 'y']
+    else:
+        location_columns = None
+    locations = None
+    if location_columns is not None:
+        locations = np.zeros((len(electrode_indices), len(location_columns)), dtype=float)
+        for dim, column in enumerate(location_columns):
+            locations[:, dim] = electrodes_table[column][:][electrode_indices]
+    group_names = None
+    group_ids = None
+    if "group_name" in electrodes_table:
+        unique_electrode_group_names, all_group_ids = np.unique(electrodes_table["group_name"][:], return_inverse=True)
+        group_names = list(unique_electrode_group_names)
+        group_ids = all_group_ids[electrode_indices]
+    return channel_ids, locations, group_names, group_ids
+
+
 class NwbRecordingSegment(si.BaseRecordingSegment):
     def __init__(self, electrical_series_data: h5py.Dataset, sampling_frequency: float) -> None:
+        from chunked_trace_reader import ChunkedTraceReader
+
         self._electrical_series_data = electrical_series_data
+        # chunk-aligned reads with an LRU of decoded chunks and read-ahead
+        self._trace_reader = ChunkedTraceReader(electrical_series_data)
         si.BaseRecordingSegment.__init__(self, sampling_frequency=sampling_frequency)
 
     def get_num_samples(self) -> int:
         return self._electrical_series_data.shape[0]
 
     def get_traces(self, start_frame: int, end_frame: int, channel_indices: Union[List[int], None] = None) -> np.ndarray:
-        if channel_indices is None:
-            return self._electrical_series_data[start_frame:end_frame, :]
-        else:
-            return self._electrical_series_data[start_frame:end_frame, channel_indices]
+        if start_frame is None:
+            start_frame = 0
+        if end_frame is None:
+            end_frame = self.get_num_samples()
+        return self._trace_reader.get_traces(start_frame, end_frame, channel_indices)
+
+    def close(self):
+        """Stops the read-ahead thread of the trace reader."""
+        trace_reader = getattr(self, '_trace_reader', None)
+        if trace_reader is not None:
+            trace_reader.close()
+
+    def __del__(self):
+        self.close()
@@ -0,0 +1,487 @@
+from typing import Union, Dict, List, Tuple
+import io
+import os
+import hashlib
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+import requests
+
+
+default_block_size = 128 * 1024
+default_max_cache_bytes = 512 * 1024 * 1024
+default_max_readahead_blocks = 64
+default_num_retries = 3
+default_max_sources = 32
+default_max_spool_bytes = 4 * 1024 * 1024 * 1024
+
+
+def open_remote_file(url: str) -> "RemoteFile":
+    """Opens a remote file for reading, e.g. with h5py.File(open_remote_file(url), 'r').
+
+    All files opened for the same URL within the process share a single LRU
+    block cache, so opening the same URL twice does not re-download the
+    blocks that were already read. Missing adjacent blocks are fetched with a
+    single range request, and sequential reads trigger a growing read-ahead.
+
+    If the server ignores range requests, the whole file is downloaded once
+    to a temporary file (within the spool budget, see configure_remote_files)
+    and read from there.
+
+    Close the file when done, so that its source can be evicted.
+
+    Args:
+        url (str): The URL of the remote file.
+
+    Returns:
+        RemoteFile: A seekable, read-only file-like object.
+    """
+    return RemoteFile(_manager.open_source(url))
+
+
+def configure_remote_files(
+    *,
+    block_size: Union[int, None] = None,
+    max_cache_bytes: Union[int, None] = None,
+    max_readahead_blocks: Union[int, None] = None,
+    disk_cache_dir: Union[str, None] = None,
+    max_sources: Union[int, None] = None,
+    max_spool_bytes: Union[int, None] = None
+):
+    """Configures the process-wide remote file layer.
+
+    Args:
+        block_size (int, optional): Size of the cached blocks. Changing it clears the cache.
+        max_cache_bytes (int, optional): Memory budget of the LRU block cache, shared by all URLs.
+        max_readahead_blocks (int, optional): Maximum number of blocks to read ahead on sequential access.
+        disk_cache_dir (str, optional): Directory for a persistent on-disk tier of the block cache.
+        max_sources (int, optional): Number of URLs whose sources (HTTP session, length) are kept once their files are closed.
+        max_spool_bytes (int, optional): Total size of the temporary full downloads of URLs whose server ignores range requests.
+    """
+    _manager.configure(
+        block_size=block_size,
+        max_cache_bytes=max_cache_bytes,
+        max_readahead_blocks=max_readahead_blocks,
+        disk_cache_dir=disk_cache_dir,
+        max_sources=max_sources,
+        max_spool_bytes=max_spool_bytes
+    )
+
+
+def close_remote_files(url: Union[str, None] = None):
+    """Releases the sources and cached blocks of one URL, or of all URLs, that have no open files."""
+    _manager.close_sources(url)
+
+
+def get_remote_file_stats(url: Union[str, None] = None) -> dict:
+    """Returns request and cache counters for one URL, or totals over all URLs (including released ones)."""
+    return _manager.get_stats(url)
+
+
+class RemoteFileStats:
+    def __init__(self):
+        self.request_count = 0
+        self.bytes_fetched = 0
+        self.block_cache_hits = 0
+        self.block_cache_misses = 0
+        self.disk_cache_hits = 0
+
+    def add(self, other: "RemoteFileStats"):
+        self.request_count += other.request_count
+        self.bytes_fetched += other.bytes_fetched
+        self.block_cache_hits += other.block_cache_hits
+        self.block_cache_misses += other.block_cache_misses
+        self.disk_cache_hits += other.disk_cache_hits
+
+    def to_dict(self) -> dict:
+        return {
+            'request_count': self.request_count,
+            'bytes_fetched': self.bytes_fetched,
+            'block_cache_hits': self.block_cache_hits,
+            'block_cache_misses': self.block_cache_misses,
+            'disk_cache_hits': self.disk_cache_hits
+        }
+
+
+class RemoteFile(io.RawIOBase):
+    def __init__(self, source: "_RemoteSource"):
+        self._source = source
+        self._position = 0
+        self._last_block_read = -2
+        self._readahead_blocks = 0
+
+    def close(self):
+        if not self.closed:
+            _manager.release_source(self._source)
+        super().close()
+
+    @property
+    def length(self) -> int:
+        return self._source.length
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            self._position = self._source.length + offset
+        else:
+            raise ValueError(f'Invalid whence: {whence}')
+        if self._position < 0:
+            raise ValueError('Negative seek position')
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def readinto(self, b) -> int:
+        size = min(len(b), self._source.length - self._position)
+        if size <= 0:
+            return 0
+        block_size = _manager.block_size
+        first_block = self._position // block_size
+        last_block = (self._position + size - 1) // block_size
+        if first_block in (self._last_block_read, self._last_block_read + 1):
+            # sequential access: double the read-ahead each time
+            self._readahead_blocks = min(max(1, self._readahead_blocks * 2), _manager.max_readahead_blocks)
+        else:
+            self._readahead_blocks = 0
+        blocks = _manager.read_blocks(self._source, first_block, last_block, self._readahead_blocks)
+        out = memoryview(b).cast('B')
+        offset_in_block = self._position - first_block * block_size
+        num_copied = 0
+        for block in blocks:
+            n = min(len(block) - offset_in_block, size - num_copied)
+            out[num_copied:num_copied + n] = block[offset_in_block:offset_in_block + n]
+            num_copied += n
+            offset_in_block = 0
+        self._position += num_copied
+        self._last_block_read = last_block
+        return num_copied
+
+
+class _RemoteSource:
+    def __init__(self, url: str):
+        self.url = url
+        self.stats = RemoteFileStats()
+        self.num_open = 0
+        self._session = requests.Session()
+        self._spool = None
+        self._spool_lock = threading.Lock()
+        # use an aborted GET request for the first byte rather than a HEAD
+        # request to get the length, because presigned AWS URLs do not
+        # support HEAD requests. The status also tells whether the server
+        # supports range requests.
+        response = self._session.get(url, headers={'Range': 'bytes=0-0'}, stream=True, timeout=60)
+        try:
+            if response.status_code == 206:
+                self.supports_range = True
+                self.length = int(response.headers['Content-Range'].split('/')[-1])
+            elif response.status_code == 200:
+                self.supports_range = False
+                self.length = int(response.headers['Content-Length'])
+            elif response.status_code == 416:
+                # empty file
+                self.supports_range = True
+                self.length = 0
+            else:
+                raise Exception(f'Error getting file length: {response.status_code} {response.reason}')
+        finally:
+            response.close()
+
+    @property
+    def is_spooled(self) -> bool:
+        return self._spool is not None
+
+    def spool(self):
+        """Downloads the whole file to a temporary file with a single request, for a server that ignores range requests."""
+        f = tempfile.TemporaryFile()
+        try:
+            response = self._session.get(self.url, stream=True, timeout=60)
+            try:
+                if response.status_code != 200:
+                    raise Exception(f'Error downloading {self.url}: {response.status_code} {response.reason}')
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk)
+            finally:
+                response.close()
+            if f.tell() != self.length:
+                raise Exception(f'Unexpected number of bytes downloaded from {self.url}: {f.tell()} != {self.length}')
+        except Exception:
+            f.close()
+            raise
+        self._spool = f
+        self.stats.request_count += 1
+        self.stats.bytes_fetched += self.length
+
+    def close(self):
+        self._session.close()
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+
+    def fetch(self, start: int, end: int) -> bytes:
+        """Fetches bytes [start, end) with a single range request (or from the spooled download)."""
+        if self._spool is not None:
+            with self._spool_lock:
+                self._spool.seek(start)
+                return self._spool.read(end - start)
+        for attempt in range(default_num_retries + 1):
+            try:
+                response = self._session.get(
+                    self.url,
+                    headers={'Range': f'bytes={start}-{end - 1}'},
+                    timeout=60
+                )
+                if response.status_code == 206:
+                    data = response.content
+                else:
+                    raise Exception(f'Error fetching {self.url}: {response.status_code} {response.reason}')
+                if len(data) != end - start:
+                    raise Exception(f'Unexpected number of bytes fetched from {self.url}: {len(data)} != {end - start}')
+                return data
+            except Exception:
+                if attempt == default_num_retries:
+                    raise
+                time.sleep(2 ** attempt)
+        raise Exception('Unexpected')
+
+
+class _BlockCache:
+    """LRU cache of file blocks bounded by a total byte budget."""
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._blocks: 'OrderedDict[Tuple[str, int], bytes]' = OrderedDict()
+        self._num_bytes = 0
+
+    def get(self, key: Tuple[str, int]) -> Union[bytes, None]:
+        block = self._blocks.get(key)
+        if block is not None:
+            self._blocks.move_to_end(key)
+        return block
+
+    def put(self, key: Tuple[str, int], block: bytes):
+        if key in self._blocks:
+            self._num_bytes -= len(self._blocks.pop(key))
+        self._blocks[key] = block
+        self._num_bytes += len(block)
+        while self._num_bytes > self.max_bytes and len(self._blocks) > 1:
+            _, evicted = self._blocks.popitem(last=False)
+            self._num_bytes -= len(evicted)
+
+    def clear(self):
+        self._blocks.clear()
+        self._num_bytes = 0
+
+    def remove_url(self, url: str):
+        for key in [key for key in self._blocks if key[0] == url]:
+            self._num_bytes -= len(self._blocks.pop(key))
+
+
+class _DiskBlockCache:
+    """Persistent tier of the block cache, keyed by URL, block size and block index."""
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _path(self, url: str, block_size: int, block_index: int) -> str:
+        h = hashlib.sha1(f'{url}|{block_size}'.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, h[:2], h, str(block_index))
+
+    def get(self, url: str, block_size: int, block_index: int) -> Union[bytes, None]:
+        path = self._path(url, block_size, block_index)
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, url: str, block_size: int, block_index: int, block: bytes):
+        path = self._path(url, block_size, block_index)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(block)
+        os.replace(tmp_path, path)
+
+
+class _RemoteFileManager:
+    def __init__(self):
+        self.block_size = default_block_size
+        self.max_readahead_blocks = default_max_readahead_blocks
+        self.max_sources = default_max_sources
+        self.max_spool_bytes = default_max_spool_bytes
+        self._lock = threading.Lock()
+        # LRU order, most recently opened last
+        self._sources: 'OrderedDict[str, _RemoteSource]' = OrderedDict()
+        self._released_stats = RemoteFileStats()
+        self._cache = _BlockCache(default_max_cache_bytes)
+        self._disk_cache: Union[_DiskBlockCache, None] = None
+
+    def configure(self, *, block_size, max_cache_bytes, max_readahead_blocks, disk_cache_dir, max_sources, max_spool_bytes):
+        with self._lock:
+            if block_size is not None and block_size != self.block_size:
+                self.block_size = block_size
+                self._cache.clear()
+            if max_cache_bytes is not None:
+                self._cache.max_bytes = max_cache_bytes
+            if max_readahead_blocks is not None:
+                self.max_readahead_blocks = max_readahead_blocks
+            if disk_cache_dir is not None:
+                self._disk_cache = _DiskBlockCache(disk_cache_dir)
+            if max_sources is not None:
+                self.max_sources = max_sources
+            if max_spool_bytes is not None:
+                self.max_spool_bytes = max_spool_bytes
+            self._evict_sources()
+
+    def open_source(self, url: str) -> _RemoteSource:
+        """Returns the source for a URL, counted as open until release_source is called."""
+        with self._lock:
+            source = self._sources.get(url)
+            if source is not None:
+                source.num_open += 1
+                self._sources.move_to_end(url)
+                return source
+        source = _RemoteSource(url)
+        if not source.supports_range:
+            with self._lock:
+                self._evict_sources(extra_spool_bytes=source.length)
+                spool_bytes = self._get_spool_bytes() + source.length
+            if spool_bytes > self.max_spool_bytes:
+                source.close()
+                raise Exception(
+                    f'The server ignores range requests for {url}, and a full download ({source.length} bytes) '
+                    f'would exceed the spool budget of {self.max_spool_bytes} bytes'
+                )
+            source.spool()
+        with self._lock:
+            existing = self._sources.get(url)
+            if existing is not None:
+                # opened concurrently by another thread
+                source.close()
+                source = existing
+            else:
+                self._sources[url] = source
+            source.num_open += 1
+            self._sources.move_to_end(url)
+            self._evict_sources()
+        return source
+
+    def release_source(self, source: _RemoteSource):
+        with self._lock:
+            source.num_open -= 1
+            self._evict_sources()
+
+    def close_sources(self, url: Union[str, None]):
+        with self._lock:
+            urls = [url] if url is not None else list(self._sources.keys())
+            for u in urls:
+                source = self._sources.get(u)
+                if source is not None and source.num_open == 0:
+                    self._remove_source(source)
+                    self._cache.remove_url(u)
+
+    def get_stats(self, url: Union[str, None]) -> dict:
+        with self._lock:
+            if url is not None:
+                source = self._sources.get(url)
+                return source.stats.to_dict() if source is not None else RemoteFileStats().to_dict()
+            total = RemoteFileStats()
+            total.add(self._released_stats)
+            for source in self._sources.values():
+                total.add(source.stats)
+            return total.to_dict()
+
+    def _get_spool_bytes(self) -> int:
+        return sum(source.length for source in self._sources.values() if source.is_spooled)
+
+    def _evict_sources(self, *, extra_spool_bytes: int = 0):
+        # Called with the lock held. Releases the least recently opened
+        # sources that have no open files, while there are more than
+        # max_sources or the spooled downloads exceed max_spool_bytes.
+        # Their blocks stay in the block cache, which has its own budget.
+        num_sources = len(self._sources)
+        spool_bytes = self._get_spool_bytes() + extra_spool_bytes
+        for source in list(self._sources.values()):
+            if num_sources <= self.max_sources and spool_bytes <= self.max_spool_bytes:
+                break
+            if source.num_open > 0:
+                continue
+            if source.is_spooled:
+                spool_bytes -= source.length
+            num_sources -= 1
+            self._remove_source(source)
+
+    def _remove_source(self, source: _RemoteSource):
+        del self._sources[source.url]
+        self._released_stats.add(source.stats)
+        source.close()
+
+    def read_blocks(self, source: _RemoteSource, first_block: int, last_block: int, readahead_blocks: int) -> List[bytes]:
+        block_size = self.block_size
+        num_blocks = (source.length + block_size - 1) // block_size
+        blocks: Dict[int, bytes] = {}
+        with self._lock:
+            for i in range(first_block, last_block + 1):
+                block = self._cache.get((source.url, i))
+                if block is not None:
+                    blocks[i] = block
+                    source.stats.block_cache_hits += 1
+                else:
+                    source.stats.block_cache_misses += 1
+        missing = [i for i in range(first_block, last_block + 1) if i not in blocks]
+        if self._disk_cache is not None:
+            for i in missing:
+                block = self._disk_cache.get(source.url, block_size, i)
+                if block is not None:
+                    blocks[i] = block
+                    with self._lock:
+                        source.stats.disk_cache_hits += 1
+                        self._cache.put((source.url, i), block)
+            missing = [i for i in missing if i not in blocks]
+        if missing and missing[-1] == last_block:
+            # we need to go to the network anyway, so extend the request with read-ahead blocks
+            with self._lock:
+                for i in range(last_block + 1, min(last_block + 1 + readahead_blocks, num_blocks)):
+                    if self._cache.get((source.url, i)) is not None:
+                        break
+                    missing.append(i)
+        for run_start, run_end in _get_contiguous_runs(missing):
+            start = run_start * block_size
+            end = min(run_end * block_size, source.length)
+            data = source.fetch(start, end)
+            if not source.is_spooled:
+                with self._lock:
+                    source.stats.request_count += 1
+                    source.stats.bytes_fetched += len(data)
+            for i in range(run_start, run_end):
+                block = data[(i - run_start) * block_size:(i - run_start + 1) * block_size]
+                if i <= last_block:
+                    blocks[i] = block
+                with self._lock:
+                    self._cache.put((source.url, i), block)
+                if self._disk_cache is not None:
+                    self._disk_cache.put(source.url, block_size, i, block)
+        return [blocks[i] for i in range(first_block, last_block + 1)]
+
+
+def _get_contiguous_runs(block_indices: List[int]) -> List[Tuple[int, int]]:
+    """Groups sorted block indices into [start, end) runs of adjacent blocks."""
+    runs: List[Tuple[int, int]] = []
+    for i in block_indices:
+        if runs and runs[-1][1] == i:
+            runs[-1] = (runs[-1][0], i + 1)
+        else:
+            runs.append((i, i + 1))
+    return runs
+
+
+_manager = _RemoteFileManager()
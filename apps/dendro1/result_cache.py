@@ -0,0 +1,257 @@
+from typing import Union, List, Callable
+import os
+import json
+import time
+import fcntl
+import shutil
+import hashlib
+import threading
+from contextlib import contextmanager
+import requests
+
+
+# Opt-in local cache of processor outputs. It is enabled by setting
+# DENDRO1_RESULT_CACHE_DIR to a directory (which may be shared by jobs on the
+# same machine). Entries are keyed on the processor name and version, the
+# identity of the inputs (see get_input_id) and the parameters, and are
+# evicted least recently used first when the total size exceeds
+# DENDRO1_RESULT_CACHE_MAX_BYTES.
+#
+# <directory>/entries/<key[:2]>/<key>    the cached output file (mtime = last use)
+# <directory>/stats.json                 cumulative hits, misses, puts and evictions
+# <directory>/stats.json.lock            serializes updates of stats.json across processes
+
+result_cache_dir_env_var = 'DENDRO1_RESULT_CACHE_DIR'
+result_cache_max_bytes_env_var = 'DENDRO1_RESULT_CACHE_MAX_BYTES'
+default_max_bytes = 10 * 1024 * 1024 * 1024
+
+
+class ResultCache:
+    """Content-addressed, size-bounded LRU cache of output files in a local directory."""
+    def __init__(self, directory: str, *, max_bytes: int = default_max_bytes):
+        """
+        Args:
+            directory (str): The cache directory, created if needed.
+            max_bytes (int): Maximum total size of the cached outputs.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(directory, 'entries'), exist_ok=True)
+
+    def get(self, key: str, output_fname: str) -> bool:
+        """Copies the cached output for a key to output_fname. Returns False on a miss."""
+        path = self._path(key)
+        try:
+            shutil.copyfile(path, output_fname)
+        except FileNotFoundError:
+            self._add_stats(misses=1)
+            return False
+        try:
+            # mark as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self._add_stats(hits=1)
+        return True
+
+    def put(self, key: str, fname: str):
+        """Stores a copy of fname as the output for a key, then evicts entries beyond max_bytes."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        shutil.copyfile(fname, tmp_path)
+        os.replace(tmp_path, path)
+        self._add_stats(puts=1)
+        self._evict(keep=path)
+
+    def get_stats(self) -> dict:
+        """Returns the cumulative hits, misses, puts and evictions, and the current number and size of entries."""
+        stats = self._read_stats()
+        entries = self._list_entries()
+        stats['num_entries'] = len(entries)
+        stats['num_bytes'] = sum(size for _, _, size in entries)
+        return stats
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, 'entries', key[:2], key)
+
+    def _list_entries(self):
+        # (mtime, path, size) of each entry
+        entries = []
+        entries_dir = os.path.join(self.directory, 'entries')
+        for subdir in os.listdir(entries_dir):
+            for name in os.listdir(os.path.join(entries_dir, subdir)):
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(entries_dir, subdir, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, path, st.st_size))
+        return entries
+
+    def _evict(self, *, keep: str):
+        entries = sorted(self._list_entries())
+        num_bytes = sum(size for _, _, size in entries)
+        num_evictions = 0
+        for _, path, size in entries:
+            if num_bytes <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            num_bytes -= size
+            num_evictions += 1
+        if num_evictions > 0:
+            self._add_stats(evictions=num_evictions)
+
+    def _read_stats(self) -> dict:
+        stats = {'hits': 0, 'misses': 0, 'puts': 0, 'evictions': 0}
+        try:
+            with open(os.path.join(self.directory, 'stats.json'), 'r') as f:
+                stats.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+        return stats
+
+    def _add_stats(self, **counts):
+        with self._stats_lock():
+            stats = self._read_stats()
+            for k, v in counts.items():
+                stats[k] += v
+            path = os.path.join(self.directory, 'stats.json')
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(stats, f)
+            os.replace(tmp_path, path)
+
+    @contextmanager
+    def _stats_lock(self):
+        # an exclusive lock on a separate file, so that concurrent jobs
+        # sharing the cache directory don't lose each other's updates
+        with open(os.path.join(self.directory, 'stats.json.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def get_result_cache() -> Union[ResultCache, None]:
+    """Returns the result cache configured by DENDRO1_RESULT_CACHE_DIR, or None if it is not set."""
+    directory = os.environ.get(result_cache_dir_env_var)
+    if not directory:
+        return None
+    max_bytes = int(os.environ.get(result_cache_max_bytes_env_var, default_max_bytes))
+    return ResultCache(directory, max_bytes=max_bytes)
+
+
+def get_result_cache_key(
+    *,
+    processor_name: str,
+    processor_version: str,
+    input_ids: List[str],
+    parameters: dict
+) -> str:
+    """Returns the cache key of a processor run.
+
+    Args:
+        processor_name (str): The processor name.
+        processor_version (str): Version of the processor's output; bump it when the output changes.
+        input_ids (List[str]): Identity of each input, see get_input_id.
+        parameters (dict): The parameters that affect the output (JSON serializable).
+
+    Returns:
+        str: The sha1 hex digest of the above.
+    """
+    x = {
+        'processor_name': processor_name,
+        'processor_version': processor_version,
+        'input_ids': input_ids,
+        'parameters': parameters
+    }
+    return hashlib.sha1(json.dumps(x, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def get_input_id(url_or_path: str) -> Union[str, None]:
+    """Returns an identity for the content of an input file, or None if it can't be determined cheaply.
+
+    For a URL this uses the headers reported by the server (with an
+    aborted GET request rather than a HEAD request, as in remote_file): the
+    ETag and length, or if there is no ETag, the URL with the length and
+    Last-Modified. If there is neither, the input is not cacheable. For a
+    local path it is the sha1 of the content.
+    """
+    if url_or_path.startswith('http://') or url_or_path.startswith('https://'):
+        response = requests.get(url_or_path, stream=True, timeout=60)
+        try:
+            if response.status_code != 200:
+                raise Exception(f'Error getting input: {response.status_code} {response.reason}')
+            content_length = response.headers.get('Content-Length')
+            etag = response.headers.get('ETag')
+            if etag:
+                return f'etag:{etag}:{content_length}'
+            last_modified = response.headers.get('Last-Modified')
+            if last_modified:
+                return f'url:{url_or_path}:{content_length}:{last_modified}'
+            return None
+        finally:
+            response.close()
+    h = hashlib.sha1()
+    with open(url_or_path, 'rb') as f:
+        while True:
+            chunk = f.read(1024 * 1024)
+            if not chunk:
+                break
+            h.update(chunk)
+    return f'sha1:{h.hexdigest()}'
+
+
+def create_output_with_result_cache(
+    *,
+    output_fname: str,
+    create_output: Callable[[], None],
+    processor_name: str,
+    processor_version: str,
+    get_input_urls: Callable[[], List[str]],
+    parameters: dict
+):
+    """Writes output_fname from the result cache if possible, otherwise with create_output (and caches the result).
+
+    If the result cache is not enabled, or the identity of an input can't be
+    determined, this just calls create_output.
+
+    Args:
+        output_fname (str): The output file.
+        create_output (Callable[[], None]): Creates output_fname.
+        processor_name (str): The processor name.
+        processor_version (str): Version of the processor's output.
+        get_input_urls (Callable[[], List[str]]): Returns the URLs (or local paths) of the inputs. Only called if the cache is enabled.
+        parameters (dict): The parameters that affect the output.
+    """
+    cache = get_result_cache()
+    if cache is None:
+        create_output()
+        return
+    timer = time.time()
+    input_ids = [get_input_id(url) for url in get_input_urls()]
+    if any(input_id is None for input_id in input_ids):
+        print(f'Not using the result cache for {processor_name}: the identity of an input could not be determined')
+        create_output()
+        return
+    key = get_result_cache_key(
+        processor_name=processor_name,
+        processor_version=processor_version,
+        input_ids=input_ids,
+        parameters=parameters
+    )
+    if cache.get(key, output_fname):
+        print(f'Result cache hit for {processor_name} ({time.time() - timer:.2f} sec): {cache.get_stats()}')
+        return
+    create_output()
+    cache.put(key, output_fname)
+    print(f'Result cache miss for {processor_name}: {cache.get_stats()}')
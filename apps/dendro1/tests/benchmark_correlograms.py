@@ -0,0 +1,67 @@
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from units_vis.compute_correlograms_data import compute_correlogram_data_from_spike_trains  # noqa: E402
+from legacy_correlograms import legacy_correlogram_bin_counts  # noqa: E402
+
+
+# Times the autocorrelogram of one unit with 1e3 to 1e7 spikes, with the
+# baseline offset loop, the vectorized engine and the numba kernel. The
+# baseline loops once per offset up to the burst depth, so it is timed both
+# with short bursts and with long bursts of closely spaced spikes.
+
+
+sampling_frequency = 30000
+
+
+def main():
+    try:
+        import numba  # noqa: F401
+        has_numba = True
+    except ImportError:
+        has_numba = False
+    print(f'{"burst":>6}{"spikes":>10}{"baseline (sec)":>16}{"numpy (sec)":>14}{"numba (sec)":>14}{"match":>8}')
+    for burst_length in [5, 30]:
+        for num_spikes in [1_000, 10_000, 100_000, 1_000_000, 10_000_000]:
+            _run(num_spikes=num_spikes, burst_length=burst_length, has_numba=has_numba)
+
+
+def _run(*, num_spikes: int, burst_length: int, has_numba: bool):
+    times = _bursty_spike_train(num_spikes, burst_length=burst_length)
+    kwargs = dict(sampling_frequency=sampling_frequency, window_size_msec=50, bin_size_msec=1)
+    if has_numba:
+        # compile outside of the timing
+        compute_correlogram_data_from_spike_trains(times1=times[:100], use_numba=True, **kwargs)
+    timer = time.time()
+    counts = compute_correlogram_data_from_spike_trains(times1=times, **kwargs)['bin_counts']
+    numpy_elapsed = time.time() - timer
+    numba_elapsed = np.nan
+    match = True
+    if has_numba:
+        timer = time.time()
+        numba_counts = compute_correlogram_data_from_spike_trains(times1=times, use_numba=True, **kwargs)['bin_counts']
+        numba_elapsed = time.time() - timer
+        match = match and np.array_equal(counts, numba_counts)
+    timer = time.time()
+    legacy_counts = legacy_correlogram_bin_counts(times1=times, **kwargs)
+    legacy_elapsed = time.time() - timer
+    match = match and np.array_equal(counts, legacy_counts)
+    print(f'{burst_length:>6}{num_spikes:>10}{legacy_elapsed:>16.3f}{numpy_elapsed:>14.3f}{numba_elapsed:>14.3f}{str(match):>8}')
+
+
+def _bursty_spike_train(num_spikes: int, *, burst_length: int) -> np.ndarray:
+    # half of the spikes in bursts of burst_length spikes 1-5 ms apart, at 20 Hz on average
+    rng = np.random.default_rng(0)
+    duration_frames = int(num_spikes / 20 * sampling_frequency)
+    isolated = rng.integers(0, duration_frames, size=num_spikes // 2)
+    burst_starts = rng.integers(0, duration_frames, size=num_spikes // (2 * burst_length))
+    offsets = np.cumsum(rng.integers(30, 150, size=(len(burst_starts), burst_length)), axis=1)
+    return np.sort(np.concatenate([isolated, (burst_starts[:, None] + offsets).ravel()])).astype(np.int64)
+
+
+if __name__ == '__main__':
+    main()
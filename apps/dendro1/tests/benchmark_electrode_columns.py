@@ -0,0 +1,114 @@
+import os
+import sys
+import time
+import tempfile
+import h5py
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testing', 'range-http-server'))
+
+from range_http_server import start_range_http_server  # noqa: E402
+from remote_file import open_remote_file  # noqa: E402
+from quip.NwbRecording import _read_electrode_properties  # noqa: E402
+
+
+# Compares reading the channel ids, locations and groups of an electrical
+# series with one read per column (quip NwbRecording) against the previous
+# per-channel loop, on a local file and over HTTP range requests. The
+# electrical series uses all electrodes in order, because the previous loop
+# indexed the locations twice and only gave the right result in that case.
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        server, base_url = start_range_http_server(tmpdir)
+        try:
+            print(f'{"channels":>9}{"source":>8}{"previous (sec)":>16}{"requests":>10}{"columns (sec)":>15}{"requests":>10}{"match":>7}')
+            for num_channels in [64, 384, 1024]:
+                # separate copies so that the two readers don't share the block cache
+                for fname in ['legacy.nwb', 'new.nwb']:
+                    _create_electrodes_file(os.path.join(tmpdir, f'{num_channels}_{fname}'), num_channels=num_channels)
+                for source in ['local', 'http']:
+                    results = []
+                    for fname, read in [('legacy.nwb', _legacy_read_electrode_properties), ('new.nwb', _read_electrode_properties)]:
+                        if source == 'local':
+                            file = open(os.path.join(tmpdir, f'{num_channels}_{fname}'), 'rb')
+                        else:
+                            file = open_remote_file(f'{base_url}/{num_channels}_{fname}')
+                        request_count_before = server.request_count
+                        with file, h5py.File(file, 'r') as h5_file:
+                            timer = time.time()
+                            electrode_indices = h5_file['/acquisition/ElectricalSeries/electrodes'][:]
+                            properties = read(h5_file['/general/extracellular_ephys/electrodes'], electrode_indices)
+                            elapsed = time.time() - timer
+                        results.append((properties, elapsed, server.request_count - request_count_before))
+                    (legacy, legacy_elapsed, legacy_requests), (new, new_elapsed, new_requests) = results
+                    print(
+                        f'{num_channels:>9}{source:>8}{legacy_elapsed:>16.3f}{legacy_requests:>10}'
+                        f'{new_elapsed:>15.3f}{new_requests:>10}{str(_properties_match(legacy, new)):>7}'
+                    )
+        finally:
+            server.shutdown()
+
+
+def _create_electrodes_file(path: str, *, num_channels: int):
+    rng = np.random.default_rng(0)
+    with h5py.File(path, 'w') as f:
+        electrodes = f.create_group('general/extracellular_ephys/electrodes')
+        electrodes.create_dataset('id', data=np.arange(num_channels, dtype=np.int64))
+        for column in ['x', 'y', 'z', 'rel_x', 'rel_y']:
+            electrodes.create_dataset(column, data=rng.uniform(0, 1000, size=num_channels))
+        electrodes.create_dataset('group_name', data=np.array([f'shank{i // 64}'.encode() for i in range(num_channels)]))
+        electrical_series = f.create_group('acquisition/ElectricalSeries')
+        electrical_series.create_dataset('electrodes', data=np.arange(num_channels, dtype=np.int64))
+
+
+def _legacy_read_electrode_properties(electrodes_table: h5py.Group, electrode_indices: np.ndarray):
+    # the previous code of NwbRecording.__init__
+    channel_ids = [electrodes_table['id'][i] for i in electrode_indices]
+    if 'rel_x' in electrodes_table:
+        channel_loc_x = [electrodes_table['rel_x'][i] for i in electrode_indices]
+        channel_loc_y = [electrodes_table['rel_y'][i] for i in electrode_indices]
+        if 'rel_z' in electrodes_table:
+            channel_loc_z = [electrodes_table['rel_z'][i] for i in electrode_indices]
+        else:
+            channel_loc_z = None
+    elif 'x' in electrodes_table:
+        channel_loc_x = [electrodes_table['x'][i] for i in electrode_indices]
+        channel_loc_y = [electrodes_table['y'][i] for i in electrode_indices]
+        if 'z' in electrodes_table:
+            channel_loc_z = [electrodes_table['z'][i] for i in electrode_indices]
+        else:
+            channel_loc_z = None
+    else:
+        channel_loc_x = None
+        channel_loc_y = None
+        channel_loc_z = None
+    locations = None
+    if channel_loc_x is not None:
+        ndim = 2 if channel_loc_z is None else 3
+        locations = np.zeros((len(electrode_indices), ndim), dtype=float)
+        for i, electrode_index in enumerate(electrode_indices):
+            locations[i, 0] = channel_loc_x[electrode_index]
+            locations[i, 1] = channel_loc_y[electrode_index]
+            if channel_loc_z is not None:
+                locations[i, 2] = channel_loc_z[electrode_index]
+    unique_electrode_group_names = None
+    groups = None
+    if "group_name" in electrodes_table:
+        unique_electrode_group_names = list(np.unique(electrodes_table["group_name"][:]))
+        groups = []
+        for electrode_index in electrode_indices:
+            group_name = electrodes_table["group_name"][electrode_index]
+            group_id = unique_electrode_group_names.index(group_name)
+            groups.append(group_id)
+    return channel_ids, locations, unique_electrode_group_names, groups
+
+
+def _properties_match(a, b) -> bool:
+    return all(np.array_equal(x, y) for x, y in zip(a, b))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+import os
+import sys
+import time
+import tempfile
+import h5py
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from h5_to_nh5 import h5_to_nh5  # noqa: E402
+from nh5_reader import Nh5File  # noqa: E402
+
+
+# Compares opening an nh5 file with Nh5File and slicing a large dataset with
+# the same operations through h5py on the original h5 file
+
+
+def main():
+    num_rows = 2_000_000
+    num_cols = 64
+    num_slices = 200
+    slice_rows = 1000
+    with tempfile.TemporaryDirectory() as tmpdir:
+        h5_path = os.path.join(tmpdir, 'data.h5')
+        nh5_path = os.path.join(tmpdir, 'data.nh5')
+        with h5py.File(h5_path, 'w') as f:
+            f.create_dataset('traces', data=np.random.default_rng(0).standard_normal((num_rows, num_cols), dtype=np.float32))
+            for i in range(100):
+                f.create_dataset(f'meta/item{i}', data=np.arange(10, dtype=np.int32))
+        h5_to_nh5(h5_path, nh5_path)
+        starts = np.random.default_rng(1).integers(0, num_rows - slice_rows, size=num_slices)
+
+        timer = time.time()
+        with h5py.File(h5_path, 'r') as f:
+            open_h5 = time.time() - timer
+            h5_slices = [f['traces'][s:s + slice_rows] for s in starts]
+        h5_elapsed = time.time() - timer
+
+        timer = time.time()
+        with Nh5File(nh5_path) as f:
+            open_nh5 = time.time() - timer
+            traces = f['/traces']
+            nh5_slices = [np.array(traces[s:s + slice_rows]) for s in starts]
+        nh5_elapsed = time.time() - timer
+
+    print(f'{num_rows} x {num_cols} float32, {num_slices} slices of {slice_rows} rows')
+    print(f'h5py: open {open_h5 * 1000:.2f} ms, total {h5_elapsed * 1000:.1f} ms')
+    print(f'Nh5File: open {open_nh5 * 1000:.2f} ms, total {nh5_elapsed * 1000:.1f} ms')
+    print(f'Outputs match: {all(np.array_equal(a, b) for a, b in zip(h5_slices, nh5_slices))}')
+
+
+if __name__ == '__main__':
+    main()
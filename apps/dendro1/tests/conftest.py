@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the app modules are imported as top-level modules, as in /app in the container
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
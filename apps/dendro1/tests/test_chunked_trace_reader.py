@@ -0,0 +1,164 @@
+import gc
+import threading
+import weakref
+import h5py
+import numpy as np
+import pytest
+
+import chunked_trace_reader
+from chunked_trace_reader import ChunkedTraceReader
+
+
+num_frames = 10_007
+num_channels = 24
+
+
+class _CountingDataset:
+    # records the selections read from an h5py dataset
+    def __init__(self, dataset: h5py.Dataset):
+        self._dataset = dataset
+        self.shape = dataset.shape
+        self.dtype = dataset.dtype
+        self.chunks = dataset.chunks
+        self.reads = []
+
+    def __getitem__(self, key):
+        self.reads.append(key)
+        return self._dataset[key]
+
+
+@pytest.fixture(params=[(1000, num_channels), (1000, 8), None], ids=['chunked', 'channel_chunked', 'contiguous'])
+def dataset(request, tmp_path, monkeypatch):
+    # small blocks so that a test spans many of them
+    monkeypatch.setattr(chunked_trace_reader, 'default_min_block_bytes', 10_000)
+    data = np.random.default_rng(0).integers(-1000, 1000, size=(num_frames, num_channels)).astype(np.int16)
+    f = h5py.File(str(tmp_path / 'traces.h5'), 'w')
+    f.create_dataset('traces', data=data, chunks=request.param)
+    yield f['traces']
+    f.close()
+
+
+def _windows():
+    yield 0, num_frames
+    yield 0, 1000
+    yield 999, 1001
+    yield 1000, 3000
+    yield 1234, 5678
+    yield num_frames - 7, num_frames + 100
+    yield -50, 10
+
+
+@pytest.mark.parametrize('channel_indices', [None, slice(None), slice(3, 20, 2), [0], [23, 1, 9, 9, 8], np.array([16, 17, -1])])
+def test_matches_h5py(dataset, channel_indices):
+    reader = ChunkedTraceReader(dataset)
+    data = dataset[:]
+    for start_frame, end_frame in _windows():
+        expected = data[max(0, start_frame):min(num_frames, end_frame)]
+        if channel_indices is not None:
+            expected = expected[:, channel_indices]
+        traces = reader.get_traces(start_frame, end_frame, channel_indices)
+        assert traces.dtype == data.dtype
+        np.testing.assert_array_equal(traces, expected)
+    reader.close()
+
+
+def test_empty_and_out_of_range_windows(dataset):
+    with ChunkedTraceReader(dataset) as reader:
+        assert reader.get_traces(100, 100).shape == (0, num_channels)
+        assert reader.get_traces(200, 100, [1, 2]).shape == (0, 2)
+        assert reader.get_traces(num_frames, num_frames + 10).shape == (0, num_channels)
+        assert reader.get_traces(-10, 0, slice(0, 5)).shape == (0, 5)
+        with pytest.raises(IndexError):
+            reader.get_traces(0, 10, [num_channels])
+
+
+def test_returned_traces_are_copies(dataset):
+    with ChunkedTraceReader(dataset) as reader:
+        reader.get_traces(0, 10)[:] = 0
+        np.testing.assert_array_equal(reader.get_traces(0, 10), dataset[0:10])
+
+
+def test_channel_chunks_are_read_separately(tmp_path):
+    with h5py.File(str(tmp_path / 'traces.h5'), 'w') as f:
+        f.create_dataset('traces', data=np.zeros((4000, 64), dtype=np.float32), chunks=(1000, 16))
+        dataset = _CountingDataset(f['traces'])
+        with ChunkedTraceReader(dataset, prefetch=False) as reader:
+            assert reader.block_channels == 16
+            reader.get_traces(0, 4000, [20])
+            assert all(key[1] == slice(16, 32) for key in dataset.reads)
+
+
+def test_cache_is_bounded(dataset):
+    block_frames = ChunkedTraceReader(dataset).block_frames
+    with ChunkedTraceReader(dataset, max_cache_bytes=3 * block_frames * num_channels * 2, prefetch=False) as reader:
+        reader.get_traces(0, num_frames)
+        assert reader._cache_bytes <= reader._max_cache_bytes
+        assert reader._cache_bytes == sum(block.nbytes for block in reader._cache.values())
+        # the most recently used blocks are kept
+        last_block = (num_frames - 1) // block_frames
+        assert [key[0] for key in reader._cache.keys()][-1] == last_block
+
+
+def test_cache_avoids_rereads(tmp_path):
+    with h5py.File(str(tmp_path / 'traces.h5'), 'w') as f:
+        f.create_dataset('traces', data=np.zeros((10_000, 4), dtype=np.int16), chunks=(1000, 4))
+        dataset = _CountingDataset(f['traces'])
+        with ChunkedTraceReader(dataset, prefetch=False) as reader:
+            for start_frame in range(0, 10_000, 100):
+                reader.get_traces(start_frame, start_frame + 100)
+            num_reads = len(dataset.reads)
+            assert num_reads == -(-10_000 // reader.block_frames)
+            reader.get_traces(0, 10_000)
+            assert len(dataset.reads) == num_reads
+
+
+def test_sequential_access_prefetches_the_next_block(dataset):
+    with ChunkedTraceReader(dataset) as reader:
+        block_frames = reader.block_frames
+        reader.get_traces(0, 10)
+        # the first request is not known to be sequential
+        assert len(reader._pending) == 0
+        reader.get_traces(10, 20)
+        pending = dict(reader._pending)
+        assert len(pending) > 0
+        assert all(key[0] == 1 for key in pending.keys())
+        for future in pending.values():
+            future.result()
+        assert all(key in reader._cache for key in pending.keys())
+        np.testing.assert_array_equal(reader.get_traces(block_frames, block_frames + 10), dataset[block_frames:block_frames + 10])
+
+
+def test_random_access_does_not_prefetch(dataset):
+    with ChunkedTraceReader(dataset) as reader:
+        reader.get_traces(0, 10)
+        reader.get_traces(num_frames - 10, num_frames)
+        assert reader._executor is None
+
+
+def test_close_stops_the_prefetch_thread(dataset):
+    num_threads = threading.active_count()
+    reader = ChunkedTraceReader(dataset)
+    reader.get_traces(0, 10)
+    reader.get_traces(10, 20)
+    assert reader._executor is not None
+    reader.close()
+    assert reader._executor is None
+    # still readable, without read-ahead
+    np.testing.assert_array_equal(reader.get_traces(20, 30), dataset[20:30])
+    assert reader._executor is None
+    for thread in threading.enumerate():
+        if thread is not threading.current_thread() and thread.name.startswith('ThreadPoolExecutor'):
+            thread.join(timeout=5)
+    assert threading.active_count() <= num_threads
+
+
+def test_dropped_reader_is_collected(dataset):
+    reader = ChunkedTraceReader(dataset)
+    reader.get_traces(0, 10)
+    reader.get_traces(10, 20)
+    for future in list(reader._pending.values()):
+        future.result()
+    reader_ref = weakref.ref(reader)
+    del reader
+    gc.collect()
+    assert reader_ref() is None
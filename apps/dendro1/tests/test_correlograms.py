@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+from units_vis.compute_correlograms_data import (
+    compute_correlogram_data_from_spike_trains,
+    compute_autocorrelograms,
+    compute_correlogram_matrix,
+)
+from legacy_correlograms import legacy_correlogram_bin_counts
+
+
+sampling_frequency = 30000
+correlogram_params = [(50, 1), (20, 0.5), (100, 3), (11, 2)]
+
+
+def _random_spike_train(rng, *, num_spikes: int, duration_sec: float, bursty: bool) -> np.ndarray:
+    times = rng.integers(0, int(duration_sec * sampling_frequency), size=num_spikes)
+    if bursty:
+        # add bursts of spikes a few ms apart, so that many pairs fall in the window
+        starts = rng.choice(times, size=num_spikes // 10)
+        offsets = np.cumsum(rng.integers(30, 150, size=(len(starts), 5)), axis=1)
+        times = np.concatenate([times, (starts[:, None] + offsets).ravel()])
+    return np.sort(times).astype(np.int64)
+
+
+def _spike_trains(seed: int, *, bursty: bool):
+    rng = np.random.default_rng(seed)
+    times1 = _random_spike_train(rng, num_spikes=2000, duration_sec=30, bursty=bursty)
+    times2 = _random_spike_train(rng, num_spikes=1500, duration_sec=30, bursty=bursty)
+    # the baseline ordered spikes at the same frame in different units
+    # arbitrarily (np.argsort is not stable), so such ties are left out
+    times2 = times2[~np.isin(times2, times1)]
+    return times1, times2
+
+
+@pytest.mark.parametrize("bursty", [False, True])
+@pytest.mark.parametrize("window_size_msec,bin_size_msec", correlogram_params)
+def test_autocorrelogram_matches_baseline(bursty, window_size_msec, bin_size_msec):
+    times1, _ = _spike_trains(0, bursty=bursty)
+    expected = legacy_correlogram_bin_counts(
+        times1=times1,
+        sampling_frequency=sampling_frequency,
+        window_size_msec=window_size_msec,
+        bin_size_msec=bin_size_msec,
+    )
+    a = compute_correlogram_data_from_spike_trains(
+        times1=times1,
+        sampling_frequency=sampling_frequency,
+        window_size_msec=window_size_msec,
+        bin_size_msec=bin_size_msec,
+    )
+    np.testing.assert_array_equal(a["bin_counts"], expected)
+
+
+@pytest.mark.parametrize("bursty", [False, True])
+@pytest.mark.parametrize("window_size_msec,bin_size_msec", correlogram_params)
+def test_cross_correlogram_matches_baseline(bursty, window_size_msec, bin_size_msec):
+    times1, times2 = _spike_trains(1, bursty=bursty)
+    expected = legacy_correlogram_bin_counts(
+        times1=times1,
+        times2=times2,
+        sampling_frequency=sampling_frequency,
+        window_size_msec=window_size_msec,
+        bin_size_msec=bin_size_msec,
+    )
+    a = compute_correlogram_data_from_spike_trains(
+        times1=times1,
+        times2=times2,
+        sampling_frequency=sampling_frequency,
+        window_size_msec=window_size_msec,
+        bin_size_msec=bin_size_msec,
+    )
+    np.testing.assert_array_equal(a["bin_counts"], expected)
+
+
+@pytest.mark.parametrize("cross", [False, True])
+def test_numba_kernel_matches_baseline(cross):
+    pytest.importorskip("numba")
+    times1, times2 = _spike_trains(2, bursty=True)
+    if not cross:
+        times2 = None
+    expected = legacy_correlogram_bin_counts(
+        times1=times1, times2=times2, sampling_frequency=sampling_frequency, window_size_msec=50, bin_size_msec=1
+    )
+    a = compute_correlogram_data_from_spike_trains(
+        times1=times1,
+        times2=times2,
+        sampling_frequency=sampling_frequency,
+        window_size_msec=50,
+        bin_size_msec=1,
+        use_numba=True,
+    )
+    np.testing.assert_array_equal(a["bin_counts"], expected)
+
+
+def test_autocorrelograms_and_matrix_match_baseline():
+    rng = np.random.default_rng(3)
+    spike_trains = [
+        _random_spike_train(rng, num_spikes=n, duration_sec=20, bursty=True) for n in [0, 1, 500, 1200]
+    ]
+    # keep the trains free of cross-unit ties, see _spike_trains
+    for i in range(1, len(spike_trains)):
+        spike_trains[i] = spike_trains[i][~np.isin(spike_trains[i], np.concatenate(spike_trains[:i]))]
+    kwargs = dict(sampling_frequency=sampling_frequency, window_size_msec=50, bin_size_msec=1)
+    auto_serial = compute_autocorrelograms(spike_trains=spike_trains, num_workers=1, **kwargs)
+    auto_parallel = compute_autocorrelograms(spike_trains=spike_trains, num_workers=2, **kwargs)
+    matrix = compute_correlogram_matrix(spike_trains=spike_trains, **kwargs)
+    np.testing.assert_array_equal(auto_serial["bin_counts"], auto_parallel["bin_counts"])
+    for i, times1 in enumerate(spike_trains):
+        expected = legacy_correlogram_bin_counts(times1=times1, **kwargs)
+        np.testing.assert_array_equal(auto_serial["bin_counts"][i], expected)
+        np.testing.assert_array_equal(matrix["bin_counts"][i, i], expected)
+        for j, times2 in enumerate(spike_trains):
+            if i != j:
+                expected = legacy_correlogram_bin_counts(times1=times1, times2=times2, **kwargs)
+                np.testing.assert_array_equal(matrix["bin_counts"][i, j], expected)
@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+import h5py
+import numpy as np
+import pytest
+
+pytest.importorskip('pydantic')
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testing', 'dandi-nwb-meta'))
+
+from dandi_nwb_meta import _crawl_h5_metadata, _dtype_to_str  # noqa: E402
+
+
+def _legacy_crawl_h5_metadata(h5_file: h5py.File) -> dict:
+    # the previous _get_h5_groups, _get_h5_datasets and _attrs_to_json
+    def _attrs(obj) -> dict:
+        attrs_dict = {}
+        for attr_name in obj.attrs:
+            value = obj.attrs[attr_name]
+            if isinstance(value, np.ndarray):
+                value = value.tolist()
+            elif isinstance(value, np.int64):
+                value = int(value)
+            elif isinstance(value, h5py.Reference):
+                value = str(value)
+            try:
+                json.dumps(value)
+            except TypeError:
+                value = "Not JSON serializable"
+            attrs_dict[attr_name] = value
+        return json.loads(json.dumps(attrs_dict))
+
+    groups = []
+    datasets = []
+
+    def _process_node(node: h5py.Group):
+        groups.append(node)
+        for child in node.values():
+            if isinstance(child, h5py.Group):
+                _process_node(child)
+
+    def _process_node_datasets(node: h5py.Group):
+        for child in node.values():
+            if isinstance(child, h5py.Dataset):
+                datasets.append(child)
+            elif isinstance(child, h5py.Group):
+                _process_node_datasets(child)
+
+    _process_node(h5_file)
+    _process_node_datasets(h5_file)
+    return {
+        'groups': [{'path': g.name, 'attrs': _attrs(g)} for g in groups],
+        'datasets': [
+            {'path': d.name, 'attrs': _attrs(d), 'shape': [int(dim) for dim in d.shape], 'dtype': _dtype_to_str(d)}
+            for d in datasets
+        ]
+    }
+
+
+@pytest.fixture
+def h5_file(tmp_path):
+    with h5py.File(str(tmp_path / 'test.nwb'), 'w') as f:
+        f.attrs['nwb_version'] = '2.6.0'
+        devices = f.create_group('general/devices')
+        devices.create_group('probe').attrs['description'] = 'a probe'
+        electrodes = f.create_group('general/extracellular_ephys/shank0')
+        electrodes.attrs['neurodata_type'] = 'ElectrodeGroup'
+        # an NWB ElectrodeGroup links to its device
+        electrodes['device'] = h5py.SoftLink('/general/devices/probe')
+        data = f.create_dataset('acquisition/es/data', data=np.zeros((10, 4), dtype=np.int16))
+        data.attrs['conversion'] = np.float64(0.195)
+        data.attrs['ids'] = np.arange(3)
+        data.attrs['ref'] = f['general'].ref
+        f.create_dataset('acquisition/es/empty', shape=(0,), dtype=np.float32)
+        f.create_dataset('strings', data=np.array([b'a', b'bc']))
+        # a second hard link to the same dataset
+        f['processing/ecephys/data'] = data
+        f['processing/ecephys/dangling'] = h5py.SoftLink('/does/not/exist')
+    with h5py.File(str(tmp_path / 'test.nwb'), 'r') as f:
+        yield f
+
+
+def test_matches_legacy_crawl(h5_file):
+    expected = _legacy_crawl_h5_metadata(h5_file)
+    metadata = _crawl_h5_metadata(h5_file)
+    result = {
+        'groups': [g.dict() for g in metadata.groups],
+        'datasets': [d.dict() for d in metadata.datasets],
+    }
+    assert result == expected
+    group_paths = [g['path'] for g in result['groups']]
+    dataset_paths = [d['path'] for d in result['datasets']]
+    # the soft-linked device and both hard links are listed
+    assert '/general/extracellular_ephys/shank0/device' in group_paths
+    assert '/general/devices/probe' in group_paths
+    assert '/acquisition/es/data' in dataset_paths
+    assert '/processing/ecephys/data' in dataset_paths
+    assert not any(p.endswith('dangling') for p in group_paths + dataset_paths)
@@ -0,0 +1,59 @@
+import gc
+import weakref
+import pytest
+
+from nwb_object_index import get_nwb_object_index, get_nwb_object
+
+
+class _Container:
+    # the parent/child structure of hdmf containers
+    def __init__(self, name: str, parent=None):
+        self.name = name
+        self.parent = parent
+        self.children = {}
+        if parent is not None:
+            parent.children[name] = self
+
+    def __getitem__(self, name: str):
+        return self.children[name]
+
+
+class _NWBFile(_Container):
+    def __init__(self):
+        super().__init__('root')
+        self.processing = _Container('processing', self)
+        self.units = _Container('units', self)
+
+
+def test_objects_are_cached():
+    nwbfile = _NWBFile()
+    units = _Container('units', _Container('ecephys', nwbfile.processing))
+    assert get_nwb_object(nwbfile, 'processing/ecephys/units') is units
+    assert get_nwb_object(nwbfile, '/units/') is nwbfile.units
+    assert get_nwb_object_index(nwbfile) is get_nwb_object_index(nwbfile)
+    assert get_nwb_object_index(nwbfile) is not get_nwb_object_index(_NWBFile())
+
+
+def test_index_does_not_keep_the_file_alive():
+    nwbfile = _NWBFile()
+    _Container('units', _Container('ecephys', nwbfile.processing))
+    get_nwb_object(nwbfile, 'processing/ecephys/units')
+    nwbfile_ref = weakref.ref(nwbfile)
+    del nwbfile
+    gc.collect()
+    assert nwbfile_ref() is None
+
+
+def test_index_does_not_keep_a_pynwb_file_alive():
+    pynwb = pytest.importorskip('pynwb')
+    from datetime import datetime, timezone
+    nwbfile = pynwb.NWBFile(
+        session_description='test', identifier='test', session_start_time=datetime.now(timezone.utc)
+    )
+    module = nwbfile.create_processing_module('ecephys', 'test')
+    assert get_nwb_object(nwbfile, 'processing/ecephys') is module
+    get_nwb_object_index(nwbfile).get_electrical_series_by_name()
+    nwbfile_ref = weakref.ref(nwbfile)
+    del nwbfile, module
+    gc.collect()
+    assert nwbfile_ref() is None
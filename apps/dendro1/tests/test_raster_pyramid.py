@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from units_vis.raster_pyramid import RasterPyramid
+
+
+def _random_spikes(seed: int, *, num_units: int = 6, duration_sec: float = 50):
+    rng = np.random.default_rng(seed)
+    spike_trains = []
+    for i in range(num_units):
+        st = np.sort(rng.uniform(0, duration_sec, size=int(rng.integers(0, 5000))))
+        if i == 1:
+            # a burst of spikes in one bin
+            st = np.sort(np.concatenate([st, np.full(500, 12.3456)]))
+        spike_trains.append(st)
+    spike_times_sec = np.concatenate(spike_trains)
+    unit_indices = np.repeat(np.arange(num_units), [len(st) for st in spike_trains])
+    return spike_times_sec, unit_indices
+
+
+def _direct_binning(spike_times_sec, unit_indices, *, start_time_sec, bin_size_sec, num_bins):
+    bin_indices = np.clip(np.floor((spike_times_sec - start_time_sec) / bin_size_sec).astype(np.int64), 0, num_bins - 1)
+    keys, counts = np.unique(unit_indices.astype(np.int64) * num_bins + bin_indices, return_counts=True)
+    return keys // num_bins, keys % num_bins, counts
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+def test_levels_match_direct_binning(seed):
+    spike_times_sec, unit_indices = _random_spikes(seed)
+    end_time_sec = float(np.max(spike_times_sec))
+    pyramid = RasterPyramid(
+        spike_times_sec=spike_times_sec,
+        unit_indices=unit_indices,
+        start_time_sec=0,
+        end_time_sec=end_time_sec,
+        finest_bin_size_sec=0.01,
+        factor=4,
+    )
+    assert pyramid.levels[-1].bin_indices.tolist() == [0] * pyramid.levels[-1].num_points
+    num_bins = int(np.floor(end_time_sec / 0.01)) + 1
+    for i, level in enumerate(pyramid.levels):
+        assert level.bin_size_sec == pytest.approx(0.01 * 4 ** i)
+        assert int(np.sum(level.counts)) == len(spike_times_sec)
+        # the coarse bins group whole fine bins, factor at a time
+        fine_bin_indices = np.clip(np.floor(spike_times_sec / 0.01).astype(np.int64), 0, num_bins - 1)
+        expected = _direct_binning(
+            (fine_bin_indices // 4 ** i).astype(np.float64), unit_indices, start_time_sec=0, bin_size_sec=1, num_bins=num_bins
+        )
+        np.testing.assert_array_equal(level.unit_indices, expected[0])
+        np.testing.assert_array_equal(level.bin_indices, expected[1])
+        np.testing.assert_array_equal(level.counts, expected[2])
+
+
+def test_finest_level_matches_direct_binning_of_times():
+    spike_times_sec, unit_indices = _random_spikes(2)
+    pyramid = RasterPyramid(
+        spike_times_sec=spike_times_sec, unit_indices=unit_indices, start_time_sec=0, end_time_sec=50, finest_bin_size_sec=0.5
+    )
+    expected = _direct_binning(spike_times_sec, unit_indices, start_time_sec=0, bin_size_sec=0.5, num_bins=101)
+    level = pyramid.levels[0]
+    np.testing.assert_array_equal(level.unit_indices, expected[0])
+    np.testing.assert_array_equal(level.bin_indices, expected[1])
+    np.testing.assert_array_equal(level.counts, expected[2])
+
+
+@pytest.mark.parametrize('max_points_per_bin', [1, 8])
+def test_get_level_respects_max_num_points(max_points_per_bin):
+    spike_times_sec, unit_indices = _random_spikes(3)
+    pyramid = RasterPyramid(spike_times_sec=spike_times_sec, unit_indices=unit_indices, start_time_sec=0, end_time_sec=50)
+    num_plot_points = [level.get_num_plot_points(max_points_per_bin=max_points_per_bin) for level in pyramid.levels]
+    for max_num_points in [1, 10, 100, 1000, 10_000, 100_000]:
+        level = pyramid.get_level(max_num_points=max_num_points, max_points_per_bin=max_points_per_bin)
+        i = pyramid.levels.index(level)
+        if num_plot_points[i] > max_num_points:
+            # nothing fits, so the coarsest level
+            assert level is pyramid.levels[-1]
+        else:
+            # the finest level that fits
+            assert all(n > max_num_points for n in num_plot_points[:i])
+        times_sec, _ = level.get_plot_points(start_time_sec=0, max_points_per_bin=max_points_per_bin)
+        assert len(times_sec) == num_plot_points[i]
+
+
+def test_plot_points_follow_the_counts():
+    spike_times_sec, unit_indices = _random_spikes(4)
+    pyramid = RasterPyramid(spike_times_sec=spike_times_sec, unit_indices=unit_indices, start_time_sec=0, end_time_sec=50)
+    level = pyramid.levels[3]
+    times_sec, point_unit_indices = level.get_plot_points(start_time_sec=0, max_points_per_bin=8)
+    assert np.all(np.diff(point_unit_indices) >= 0)
+    for u in range(6):
+        assert np.all(np.diff(times_sec[point_unit_indices == u]) > 0)
+    # each point lies in its bin, and each bin has min(count, 8) points
+    point_bins = np.floor(times_sec / level.bin_size_sec).astype(np.int64)
+    keys, num_points = np.unique(point_unit_indices * 10 ** 9 + point_bins, return_counts=True)
+    np.testing.assert_array_equal(keys, level.unit_indices * 10 ** 9 + level.bin_indices)
+    np.testing.assert_array_equal(num_points, np.minimum(level.counts, 8))
+    # the burst bin is drawn denser than a bin with a single spike
+    assert np.max(num_points) == 8 and np.min(num_points) == 1
@@ -0,0 +1,143 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+import remote_file
+from remote_file import open_remote_file, configure_remote_files, close_remote_files, get_remote_file_stats
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testing', 'range-http-server'))
+
+from range_http_server import start_range_http_server  # noqa: E402
+
+
+file_size = 1_000_003
+
+
+@pytest.fixture(autouse=True)
+def manager(monkeypatch):
+    # a fresh process-wide state for each test
+    manager = remote_file._RemoteFileManager()
+    monkeypatch.setattr(remote_file, '_manager', manager)
+    configure_remote_files(block_size=64 * 1024, max_readahead_blocks=4)
+    return manager
+
+
+@pytest.fixture
+def server(tmp_path):
+    rng = np.random.default_rng(0)
+    for fname in ['a.bin', 'b.bin', 'c.bin']:
+        (tmp_path / fname).write_bytes(rng.integers(0, 256, size=file_size, dtype=np.uint8).tobytes())
+    (tmp_path / 'empty.bin').write_bytes(b'')
+    server, base_url = start_range_http_server(str(tmp_path))
+    server.base_url = base_url
+    server.directory = tmp_path
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _check_random_reads(f, content: bytes):
+    rng = np.random.default_rng(1)
+    for _ in range(50):
+        start = int(rng.integers(0, len(content)))
+        size = int(rng.integers(1, 300_000))
+        f.seek(start)
+        assert f.read(size) == content[start:start + size]
+
+
+def test_range_requests(server):
+    content = (server.directory / 'a.bin').read_bytes()
+    url = f'{server.base_url}/a.bin'
+    with open_remote_file(url) as f:
+        assert f.length == file_size
+        _check_random_reads(f, content)
+    stats = get_remote_file_stats(url)
+    assert stats['request_count'] > 1
+    assert stats['bytes_fetched'] <= 2 * file_size
+
+    # a second open of the same url is served from the block cache
+    num_requests = server.request_count
+    with open_remote_file(url) as f:
+        _check_random_reads(f, content)
+    assert server.request_count == num_requests
+
+
+def test_empty_file(server):
+    with open_remote_file(f'{server.base_url}/empty.bin') as f:
+        assert f.length == 0
+        assert f.read() == b''
+
+
+def test_ignored_range_is_downloaded_once(server):
+    server.ignore_range = True
+    content = (server.directory / 'a.bin').read_bytes()
+    url = f'{server.base_url}/a.bin'
+    with open_remote_file(url) as f:
+        _check_random_reads(f, content)
+    # the length probe and one full download
+    assert server.request_count == 2
+    stats = get_remote_file_stats(url)
+    assert stats['request_count'] == 1
+    assert stats['bytes_fetched'] == file_size
+
+
+def test_ignored_range_over_spool_budget(server):
+    server.ignore_range = True
+    configure_remote_files(max_spool_bytes=file_size - 1)
+    with pytest.raises(Exception, match='spool budget'):
+        open_remote_file(f'{server.base_url}/a.bin')
+
+
+def test_spool_budget_evicts_closed_sources(server, manager):
+    server.ignore_range = True
+    configure_remote_files(max_spool_bytes=2 * file_size)
+    f_a = open_remote_file(f'{server.base_url}/a.bin')
+    with open_remote_file(f'{server.base_url}/b.bin'):
+        pass
+    # b.bin is closed, so its download is released to make room for c.bin
+    with open_remote_file(f'{server.base_url}/c.bin') as f_c:
+        assert f_c.read(10) == (server.directory / 'c.bin').read_bytes()[:10]
+        assert sorted(manager._sources.keys()) == [f'{server.base_url}/a.bin', f'{server.base_url}/c.bin']
+        # a.bin and c.bin are both open
+        with pytest.raises(Exception, match='spool budget'):
+            open_remote_file(f'{server.base_url}/b.bin')
+    f_a.close()
+
+
+def test_short_read_is_retried(server, monkeypatch):
+    monkeypatch.setattr(remote_file.time, 'sleep', lambda sec: None)
+    content = (server.directory / 'a.bin').read_bytes()
+    with open_remote_file(f'{server.base_url}/a.bin') as f:
+        server.num_short_responses = 2
+        f.seek(1000)
+        assert f.read(100_000) == content[1000:101_000]
+    assert server.num_short_responses == 0
+
+
+def test_short_reads_exhaust_retries(server, monkeypatch):
+    monkeypatch.setattr(remote_file.time, 'sleep', lambda sec: None)
+    with open_remote_file(f'{server.base_url}/a.bin') as f:
+        server.num_short_responses = remote_file.default_num_retries + 1
+        with pytest.raises(Exception):
+            f.read(100_000)
+
+
+def test_sources_are_evicted(server, manager):
+    configure_remote_files(max_sources=1)
+    urls = [f'{server.base_url}/{fname}' for fname in ['a.bin', 'b.bin', 'c.bin']]
+    files = [open_remote_file(url) for url in urls]
+    for f in files:
+        f.read(10)
+    # open files keep their sources
+    assert len(manager._sources) == 3
+    for f in files:
+        f.close()
+    assert list(manager._sources.keys()) == [urls[2]]
+    # the totals include the released sources
+    assert get_remote_file_stats()['request_count'] == 3
+
+    # the blocks of the evicted sources stay cached, those of closed urls are dropped
+    close_remote_files()
+    assert len(manager._sources) == 0
+    assert sorted(url for url, _ in manager._cache._blocks.keys()) == urls[:2]
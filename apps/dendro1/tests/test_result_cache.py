@@ -0,0 +1,136 @@
+import os
+import sys
+import multiprocessing
+import pytest
+
+import result_cache
+from result_cache import ResultCache, create_output_with_result_cache, get_input_id
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testing', 'range-http-server'))
+
+from range_http_server import start_range_http_server  # noqa: E402
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    directory = str(tmp_path / 'cache')
+    monkeypatch.setenv(result_cache.result_cache_dir_env_var, directory)
+    return directory
+
+
+def _create_output_fn(output_fname: str, calls: list):
+    def create_output():
+        calls.append(1)
+        with open(output_fname, 'w') as f:
+            f.write('output')
+    return create_output
+
+
+def _failing_get_input_urls():
+    raise Exception('Cannot get url for local_file in InputFile')
+
+
+def test_disabled_cache_does_not_get_input_urls(tmp_path, monkeypatch):
+    monkeypatch.delenv(result_cache.result_cache_dir_env_var, raising=False)
+    output_fname = str(tmp_path / 'output.txt')
+    calls = []
+    create_output_with_result_cache(
+        output_fname=output_fname,
+        create_output=_create_output_fn(output_fname, calls),
+        processor_name='p',
+        processor_version='1',
+        get_input_urls=_failing_get_input_urls,
+        parameters={}
+    )
+    assert calls == [1]
+
+
+def test_local_input_hit_and_miss(tmp_path, cache_dir):
+    input_path = tmp_path / 'input.bin'
+    input_path.write_bytes(b'abc')
+    output_fname = str(tmp_path / 'output.txt')
+    calls = []
+    kwargs = dict(
+        output_fname=output_fname,
+        create_output=_create_output_fn(output_fname, calls),
+        processor_name='p',
+        processor_version='1',
+        get_input_urls=lambda: [str(input_path)],
+    )
+    create_output_with_result_cache(parameters={'a': 1}, **kwargs)
+    os.remove(output_fname)
+    create_output_with_result_cache(parameters={'a': 1}, **kwargs)
+    assert calls == [1]
+    with open(output_fname) as f:
+        assert f.read() == 'output'
+    create_output_with_result_cache(parameters={'a': 2}, **kwargs)
+    # a different input content is a different key
+    input_path.write_bytes(b'abd')
+    create_output_with_result_cache(parameters={'a': 1}, **kwargs)
+    assert calls == [1, 1, 1]
+    stats = ResultCache(cache_dir).get_stats()
+    assert (stats['hits'], stats['misses'], stats['puts'], stats['num_entries']) == (1, 3, 3, 3)
+
+
+def test_url_input_without_etag(tmp_path):
+    # the test server sends Last-Modified but no ETag, and the input id must
+    # not require downloading the file
+    (tmp_path / 'input.bin').write_bytes(os.urandom(1_000_000))
+    server, base_url = start_range_http_server(str(tmp_path))
+    try:
+        input_id = get_input_id(f'{base_url}/input.bin')
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert input_id.startswith(f'url:{base_url}/input.bin:1000000:')
+
+
+def _add_stats_many_times(directory: str, n: int):
+    cache = ResultCache(directory)
+    for _ in range(n):
+        cache._add_stats(hits=1)
+
+
+def test_stats_across_processes(tmp_path):
+    directory = str(tmp_path / 'cache')
+    ResultCache(directory)
+    processes = [multiprocessing.Process(target=_add_stats_many_times, args=(directory, 200)) for _ in range(4)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join()
+    assert ResultCache(directory).get_stats()['hits'] == 800
+
+
+def test_tuning_curves_2d_local_input_without_cache(tmp_path, monkeypatch):
+    sdk = pytest.importorskip('dendro.sdk')
+    from tuning_curves_2d import tuning_curves_2d
+
+    monkeypatch.delenv(result_cache.result_cache_dir_env_var, raising=False)
+    monkeypatch.chdir(tmp_path)
+    input_path = tmp_path / 'input.nwb'
+    input_path.write_bytes(b'')
+
+    def create_tuning_curves_2d_nh5(input_file, output_nh5_fname, **kwargs):
+        with open(output_nh5_fname, 'w') as f:
+            f.write('output')
+
+    class Output:
+        def upload(self, fname):
+            uploaded.append(fname)
+
+    uploaded = []
+    monkeypatch.setattr(tuning_curves_2d, '_create_tuning_curves_2d_nh5', create_tuning_curves_2d_nh5)
+    context = tuning_curves_2d.TuningCurves2DContext.construct(
+        input=sdk.InputFile(local_file_name=str(input_path)),
+        output=Output(),
+        spatial_series_path='processing/behavior/Position/SpatialSeries',
+        units_path='units',
+        num_bins=10,
+        num_bins_list=[],
+        smoothing_widths=[],
+        compute_metrics=False,
+        metrics_block_duration=60.0,
+    )
+    tuning_curves_2d.TuningCurves2DProcessor.run(context)
+    assert uploaded == ['output.nh5']
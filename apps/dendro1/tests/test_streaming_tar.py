@@ -0,0 +1,156 @@
+import io
+import os
+import sys
+import tarfile
+import pytest
+
+from folder_io.streaming_tar import write_tar_from_sources, extract_tar_stream, iter_url_chunks, streamed_member_mtime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'testing', 'range-http-server'))
+
+from range_http_server import start_range_http_server  # noqa: E402
+
+
+@pytest.fixture
+def input_folder(tmp_path):
+    folder = tmp_path / 'input'
+    (folder / 'sub').mkdir(parents=True)
+    (folder / 'a.txt').write_bytes(b'hello')
+    (folder / 'sub' / 'b.bin').write_bytes(os.urandom(300_000))
+    (folder / 'empty.txt').write_bytes(b'')
+    return folder
+
+
+def _sources(folder):
+    return [(name, str(folder / name)) for name in ['a.txt', 'empty.txt', 'sub/b.bin']]
+
+
+@pytest.fixture(params=[True, False], ids=['data_filter', 'manual_checks'])
+def use_data_filter(request, monkeypatch):
+    if request.param:
+        if not hasattr(tarfile, 'data_filter'):
+            pytest.skip('tarfile has no extraction filters')
+    else:
+        monkeypatch.delattr(tarfile, 'data_filter', raising=False)
+    return request.param
+
+
+@pytest.mark.parametrize('compression', ['', 'gzip', 'zstd'])
+def test_round_trip(tmp_path, input_folder, compression):
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+    tar_fname = str(tmp_path / 'output.tar')
+    write_tar_from_sources(_sources(input_folder), tar_fname, compression=compression, num_workers=2)
+    output_folder = tmp_path / 'output'
+    extract_tar_stream(iter_url_chunks(tar_fname, chunk_size=1000), str(output_folder))
+    for name, source in _sources(input_folder):
+        assert (output_folder / name).read_bytes() == open(source, 'rb').read()
+
+
+def test_local_members_keep_mode_and_mtime(tmp_path, input_folder):
+    os.chmod(input_folder / 'a.txt', 0o600)
+    os.utime(input_folder / 'a.txt', (1_600_000_000, 1_600_000_000))
+    tar_fname = str(tmp_path / 'output.tar')
+    write_tar_from_sources(_sources(input_folder), tar_fname)
+    with tarfile.open(tar_fname) as tar:
+        info = tar.getmember('a.txt')
+    assert info.mode == 0o600
+    assert info.mtime == 1_600_000_000
+
+
+def test_streamed_tar_is_reproducible(tmp_path, input_folder):
+    server, base_url = start_range_http_server(str(input_folder))
+    try:
+        sources = [(name, f'{base_url}/{name}') for name, _ in _sources(input_folder)]
+        write_tar_from_sources(sources, str(tmp_path / 'output1.tar'), num_workers=3)
+        write_tar_from_sources(sources, str(tmp_path / 'output2.tar'), num_workers=1)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert (tmp_path / 'output1.tar').read_bytes() == (tmp_path / 'output2.tar').read_bytes()
+    umask = os.umask(0)
+    os.umask(umask)
+    with tarfile.open(str(tmp_path / 'output1.tar')) as tar:
+        for info in tar.getmembers():
+            assert info.mode == 0o666 & ~umask
+            assert info.mtime == streamed_member_mtime
+        assert tar.extractfile('sub/b.bin').read() == (input_folder / 'sub' / 'b.bin').read_bytes()
+
+
+def _tar_bytes(members) -> bytes:
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w') as tar:
+        for info, data in members:
+            if data is not None:
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+            else:
+                tar.addfile(info)
+    return buf.getvalue()
+
+
+def _symlink(name: str, target: str) -> tarfile.TarInfo:
+    info = tarfile.TarInfo(name)
+    info.type = tarfile.SYMTYPE
+    info.linkname = target
+    return info
+
+
+def _hardlink(name: str, target: str) -> tarfile.TarInfo:
+    info = tarfile.TarInfo(name)
+    info.type = tarfile.LNKTYPE
+    info.linkname = target
+    return info
+
+
+@pytest.mark.parametrize('members', [
+    [(tarfile.TarInfo('../evil.txt'), b'evil')],
+    [(tarfile.TarInfo('sub/../../evil.txt'), b'evil')],
+    [(tarfile.TarInfo('ABSOLUTE/evil.txt'), b'evil')],
+    [(_symlink('link', '../outside'), None)],
+    [(_symlink('link', '/etc'), None)],
+    [(_symlink('link', '.'), None), (_symlink('link2', 'link/..'), None)],
+    [(_hardlink('link', '../evil.txt'), None)],
+], ids=['dotdot', 'nested_dotdot', 'absolute', 'symlink_out', 'symlink_absolute', 'symlink_chain', 'hardlink_out'])
+def test_unsafe_members_are_not_extracted_outside(tmp_path, use_data_filter, members):
+    for info, _ in members:
+        info.name = info.name.replace('ABSOLUTE', str(tmp_path))
+    output_folder = tmp_path / 'output'
+    try:
+        extract_tar_stream(iter([_tar_bytes(members)]), str(output_folder))
+    except Exception:
+        # the data filter strips the leading / of absolute names instead of failing
+        pass
+    assert not (tmp_path / 'evil.txt').exists()
+    root = os.path.realpath(output_folder)
+    for dirpath, dirnames, filenames in os.walk(output_folder):
+        for name in dirnames + filenames:
+            path = os.path.realpath(os.path.join(dirpath, name))
+            assert os.path.commonpath([root, path]) == root
+
+
+def test_manual_checks_reject_unsafe_members(tmp_path, monkeypatch):
+    monkeypatch.delattr(tarfile, 'data_filter', raising=False)
+    for members in [
+        [(tarfile.TarInfo('../evil.txt'), b'evil')],
+        [(tarfile.TarInfo(f'{tmp_path}/evil.txt'), b'evil')],
+        [(_symlink('link', '../outside'), None)],
+        [(_hardlink('link', '/etc/passwd'), None)],
+        [(tarfile.TarInfo('fifo'), None)],
+    ]:
+        if members[0][0].name == 'fifo':
+            members[0][0].type = tarfile.FIFOTYPE
+        with pytest.raises(Exception, match='Refusing to extract'):
+            extract_tar_stream(iter([_tar_bytes(members)]), str(tmp_path / 'output'))
+
+
+def test_safe_links_are_extracted(tmp_path, use_data_filter):
+    output_folder = tmp_path / 'output'
+    tar = _tar_bytes([
+        (tarfile.TarInfo('sub/a.txt'), b'hello'),
+        (_symlink('sub/link', 'a.txt'), None),
+        (_hardlink('b.txt', 'sub/a.txt'), None),
+    ])
+    extract_tar_stream(iter([tar]), str(output_folder))
+    assert (output_folder / 'sub' / 'link').read_bytes() == b'hello'
+    assert (output_folder / 'b.txt').read_bytes() == b'hello'
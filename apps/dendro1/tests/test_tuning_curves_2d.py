@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from tuning_curves_2d.compute_tuning_curves_2d import (
+    compute_tuning_curves_2d,
+    compute_tuning_curves_2d_multiresolution,
+    TuningCurves2DAccumulator,
+)
+
+
+def _random_session(seed: int, *, num_units: int = 5, num_samples: int = 3000, positions_dtype=np.float64):
+    rng = np.random.default_rng(seed)
+    position_times = np.sort(rng.uniform(10, 110, size=num_samples))
+    # some duplicate timestamps
+    position_times[100:110] = position_times[100]
+    positions = np.stack([
+        np.cumsum(rng.normal(size=num_samples)),
+        np.cumsum(rng.normal(size=num_samples))
+    ], axis=1).astype(positions_dtype)
+    spike_trains = []
+    for _ in range(num_units):
+        st = rng.uniform(0, 120, size=int(rng.integers(0, 2000)))
+        # spikes exactly at sample times and halfway between samples
+        st = np.concatenate([
+            st,
+            position_times[rng.integers(0, num_samples, size=50)],
+            (position_times[:-1] + position_times[1:])[rng.integers(0, num_samples - 1, size=50)] / 2
+        ])
+        spike_trains.append(np.sort(st))
+    return spike_trains, position_times, positions
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+@pytest.mark.parametrize('num_bins', [5, 20])
+@pytest.mark.parametrize('positions_dtype', [np.float64, np.float32])
+def test_matches_pynapple(seed, num_bins, positions_dtype):
+    nap = pytest.importorskip('pynapple')
+    spike_trains, position_times, positions = _random_session(seed, positions_dtype=positions_dtype)
+
+    # as in the previous processor
+    expected_rate_maps, expected_bins = nap.compute_2d_tuning_curves(
+        nap.TsGroup({i: st for i, st in enumerate(spike_trains)}),
+        nap.TsdFrame(d=positions, t=position_times, columns=['x', 'y']),
+        num_bins,
+    )
+    rate_maps, x_bin_positions, y_bin_positions = compute_tuning_curves_2d(
+        spike_trains=spike_trains, position_times=position_times, positions=positions, num_bins=num_bins
+    )
+    for i in range(len(spike_trains)):
+        np.testing.assert_allclose(rate_maps[i], expected_rate_maps[i], rtol=1e-9, equal_nan=True)
+    np.testing.assert_allclose(x_bin_positions, expected_bins[0], rtol=1e-12)
+    np.testing.assert_allclose(y_bin_positions, expected_bins[1], rtol=1e-12)
+
+
+def test_multiresolution_matches_direct_binning():
+    spike_trains, position_times, positions = _random_session(3)
+    multi = compute_tuning_curves_2d_multiresolution(
+        spike_trains=spike_trains, position_times=position_times, positions=positions, num_bins_list=[40, 20, 10, 7]
+    )
+    for num_bins in [40, 20, 10, 7]:
+        rate_maps, x_bin_positions, y_bin_positions = compute_tuning_curves_2d(
+            spike_trains=spike_trains, position_times=position_times, positions=positions, num_bins=num_bins
+        )
+        np.testing.assert_allclose(multi[num_bins].rate_maps, rate_maps, rtol=1e-12, equal_nan=True)
+        np.testing.assert_allclose(multi[num_bins].x_bin_positions, x_bin_positions, rtol=1e-12)
+        np.testing.assert_allclose(multi[num_bins].y_bin_positions, y_bin_positions, rtol=1e-12)
+
+
+def test_accumulator_batches_and_split_halves():
+    spike_trains, position_times, positions = _random_session(4)
+    spike_times = np.concatenate(spike_trains)
+    unit_indices = np.repeat(np.arange(len(spike_trains)), [len(st) for st in spike_trains])
+    order = np.random.default_rng(0).permutation(len(spike_times))
+    accumulator = TuningCurves2DAccumulator(
+        position_times=position_times,
+        positions=positions,
+        num_bins_list=[10],
+        num_units=len(spike_trains),
+        split_block_duration=7
+    )
+    for batch in np.array_split(order, 5):
+        accumulator.add_spikes(spike_times[batch], unit_indices[batch])
+    tc = accumulator.get_tuning_curves()[10]
+    expected_rate_maps, _, _ = compute_tuning_curves_2d(
+        spike_trains=spike_trains, position_times=position_times, positions=positions, num_bins=10
+    )
+    np.testing.assert_allclose(tc.rate_maps, expected_rate_maps, rtol=1e-12, equal_nan=True)
+    even, odd = accumulator.get_split_tuning_curves()[10]
+    np.testing.assert_array_equal(even.spike_counts + odd.spike_counts, tc.spike_counts)
+    np.testing.assert_array_equal(even.occupancy + odd.occupancy, tc.occupancy)
+
+
+@pytest.mark.parametrize('position_times', [[5.0], [5.0, 5.0, 5.0]])
+def test_zero_duration_positions(position_times):
+    positions = np.zeros((len(position_times), 2))
+    with pytest.raises(ValueError, match='positive duration'):
+        compute_tuning_curves_2d(
+            spike_trains=[np.array([5.0])], position_times=np.array(position_times), positions=positions, num_bins=5
+        )
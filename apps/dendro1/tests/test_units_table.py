@@ -0,0 +1,111 @@
+import h5py
+import numpy as np
+import pytest
+
+from units_vis.units_data import load_units_data
+
+
+# ids that are neither contiguous nor sorted, so that an id can't be used as a row
+unit_ids = [12, 3, 40, 7, 25]
+sampling_frequency = 30000.0
+
+
+@pytest.fixture
+def units_file(tmp_path):
+    rng = np.random.default_rng(0)
+    spike_trains = [np.sort(rng.uniform(0, 100, size=n)) for n in [5, 0, 1000, 1, 37]]
+    with h5py.File(str(tmp_path / 'units.nwb'), 'w') as f:
+        es = f.create_group('acquisition/es')
+        es.attrs['neurodata_type'] = 'ElectricalSeries'
+        es.create_dataset('starting_time', data=0.0).attrs['rate'] = sampling_frequency
+        units = f.create_group('units')
+        units.attrs['colnames'] = np.array([
+            b'spike_times', b'quality', b'location', b'firing_rate', b'depth', b'waveform_mean', b'is_good'
+        ])
+        units.create_dataset('id', data=np.array(unit_ids, dtype=np.int64))
+        units.create_dataset('spike_times', data=np.concatenate(spike_trains))
+        units.create_dataset('spike_times_index', data=np.cumsum([len(st) for st in spike_trains]).astype(np.uint32))
+        units.create_dataset('quality', data=np.array([b'good', b'mua', b'good', b'noise', b'mua']))
+        units.create_dataset('location', data=['CA1', 'CA3', 'DG', 'CA1', 'CA3'], dtype=h5py.string_dtype())
+        units.create_dataset('firing_rate', data=np.array([0.05, 0, 10, 0.01, 0.37]))
+        units.create_dataset('depth', data=np.array([100, 200, 300, 400, 500], dtype=np.int16))
+        units.create_dataset('waveform_mean', data=np.zeros((5, 82, 4), dtype=np.float32))
+        units.create_dataset('is_good', data=np.array([True, False, True, False, False]))
+    with h5py.File(str(tmp_path / 'units.nwb'), 'r') as f:
+        yield f
+
+
+def test_load_units_data_matches_per_unit_reads(units_file):
+    units_data = load_units_data(units_file)
+    assert units_data.get_unit_ids() == unit_ids
+    assert units_data.get_sampling_frequency() == sampling_frequency
+    spike_times = units_file['units/spike_times']
+    index = units_file['units/spike_times_index'][()]
+    for row, unit_id in enumerate(unit_ids):
+        i1 = index[row - 1] if row > 0 else 0
+        expected = np.round(spike_times[i1:index[row]] * sampling_frequency).astype(np.int64)
+        np.testing.assert_array_equal(units_data.get_unit_spike_train(unit_id), expected)
+    assert units_data.get_num_spikes().tolist() == [5, 0, 1000, 1, 37]
+    assert units_data.get_unit_indices().tolist() == np.repeat(np.arange(5), [5, 0, 1000, 1, 37]).tolist()
+
+
+def test_load_units_data_with_timestamps(units_file, tmp_path):
+    with h5py.File(str(tmp_path / 'timestamps.nwb'), 'w') as f:
+        units_file.copy('units', f)
+        es = f.create_group('acquisition/es')
+        es.attrs['neurodata_type'] = np.bytes_(b'ElectricalSeries')
+        es.create_dataset('timestamps', data=np.arange(0, 101, 1 / 1000))
+        units_data = load_units_data(f)
+    assert units_data.get_sampling_frequency() == pytest.approx(1000)
+    spike_times = units_file['units/spike_times'][()]
+    np.testing.assert_array_equal(units_data.spike_frames, np.searchsorted(np.arange(0, 101, 1 / 1000), spike_times))
+
+
+def test_get_unit_rows():
+    pytest.importorskip('spikeinterface')
+    pytest.importorskip('sortingview')
+    from units_vis.create_units_vis import _get_unit_rows
+
+    ids = np.array(unit_ids)
+    assert _get_unit_rows(ids, [40, 12, 25]).tolist() == [2, 0, 4]
+    assert _get_unit_rows(ids, []).tolist() == []
+    with pytest.raises(ValueError):
+        _get_unit_rows(ids, [12, 13])
+    with pytest.raises(ValueError):
+        _get_unit_rows(np.array([], dtype=np.int64), [12])
+    assert _get_unit_rows(np.array(['b', 'a']), ['a', 'b']).tolist() == [1, 0]
+
+
+@pytest.mark.parametrize('requested_unit_ids', [unit_ids, [40, 7, 3, 25, 12], [25, 3]])
+def test_create_units_table(units_file, requested_unit_ids):
+    pytest.importorskip('spikeinterface')
+    pytest.importorskip('sortingview')
+    from units_vis.create_units_vis import create_units_table
+
+    view = create_units_table(unit_ids=requested_unit_ids, file=units_file)
+    columns = {c['key']: c for c in view.to_dict()['columns']}
+    # the 2D and boolean columns are skipped
+    assert list(columns.keys()) == ['spike_times', 'quality', 'location', 'firing_rate', 'depth']
+    assert columns['spike_times'] == {'key': 'spike_times', 'label': 'spike_times (count)', 'dtype': 'int'}
+    assert [columns[k]['dtype'] for k in ['quality', 'location', 'firing_rate', 'depth']] == ['string', 'string', 'float', 'int']
+
+    expected_by_id = {
+        12: {'spike_times': 5, 'quality': 'good', 'location': 'CA1', 'firing_rate': 0.05, 'depth': 100},
+        3: {'spike_times': 0, 'quality': 'mua', 'location': 'CA3', 'firing_rate': 0.0, 'depth': 200},
+        40: {'spike_times': 1000, 'quality': 'good', 'location': 'DG', 'firing_rate': 10.0, 'depth': 300},
+        7: {'spike_times': 1, 'quality': 'noise', 'location': 'CA1', 'firing_rate': 0.01, 'depth': 400},
+        25: {'spike_times': 37, 'quality': 'mua', 'location': 'CA3', 'firing_rate': 0.37, 'depth': 500},
+    }
+    rows = view.to_dict()['rows']
+    assert [row['unitId'] for row in rows] == requested_unit_ids
+    for row in rows:
+        values = dict(row['values'])
+        assert values.pop('unitId') == row['unitId']
+        expected = expected_by_id[row['unitId']]
+        assert values.keys() == expected.keys()
+        for key, value in expected.items():
+            if key == 'firing_rate':
+                assert values[key] == pytest.approx(value, rel=1e-6)
+            else:
+                assert values[key] == value
+                assert type(values[key]) is type(value)
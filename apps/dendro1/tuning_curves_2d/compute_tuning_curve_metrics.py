@@ -0,0 +1,60 @@
+import numpy as np
+from .compute_tuning_curves_2d import TuningCurves2D
+
+
+def compute_spatial_information(tc: TuningCurves2D) -> np.ndarray:
+    """Skaggs spatial information (bits per spike) of each unit.
+
+    I = sum_i p_i (r_i / r) log2(r_i / r), where p_i is the fraction of
+    time spent in bin i, r_i the rate in bin i and r the mean rate. Only
+    occupied bins are used.
+
+    Returns:
+        np.ndarray: (num_units,) spatial information, NaN for units without spikes.
+    """
+    p, rates = _get_occupancy_probabilities_and_rates(tc)
+    mean_rates = rates @ p
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratios = rates / mean_rates[:, None]
+        terms = np.where(ratios > 0, ratios * np.log2(ratios), 0)
+        info = terms @ p
+    info[~(mean_rates > 0)] = np.nan
+    return info
+
+
+def compute_sparsity(tc: TuningCurves2D) -> np.ndarray:
+    """Spatial sparsity of each unit, (sum_i p_i r_i)^2 / sum_i p_i r_i^2.
+
+    Returns:
+        np.ndarray: (num_units,) sparsity in (0, 1], NaN for units without spikes.
+    """
+    p, rates = _get_occupancy_probabilities_and_rates(tc)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sparsity = (rates @ p) ** 2 / ((rates ** 2) @ p)
+    return sparsity
+
+
+def compute_split_half_stability(tc_even: TuningCurves2D, tc_odd: TuningCurves2D) -> np.ndarray:
+    """Pearson correlation between the even-block and odd-block rate maps of each unit.
+
+    Only bins that were occupied in both halves are compared.
+
+    Returns:
+        np.ndarray: (num_units,) correlation coefficients, NaN where undefined.
+    """
+    mask = (tc_even.raw_occupancy > 0) & (tc_odd.raw_occupancy > 0)
+    a = tc_even.rate_maps[:, mask]
+    b = tc_odd.rate_maps[:, mask]
+    a = a - a.mean(axis=1, keepdims=True)
+    b = b - b.mean(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (a * b).sum(axis=1) / np.sqrt((a ** 2).sum(axis=1) * (b ** 2).sum(axis=1))
+
+
+def _get_occupancy_probabilities_and_rates(tc: TuningCurves2D):
+    # flattened over the occupied bins: (num_occupied_bins,) and (num_units, num_occupied_bins)
+    mask = tc.raw_occupancy > 0
+    occupancy = tc.occupancy[mask].astype(np.float64)
+    p = occupancy / occupancy.sum()
+    rates = tc.rate_maps[:, mask]
+    return p, rates
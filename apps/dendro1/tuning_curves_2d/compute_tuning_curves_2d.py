@@ -0,0 +1,413 @@
+from typing import List, Tuple, Dict, Union, Iterator
+import numpy as np
+
+
+default_max_spikes_per_chunk = 4 * 1024 * 1024
+
+
+class PositionBinning:
+    """The 2D position bins of a spatial series, computed once and shared by all units.
+
+    The bin edges, the bin of every position sample and the occupancy
+    histogram follow pynapple's compute_2d_tuning_curves: num_bins equal bins
+    spanning the range of each coordinate, with the last bin closed on the
+    right as in np.histogram2d.
+    """
+    def __init__(self, *, position_times: np.ndarray, positions: np.ndarray, num_bins: int):
+        """
+        Args:
+            position_times (np.ndarray): Sorted timestamps of the position samples, in seconds.
+            positions (np.ndarray): (num_samples, 2) array of x, y positions.
+            num_bins (int): Number of bins in each dimension.
+        """
+        # timestamps are rounded to nanoseconds, as pynapple does, so that
+        # spikes halfway between two samples are resolved the same way
+        position_times = np.around(np.asarray(position_times, dtype=np.float64), 9)
+        positions = np.asarray(positions)
+        if positions.ndim != 2 or positions.shape[1] != 2:
+            raise ValueError(f'Expected positions with shape (num_samples, 2), got {positions.shape}')
+        if len(position_times) != positions.shape[0]:
+            raise ValueError('Mismatch between number of position timestamps and position samples')
+        if len(position_times) == 0:
+            raise ValueError('No position samples')
+        self.num_bins = num_bins
+        self.position_times = position_times
+        self.t_start = float(position_times[0])
+        self.t_end = float(position_times[-1])
+        if self.t_end <= self.t_start:
+            raise ValueError('The position timestamps must span a positive duration')
+        # samples per second over the time support of the spatial series
+        self.sampling_rate = len(position_times) / (self.t_end - self.t_start)
+        self.x_edges = np.linspace(np.nanmin(positions[:, 0]), np.nanmax(positions[:, 0]), num_bins + 1)
+        self.y_edges = np.linspace(np.nanmin(positions[:, 1]), np.nanmax(positions[:, 1]), num_bins + 1)
+        # flat bin index (ix * num_bins + iy) of every sample, or -1 if it is outside the bins
+        self.sample_bins = _get_flat_bin_indices(positions[:, 0], positions[:, 1], self.x_edges, self.y_edges)
+        self.occupancy = np.bincount(
+            self.sample_bins[self.sample_bins >= 0], minlength=num_bins * num_bins
+        ).reshape(num_bins, num_bins)
+
+    def get_nearest_sample_indices(self, spike_times: np.ndarray) -> np.ndarray:
+        """Returns the index of the position sample closest in time to each spike.
+
+        Spikes outside [t_start, t_end] get -1. A spike exactly halfway
+        between two samples is assigned to the later one, as in pynapple's
+        value_from. The result does not depend on the binning, so it can be
+        shared by several binnings of the same spatial series.
+        """
+        spike_times = np.around(np.asarray(spike_times, dtype=np.float64), 9)
+        times = self.position_times
+        inds = np.full(spike_times.shape, -1, dtype=np.int64)
+        inside = (spike_times >= self.t_start) & (spike_times <= self.t_end)
+        t = spike_times[inside]
+        # first sample at or after the spike, and the last sample before it
+        right = np.searchsorted(times, t, side='left')
+        left = right - 1
+        use_left = (right > 0) & (times[right] - t > t - times[np.maximum(left, 0)])
+        # among samples with the same timestamp, the last one is used
+        right = np.searchsorted(times, times[right], side='right') - 1
+        inds[inside] = np.where(use_left, left, right)
+        return inds
+
+    def compute_spike_counts(self, sample_inds: np.ndarray, unit_indices: np.ndarray, num_units: int) -> np.ndarray:
+        """Counts the spikes of all units in every position bin with a single bincount.
+
+        Args:
+            sample_inds (np.ndarray): Nearest position sample of each spike, from get_nearest_sample_indices.
+            unit_indices (np.ndarray): Unit index (0..num_units-1) of each spike.
+            num_units (int): Number of units.
+
+        Returns:
+            np.ndarray: (num_units, num_bins, num_bins) spike counts.
+        """
+        num_bins = self.num_bins
+        spike_bins = np.full(sample_inds.shape, -1, dtype=np.int64)
+        valid = sample_inds >= 0
+        spike_bins[valid] = self.sample_bins[sample_inds[valid]]
+        valid = spike_bins >= 0
+        counts = np.bincount(
+            np.asarray(unit_indices, dtype=np.int64)[valid] * (num_bins * num_bins) + spike_bins[valid],
+            minlength=num_units * num_bins * num_bins
+        )
+        return counts.reshape(num_units, num_bins, num_bins)
+
+
+class TuningCurves2D:
+    """Spike counts and occupancy of all units over one 2D binning."""
+    def __init__(
+        self,
+        *,
+        spike_counts: np.ndarray,
+        occupancy: np.ndarray,
+        x_edges: np.ndarray,
+        y_edges: np.ndarray,
+        sampling_rate: float,
+        raw_occupancy: Union[np.ndarray, None] = None
+    ):
+        """
+        Args:
+            spike_counts (np.ndarray): (num_units, num_bins, num_bins) spike counts.
+            occupancy (np.ndarray): (num_bins, num_bins) number of position samples in each bin.
+            x_edges (np.ndarray): Bin edges along x.
+            y_edges (np.ndarray): Bin edges along y.
+            sampling_rate (float): Position samples per second.
+            raw_occupancy (np.ndarray, optional): Unsmoothed occupancy, used to mark unvisited bins.
+        """
+        self.spike_counts = spike_counts
+        self.occupancy = occupancy
+        self.x_edges = x_edges
+        self.y_edges = y_edges
+        self.sampling_rate = sampling_rate
+        self.raw_occupancy = raw_occupancy if raw_occupancy is not None else occupancy
+
+    @property
+    def num_bins(self) -> int:
+        return self.occupancy.shape[0]
+
+    @property
+    def x_bin_positions(self) -> np.ndarray:
+        return self.x_edges[:-1] + np.diff(self.x_edges) / 2
+
+    @property
+    def y_bin_positions(self) -> np.ndarray:
+        return self.y_edges[:-1] + np.diff(self.y_edges) / 2
+
+    @property
+    def rate_maps(self) -> np.ndarray:
+        """Firing rates (Hz), NaN where the bin was never occupied."""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rate_maps = self.spike_counts / self.occupancy * self.sampling_rate
+        rate_maps[:, self.raw_occupancy == 0] = np.nan
+        return rate_maps
+
+    def aggregated(self, factor: int) -> "TuningCurves2D":
+        """Returns the tuning curves on a binning that is coarser by an integer factor.
+
+        The bins are merged in factor x factor blocks, which gives the same
+        edges as binning from scratch with num_bins // factor bins.
+        """
+        n = self.num_bins
+        if n % factor != 0:
+            raise ValueError(f'Cannot aggregate {n} bins by a factor of {factor}')
+        m = n // factor
+        return TuningCurves2D(
+            spike_counts=self.spike_counts.reshape(-1, m, factor, m, factor).sum(axis=(2, 4)),
+            occupancy=self.occupancy.reshape(m, factor, m, factor).sum(axis=(1, 3)),
+            x_edges=np.linspace(self.x_edges[0], self.x_edges[-1], m + 1),
+            y_edges=np.linspace(self.y_edges[0], self.y_edges[-1], m + 1),
+            sampling_rate=self.sampling_rate
+        )
+
+    def smoothed(self, width: float) -> "TuningCurves2D":
+        """Returns the tuning curves with Gaussian smoothing of the spike counts and occupancy.
+
+        Counts and occupancy are smoothed separately, so the rate maps are
+        occupancy-weighted. Bins that were never occupied stay NaN.
+
+        Args:
+            width (float): Standard deviation of the Gaussian, in position units.
+        """
+        kx = _get_gaussian_matrix(self.x_bin_positions, width)
+        ky = _get_gaussian_matrix(self.y_bin_positions, width)
+        return TuningCurves2D(
+            spike_counts=np.einsum('ij,ujk,lk->uil', kx, self.spike_counts, ky),
+            occupancy=kx @ self.occupancy @ ky.T,
+            x_edges=self.x_edges,
+            y_edges=self.y_edges,
+            sampling_rate=self.sampling_rate,
+            raw_occupancy=self.raw_occupancy
+        )
+
+
+def compute_tuning_curves_2d(
+    *,
+    spike_trains: List[np.ndarray],
+    position_times: np.ndarray,
+    positions: np.ndarray,
+    num_bins: int
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Computes 2D tuning curves (rate maps) for a list of spike trains.
+
+    The result matches pynapple's compute_2d_tuning_curves, but the
+    positions are binned once and the spikes of all units are assigned to
+    bins in one vectorized pass.
+
+    Args:
+        spike_trains (List[np.ndarray]): Spike times of each unit, in seconds.
+        position_times (np.ndarray): Sorted timestamps of the position samples, in seconds.
+        positions (np.ndarray): (num_samples, 2) array of x, y positions.
+        num_bins (int): Number of bins in each dimension.
+
+    Returns:
+        tuple: The (num_units, num_bins, num_bins) rate maps and the x and y bin centers.
+    """
+    tc = compute_tuning_curves_2d_multiresolution(
+        spike_trains=spike_trains,
+        position_times=position_times,
+        positions=positions,
+        num_bins_list=[num_bins]
+    )[num_bins]
+    return tc.rate_maps, tc.x_bin_positions, tc.y_bin_positions
+
+
+def compute_tuning_curves_2d_multiresolution(
+    *,
+    spike_trains: List[np.ndarray],
+    position_times: np.ndarray,
+    positions: np.ndarray,
+    num_bins_list: List[int]
+) -> Dict[int, TuningCurves2D]:
+    """Computes 2D tuning curves at several resolutions in one pass over the spikes.
+
+    See TuningCurves2DAccumulator.
+
+    Args:
+        spike_trains (List[np.ndarray]): Spike times of each unit, in seconds.
+        position_times (np.ndarray): Sorted timestamps of the position samples, in seconds.
+        positions (np.ndarray): (num_samples, 2) array of x, y positions.
+        num_bins_list (List[int]): Numbers of bins (in each dimension) to compute.
+
+    Returns:
+        Dict[int, TuningCurves2D]: The tuning curves for each number of bins.
+    """
+    num_units = len(spike_trains)
+    accumulator = TuningCurves2DAccumulator(
+        position_times=position_times,
+        positions=positions,
+        num_bins_list=num_bins_list,
+        num_units=num_units
+    )
+    if num_units > 0:
+        accumulator.add_spikes(
+            np.concatenate([np.asarray(st, dtype=np.float64) for st in spike_trains]),
+            np.repeat(np.arange(num_units), [len(st) for st in spike_trains])
+        )
+    return accumulator.get_tuning_curves()
+
+
+class TuningCurves2DAccumulator:
+    """Accumulates the spike counts of all units at several resolutions, one batch of spikes at a time.
+
+    Each spike is matched to its nearest position sample once per batch. The
+    finest resolution is binned directly, and every resolution that divides
+    it is derived at the end by aggregating its histograms. The other
+    resolutions are binned from the per-sample bin indices, reusing the
+    spike to sample matching. Memory use depends on the batch size, not on
+    the total number of spikes.
+
+    If split_block_duration is given, the recording is divided into blocks
+    of that duration and the counts and occupancy of the even and odd blocks
+    are kept separately, for split-half comparisons.
+    """
+    def __init__(
+        self,
+        *,
+        position_times: np.ndarray,
+        positions: np.ndarray,
+        num_bins_list: List[int],
+        num_units: int,
+        split_block_duration: Union[float, None] = None
+    ):
+        """
+        Args:
+            position_times (np.ndarray): Sorted timestamps of the position samples, in seconds.
+            positions (np.ndarray): (num_samples, 2) array of x, y positions.
+            num_bins_list (List[int]): Numbers of bins (in each dimension) to compute.
+            num_units (int): Number of units.
+            split_block_duration (float, optional): Duration in seconds of the alternating even/odd blocks.
+        """
+        self._num_bins_list = sorted(set(num_bins_list), reverse=True)
+        self._num_units = num_units
+        # resolutions that are binned directly, finest first
+        self._binnings: List[PositionBinning] = []
+        for num_bins in self._num_bins_list:
+            if any(b.num_bins % num_bins == 0 for b in self._binnings):
+                continue
+            self._binnings.append(
+                PositionBinning(position_times=position_times, positions=positions, num_bins=num_bins)
+            )
+        # 0 for samples in even blocks, 1 for samples in odd blocks
+        self._sample_halves: Union[np.ndarray, None] = None
+        if split_block_duration is not None and len(self._binnings) > 0:
+            times = self._binnings[0].position_times
+            self._sample_halves = (np.floor((times - times[0]) / split_block_duration).astype(np.int64) % 2)
+        # with a split, the spikes of unit u in odd blocks are counted as unit num_units + u
+        num_labels = num_units * (2 if self._sample_halves is not None else 1)
+        self._spike_counts = [
+            np.zeros((num_labels, b.num_bins, b.num_bins), dtype=np.int64)
+            for b in self._binnings
+        ]
+
+    def add_spikes(self, spike_times: np.ndarray, unit_indices: np.ndarray):
+        """Adds a batch of spikes.
+
+        Args:
+            spike_times (np.ndarray): Spike times, in seconds. They do not need to be sorted.
+            unit_indices (np.ndarray): Unit index (0..num_units-1) of each spike.
+        """
+        if len(self._binnings) == 0 or len(spike_times) == 0:
+            return
+        sample_inds = self._binnings[0].get_nearest_sample_indices(spike_times)
+        labels = np.asarray(unit_indices, dtype=np.int64)
+        if self._sample_halves is not None:
+            # the block of a spike is the block of its position sample
+            labels = labels + self._num_units * self._sample_halves[sample_inds]
+        for binning, spike_counts in zip(self._binnings, self._spike_counts):
+            spike_counts += binning.compute_spike_counts(sample_inds, labels, spike_counts.shape[0])
+
+    def get_tuning_curves(self) -> Dict[int, TuningCurves2D]:
+        """Returns the tuning curves for each number of bins."""
+        n = self._num_units
+        return self._get_tuning_curves(
+            [
+                counts[:n] + counts[n:] if self._sample_halves is not None else counts
+                for counts in self._spike_counts
+            ],
+            [binning.occupancy for binning in self._binnings]
+        )
+
+    def get_split_tuning_curves(self) -> Dict[int, Tuple[TuningCurves2D, TuningCurves2D]]:
+        """Returns the tuning curves of the even and of the odd blocks for each number of bins."""
+        if self._sample_halves is None:
+            raise ValueError('split_block_duration was not given')
+        n = self._num_units
+        halves = [
+            self._get_tuning_curves(
+                [counts[h * n:(h + 1) * n] for counts in self._spike_counts],
+                [
+                    np.bincount(
+                        b.sample_bins[(b.sample_bins >= 0) & (self._sample_halves == h)],
+                        minlength=b.num_bins * b.num_bins
+                    ).reshape(b.num_bins, b.num_bins)
+                    for b in self._binnings
+                ]
+            )
+            for h in [0, 1]
+        ]
+        return {num_bins: (halves[0][num_bins], halves[1][num_bins]) for num_bins in self._num_bins_list}
+
+    def _get_tuning_curves(self, spike_counts: List[np.ndarray], occupancies: List[np.ndarray]) -> Dict[int, TuningCurves2D]:
+        binned = [
+            TuningCurves2D(
+                spike_counts=counts,
+                occupancy=occupancy,
+                x_edges=binning.x_edges,
+                y_edges=binning.y_edges,
+                sampling_rate=binning.sampling_rate
+            )
+            for binning, counts, occupancy in zip(self._binnings, spike_counts, occupancies)
+        ]
+        ret: Dict[int, TuningCurves2D] = {}
+        for num_bins in self._num_bins_list:
+            source = next(tc for tc in binned if tc.num_bins % num_bins == 0)
+            ret[num_bins] = source if source.num_bins == num_bins else source.aggregated(source.num_bins // num_bins)
+        return ret
+
+
+def iter_spike_time_chunks(
+    spike_times_data,
+    spike_times_index,
+    *,
+    max_spikes_per_chunk: int = default_max_spikes_per_chunk
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Reads a ragged spike_times column in bounded chunks.
+
+    Args:
+        spike_times_data: The flat spike_times dataset (e.g. an h5py.Dataset).
+        spike_times_index: The spike_times_index dataset, the end offset of each unit's spikes.
+        max_spikes_per_chunk (int): Maximum number of spikes to read at a time.
+
+    Yields:
+        tuple: The spike times of the chunk and the unit index of each spike.
+    """
+    ends = np.asarray(spike_times_index[:], dtype=np.int64)
+    num_spikes = int(ends[-1]) if len(ends) > 0 else 0
+    for start in range(0, num_spikes, max_spikes_per_chunk):
+        end = min(start + max_spikes_per_chunk, num_spikes)
+        spike_times = np.asarray(spike_times_data[start:end], dtype=np.float64)
+        unit_indices = np.searchsorted(ends, np.arange(start, end), side='right')
+        yield spike_times, unit_indices
+
+
+def _get_gaussian_matrix(bin_positions: np.ndarray, width: float) -> np.ndarray:
+    # unnormalized, since the same kernel is applied to the counts and the occupancy
+    d = bin_positions[:, None] - bin_positions[None, :]
+    return np.exp(-0.5 * (d / width) ** 2)
+
+
+def _get_flat_bin_indices(x: np.ndarray, y: np.ndarray, x_edges: np.ndarray, y_edges: np.ndarray) -> np.ndarray:
+    num_bins_x = len(x_edges) - 1
+    num_bins_y = len(y_edges) - 1
+    ix = _get_bin_indices(x, x_edges)
+    iy = _get_bin_indices(y, y_edges)
+    inds = np.full(ix.shape, -1, dtype=np.int64)
+    valid = (ix >= 0) & (ix < num_bins_x) & (iy >= 0) & (iy < num_bins_y)
+    inds[valid] = ix[valid] * num_bins_y + iy[valid]
+    return inds
+
+
+def _get_bin_indices(values: np.ndarray, edges: np.ndarray) -> np.ndarray:
+    # same as np.histogramdd: bins are closed on the left, and values equal
+    # to the last edge go in the last bin. NaN values end up out of range.
+    inds = np.searchsorted(edges, values, side='right') - 1
+    inds[values == edges[-1]] = len(edges) - 2
+    return inds
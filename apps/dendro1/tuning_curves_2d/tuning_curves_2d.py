@@ -1,14 +1,19 @@
 #!/usr/bin/env python
 
 
-from typing import TYPE_CHECKING
-from dendro.sdk import ProcessorBase, InputFile, OutputFile
+import os
+from typing import TYPE_CHECKING, List, Optional
+from dendro.sdk import ProcessorBase, InputFile, OutputFile, OutputFolder
 from dendro.sdk import BaseModel, Field
 
 if TYPE_CHECKING:
     import pynwb
 
 
+# Bump when the output changes, so that results in the result cache are not reused
+result_cache_version = "1"
+
+
 class TuningCurves2DContext(BaseModel):
     input: InputFile = Field(description="Input NWB file")
     output: OutputFile = Field(description="Output .nh5 file")
@@ -21,89 +26,300 @@ class TuningCurves2DContext(BaseModel):
     num_bins: int = Field(
         description="Number of bins (in one dimension) for tuning curves"
     )
+    num_bins_list: List[int] = Field(
+        default=[],
+        description="Additional numbers of bins. All resolutions (including num_bins) are written to resolutions/<num_bins> in the output",
+    )
+    smoothing_widths: List[float] = Field(
+        default=[],
+        description="Widths (standard deviation, in position units) of Gaussian smoothing. Smoothed rate maps are written to resolutions/<num_bins>/smoothed/<width>",
+    )
+    compute_metrics: bool = Field(
+        default=False,
+        description="Whether to compute per-unit spatial information, sparsity and split-half stability, and the even/odd-block rate maps",
+    )
+    metrics_block_duration: float = Field(
+        default=60.0,
+        description="Duration in seconds of the alternating even/odd blocks used for split-half stability",
+    )
 
 
 class TuningCurves2DProcessor(ProcessorBase):
     name = "dendro1.tuning_curves_2d"
-    description = "Create 2D tuning curves from an NWB file using Pynapple"
+    description = "Create 2D tuning curves from an NWB file (same binning as Pynapple)"
     label = "dendro1.tuning_curves_2d"
     tags = ["pynapple", "nwb"]
     attributes = {"wip": True}
 
     @staticmethod
     def run(context: TuningCurves2DContext):
-        import numpy as np
-        import pynwb
-        import pynapple as nap
-        import h5py
-        from h5_to_nh5 import h5_to_nh5
-
-        input_file = context.input.get_file()
-        input_nwb = pynwb.NWBHDF5IO(file=h5py.File(input_file, "r"), mode="r").read()
-
-        num_bins = context.num_bins
-        spatial_series_path = context.spatial_series_path
-        units_path = context.units_path
-
-        # Load the spatial series into a pynapple TsdFrame
-        spatial_series = _load_nwb_object(input_nwb, spatial_series_path)
-        position_over_time = nap.TsdFrame(
-            d=spatial_series.data[:],
-            t=spatial_series.timestamps[:],
-            columns=["x", "y"],
-        )
+        from result_cache import create_output_with_result_cache
 
-        # Load the unit spike times into a pynapple TsGroup
-        units = _load_nwb_object(input_nwb, units_path)
-        unit_names = units["unit_name"][:]
-        unit_spike_times = units["spike_times"][:]
-        spike_times_group = nap.TsGroup(
-            {i: unit_spike_times[i] for i in range(len(unit_names))}
+        output_nh5_fname = "output.nh5"
+        parameters = dict(
+            spatial_series_path=context.spatial_series_path,
+            units_path=context.units_path,
+            num_bins=context.num_bins,
+            num_bins_list=context.num_bins_list,
+            smoothing_widths=context.smoothing_widths,
+            compute_metrics=context.compute_metrics,
+            metrics_block_duration=context.metrics_block_duration,
         )
-
-        # Compute 2D tuning curves
-        rate_maps, position_bins = nap.compute_2d_tuning_curves(
-            spike_times_group,
-            position_over_time,
-            num_bins,
+        # the input is only downloaded if the result is not in the result cache
+        create_output_with_result_cache(
+            output_fname=output_nh5_fname,
+            create_output=lambda: _create_tuning_curves_2d_nh5(
+                context.input.get_file(), output_nh5_fname, **parameters
+            ),
+            processor_name=TuningCurves2DProcessor.name,
+            processor_version=result_cache_version,
+            get_input_urls=lambda: [_get_input_url_or_path(context.input)],
+            parameters=parameters,
         )
 
-        rate_maps_concat = np.zeros(
-            (len(unit_names), num_bins, num_bins), dtype=np.float32
+        context.output.upload(output_nh5_fname)
+
+
+class TuningCurves2DBatchContext(BaseModel):
+    inputs: List[InputFile] = Field(description="Input NWB files")
+    output: OutputFolder = Field(
+        description="Output folder with <i>/tuning_curves_2d.nh5 for the i-th input and an index.json listing the sessions"
+    )
+    spatial_series_path: str = Field(
+        description="Path to spatial series within each NWB file, e.g. 'processing/behavior/Position/SpatialSeriesLED1'"
+    )
+    units_path: str = Field(
+        default="units", description="Path to units within each NWB file, default: 'units'"
+    )
+    num_bins: int = Field(
+        description="Number of bins (in one dimension) for tuning curves"
+    )
+    num_bins_list: List[int] = Field(
+        default=[],
+        description="Additional numbers of bins. All resolutions (including num_bins) are written to resolutions/<num_bins> in the output",
+    )
+    smoothing_widths: List[float] = Field(
+        default=[],
+        description="Widths (standard deviation, in position units) of Gaussian smoothing. Smoothed rate maps are written to resolutions/<num_bins>/smoothed/<width>",
+    )
+    compute_metrics: bool = Field(
+        default=False,
+        description="Whether to compute per-unit spatial information, sparsity and split-half stability, and the even/odd-block rate maps",
+    )
+    metrics_block_duration: float = Field(
+        default=60.0,
+        description="Duration in seconds of the alternating even/odd blocks used for split-half stability",
+    )
+    num_workers: Optional[int] = Field(
+        default=None,
+        description="Number of sessions to process in parallel. If None, uses the number of CPUs available to the job",
+    )
+
+
+class TuningCurves2DBatchProcessor(ProcessorBase):
+    name = "dendro1.tuning_curves_2d_batch"
+    description = "Create 2D tuning curves for many NWB files in one job"
+    label = "dendro1.tuning_curves_2d_batch"
+    tags = ["pynapple", "nwb"]
+    attributes = {"wip": True}
+
+    @staticmethod
+    def run(context: TuningCurves2DBatchContext):
+        import json
+        from cpu_count import get_num_available_cpus
+
+        num_workers = context.num_workers
+        if num_workers is None:
+            num_workers = get_num_available_cpus()
+
+        output_folder = "output_folder"
+        os.makedirs(output_folder, exist_ok=True)
+        kwargs = dict(
+            spatial_series_path=context.spatial_series_path,
+            units_path=context.units_path,
+            num_bins=context.num_bins,
+            num_bins_list=context.num_bins_list,
+            smoothing_widths=context.smoothing_widths,
+            compute_metrics=context.compute_metrics,
+            metrics_block_duration=context.metrics_block_duration,
         )
-        for i in range(len(unit_names)):
-            rate_maps_concat[i, :, :] = rate_maps[i].astype(np.float32)
-        x_bin_positions = position_bins[0].astype(np.float32)
-        y_bin_positions = position_bins[1].astype(np.float32)
-
-        output_h5_fname = "output.h5"
-        with h5py.File(output_h5_fname, "w") as f:
-            f.create_dataset("rate_maps", data=rate_maps_concat)
-            f.create_dataset("x_bin_positions", data=x_bin_positions)
-            f.create_dataset("y_bin_positions", data=y_bin_positions)
-            f.attrs["unit_ids"] = [x for x in unit_names]
-            f.attrs["type"] = "tuning_curves_2d"
-            f.attrs["format_version"] = 1
+        # A failure in one session is recorded in index.json and does not
+        # stop the others
+        session_args = []
+        for i, input in enumerate(context.inputs):
+            os.makedirs(f"{output_folder}/{i}", exist_ok=True)
+            session_args.append((input, f"{output_folder}/{i}/tuning_curves_2d.nh5"))
+        errors = _run_sessions_in_processes(session_args, kwargs, num_workers=max(1, num_workers))
+        sessions = []
+        for i, (input, error) in enumerate(zip(context.inputs, errors)):
+            session = {"index": i, "input_url": _get_input_url_or_path(input), "output": f"{i}/tuning_curves_2d.nh5"}
+            if error is None:
+                print(f"Session {i}: done")
+            else:
+                session["output"] = None
+                session["error"] = error
+                print(f"Session {i}: failed")
+                print(error)
+            sessions.append(session)
+        with open(f"{output_folder}/index.json", "w") as f:
+            json.dump({"sessions": sessions}, f, indent=2)
 
-        output_nh5_fname = "output.nh5"
-        h5_to_nh5(output_h5_fname, output_nh5_fname)
+        num_failed = len([s for s in sessions if s["output"] is None])
+        if num_failed > 0 and num_failed == len(sessions):
+            raise Exception(f"All {num_failed} sessions failed")
+        print(f"{len(sessions) - num_failed} of {len(sessions)} sessions succeeded")
 
-        context.output.upload(output_nh5_fname)
+        context.output.upload(output_folder)
+
+
+def _get_input_url_or_path(input: InputFile) -> str:
+    # get_url raises for a local input
+    if input.local_file_name is not None:
+        return input.local_file_name
+    return input.get_url()
+
+
+def _run_sessions_in_processes(session_args: List[tuple], session_kwargs: dict, *, num_workers: int) -> List[Optional[str]]:
+    """Runs _run_tuning_curves_2d_session for each session in a process pool.
+
+    If a worker process dies (e.g. killed for running out of memory), all of
+    the sessions that had not finished fail with BrokenProcessPool. Those
+    sessions are retried in a new pool, and the ones that are interrupted
+    again are retried each in a process of its own, so that only a session
+    that brings down its own process is reported as failed.
+
+    Returns:
+        List[Optional[str]]: The traceback of the error of each session, or None if it succeeded.
+    """
+    import traceback
+    from concurrent.futures import ProcessPoolExecutor
+    from concurrent.futures.process import BrokenProcessPool
+
+    errors: List[Optional[str]] = [None] * len(session_args)
+    pending = list(range(len(session_args)))
+    for attempt in range(3):
+        if len(pending) == 0:
+            break
+        if attempt > 0:
+            print(f"{len(pending)} sessions were interrupted by a worker process that terminated abruptly, retrying")
+        # the last attempt runs each session in a process of its own
+        groups = [pending] if attempt < 2 else [[i] for i in pending]
+        interrupted = []
+        for group in groups:
+            with ProcessPoolExecutor(max_workers=min(num_workers, len(group))) as executor:
+                futures = [
+                    (i, executor.submit(_run_tuning_curves_2d_session, *session_args[i], **session_kwargs))
+                    for i in group
+                ]
+                for i, future in futures:
+                    try:
+                        future.result()
+                        errors[i] = None
+                    except BrokenProcessPool:
+                        errors[i] = traceback.format_exc()
+                        interrupted.append(i)
+                    except Exception:
+                        errors[i] = traceback.format_exc()
+        pending = interrupted
+    return errors
+
+
+def _run_tuning_curves_2d_session(input: InputFile, output_nh5_fname: str, **kwargs):
+    # runs in a worker process, so the input is downloaded there
+    _create_tuning_curves_2d_nh5(input.get_file(), output_nh5_fname, **kwargs)
+
+
+def _create_tuning_curves_2d_nh5(
+    input_file,
+    output_nh5_fname: str,
+    *,
+    spatial_series_path: str,
+    units_path: str,
+    num_bins: int,
+    num_bins_list: List[int],
+    smoothing_widths: List[float],
+    compute_metrics: bool,
+    metrics_block_duration: float
+):
+    import pynwb
+    import h5py
+    from h5_to_nh5 import h5_to_nh5
+    import numpy as np
+    from .compute_tuning_curves_2d import TuningCurves2DAccumulator, iter_spike_time_chunks
+    from .compute_tuning_curve_metrics import (
+        compute_spatial_information,
+        compute_sparsity,
+        compute_split_half_stability,
+    )
+
+    input_nwb = pynwb.NWBHDF5IO(file=h5py.File(input_file, "r"), mode="r").read()
+
+    # Load the spatial series
+    spatial_series = _load_nwb_object(input_nwb, spatial_series_path)
+    position_times = spatial_series.timestamps[:]
+    positions = spatial_series.data[:]
+
+    # The spike times are streamed from the flat spike_times dataset in
+    # bounded chunks, using spike_times_index for the unit of each spike
+    units = _load_nwb_object(input_nwb, units_path)
+    unit_names = units["unit_name"][:]
+    spike_times_index = units["spike_times"]
+
+    # Compute 2D tuning curves (same binning as pynapple's compute_2d_tuning_curves)
+    # for all resolutions in one pass
+    accumulator = TuningCurves2DAccumulator(
+        position_times=position_times,
+        positions=positions,
+        num_bins_list=[num_bins] + list(num_bins_list),
+        num_units=len(unit_names),
+        split_block_duration=metrics_block_duration if compute_metrics else None,
+    )
+    for spike_times, unit_indices in iter_spike_time_chunks(
+        spike_times_index.target.data, spike_times_index.data
+    ):
+        accumulator.add_spikes(spike_times, unit_indices)
+    tuning_curves = accumulator.get_tuning_curves()
+
+    output_h5_fname = output_nh5_fname + ".h5"
+    with h5py.File(output_h5_fname, "w") as f:
+        _write_tuning_curves(f, tuning_curves[num_bins])
+        if len(num_bins_list) > 0 or len(smoothing_widths) > 0:
+            for n, tc in sorted(tuning_curves.items()):
+                g = f.create_group(f"resolutions/{n}")
+                _write_tuning_curves(g, tc)
+                for width in smoothing_widths:
+                    _write_tuning_curves(g.create_group(f"smoothed/{width:g}"), tc.smoothed(width))
+            f.attrs["num_bins_list"] = sorted(tuning_curves.keys())
+            f.attrs["smoothing_widths"] = [float(w) for w in smoothing_widths]
+        if compute_metrics:
+            # per-unit metrics at num_bins, from the same pass over the spikes
+            tc = tuning_curves[num_bins]
+            tc_even, tc_odd = accumulator.get_split_tuning_curves()[num_bins]
+            f.create_dataset("spatial_information", data=compute_spatial_information(tc).astype(np.float32))
+            f.create_dataset("sparsity", data=compute_sparsity(tc).astype(np.float32))
+            f.create_dataset("split_half_stability", data=compute_split_half_stability(tc_even, tc_odd).astype(np.float32))
+            f.create_dataset("rate_maps_even", data=tc_even.rate_maps.astype(np.float32))
+            f.create_dataset("rate_maps_odd", data=tc_odd.rate_maps.astype(np.float32))
+            f.attrs["metrics_block_duration"] = metrics_block_duration
+        f.attrs["unit_ids"] = [x for x in unit_names]
+        f.attrs["type"] = "tuning_curves_2d"
+        f.attrs["format_version"] = 1
+
+    h5_to_nh5(output_h5_fname, output_nh5_fname)
+    os.remove(output_h5_fname)
+
+
+def _write_tuning_curves(group, tc):
+    import numpy as np
+
+    group.create_dataset("rate_maps", data=tc.rate_maps.astype(np.float32))
+    group.create_dataset("x_bin_positions", data=tc.x_bin_positions.astype(np.float32))
+    group.create_dataset("y_bin_positions", data=tc.y_bin_positions.astype(np.float32))
 
 
 def _load_nwb_object(nwbfile: "pynwb.NWBFile", path: str):
     """
     Load an object from an NWB file given its path.
     """
-    path_parts = path.split("/")
-    obj = nwbfile
-    for i, part in enumerate(path_parts):
-        if i == 0:
-            if part == "processing":
-                obj = obj.processing
-                continue
-            elif part == "units":
-                obj = obj.units
-                continue
-        obj = obj[part]
-    return obj
+    from nwb_object_index import get_nwb_object
+    return get_nwb_object(nwbfile, path)
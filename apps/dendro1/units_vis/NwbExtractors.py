@@ -43,12 +43,13 @@ def retrieve_electrical_series(nwbfile: NWBFile, electrical_series_name: Optiona
         If the specified electrical_series_name is not present in the NWBFile.
     """
     from pynwb.ecephys import ElectricalSeries
+    from nwb_object_index import get_nwb_object_index
 
     if electrical_series_name is not None:
-        # TODO note that this case does not handle repetitions of the same name
-        electrical_series_dict: Dict[str, ElectricalSeries] = {
-            item.name: item for item in nwbfile.all_children() if isinstance(item, ElectricalSeries)
-        }
+        # The name index is built once per open file and shared by all extractors
+        electrical_series_dict: Dict[str, ElectricalSeries] = get_nwb_object_index(
+            nwbfile
+        ).get_electrical_series_by_name()
         if electrical_series_name not in electrical_series_dict:
             raise ValueError(f"{electrical_series_name} not found in the NWBFile. ")
         electrical_series = electrical_series_dict[electrical_series_name]
@@ -246,18 +247,12 @@ class NwbRecordingExtractor(BaseRecording):
         else:
             times_kwargs = dict(sampling_frequency=sampling_frequency, t_start=t_start)
 
-        # Extractors channel groups must be integers, but Nwb electrodes group_name can be strings
-        if "group_name" in electrodes_table.colnames:
-            unique_electrode_group_names = list(np.unique(electrodes_table["group_name"][:]))
-
-        # Fill channel properties dictionary from electrodes table
+        # Each electrodes table column is read once and indexed by electrodes_indices,
+        # rather than reading one element at a time
         if "channel_name" in electrodes_table.colnames:
-            channel_ids = [
-                electrical_series.electrodes["channel_name"][electrodes_index]
-                for electrodes_index in electrodes_indices
-            ]
+            channel_ids = list(_get_electrodes_column_values(electrodes_table, "channel_name", electrodes_indices))
         else:
-            channel_ids = [electrical_series.electrodes.table.id[x] for x in electrodes_indices]
+            channel_ids = list(np.asarray(electrodes_table.id[:])[electrodes_indices])
 
         dtype = electrical_series.data.dtype
         BaseRecording.__init__(self, channel_ids=channel_ids, sampling_frequency=sampling_frequency, dtype=dtype)
@@ -285,7 +280,7 @@ class NwbRecordingExtractor(BaseRecording):
         # Set offsets
         offset = electrical_series.offset if hasattr(electrical_series, "offset") else 0
         if offset == 0 and "offset" in electrodes_table:
-            offset = electrodes_table["offset"].data[electrodes_indices]
+            offset = _get_electrodes_column_values(electrodes_table, "offset", electrodes_indices)
 
         self.set_channel_offsets(offset * 1e6)
 
@@ -295,55 +290,30 @@ class NwbRecordingExtractor(BaseRecording):
 
         properties = dict()
         # Extract rel_x, rel_y and rel_z and assign to location
-
-        # TODO: Refactor ALL of this and add tests. This is difficult to read.
         if "rel_x" in electrodes_table:
             ndim = 3 if "rel_z" in electrodes_table else 2
             properties["location"] = np.zeros((self.get_num_channels(), ndim), dtype=float)
-
-        for electrical_series_index, (channel_id, electrode_table_index) in enumerate(
-            zip(channel_ids, electrodes_indices)
-        ):
-            if "rel_x" in electrodes_table:
-                properties["location"][electrical_series_index, 0] = electrodes_table["rel_x"][electrode_table_index]
-                if "rel_y" in electrodes_table:
-                    properties["location"][electrical_series_index, 1] = electrodes_table["rel_y"][
-                        electrode_table_index
-                    ]
-                if "rel_z" in electrodes_table:
-                    properties["location"][electrical_series_index, 2] = electrodes_table["rel_z"][
-                        electrode_table_index
-                    ]
+            for dim, column in enumerate(["rel_x", "rel_y", "rel_z"][:ndim]):
+                if column in electrodes_table:
+                    properties["location"][:, dim] = _get_electrodes_column_values(
+                        electrodes_table, column, electrodes_indices
+                    )
 
         # Extract all the other properties
-        for electrical_series_index, (channel_id, electrode_table_index) in enumerate(
-            zip(channel_ids, electrodes_indices)
-        ):
-            for column in electrodes_table.colnames:
-                if isinstance(electrodes_table[column][electrode_table_index], ElectrodeGroup):
-                    continue
-                elif column == "group_name":
-                    group = unique_electrode_group_names.index(electrodes_table[column][electrode_table_index])
-                    if "group" not in properties:
-                        properties["group"] = np.zeros(self.get_num_channels(), dtype=type(group))
-                    properties["group"][electrical_series_index] = group
-                elif column == "location":
-                    brain_area = electrodes_table[column][electrode_table_index]
-                    if "brain_area" not in properties:
-                        properties["brain_area"] = np.zeros(self.get_num_channels(), dtype=type(brain_area))
-                    properties["brain_area"][electrical_series_index] = brain_area
-                elif column == "offset":
-                    offset = electrodes_table[column][electrode_table_index]
-                    if "offset" not in properties:
-                        properties["offset"] = np.zeros(self.get_num_channels(), dtype=type(offset))
-                    properties["offset"][electrical_series_index] = offset
-                elif column in ["x", "y", "z", "rel_x", "rel_y", "rel_z"]:
-                    continue
-                else:
-                    val = electrodes_table[column][electrode_table_index]
-                    if column not in properties:
-                        properties[column] = np.zeros(self.get_num_channels(), dtype=type(val))
-                    properties[column][electrical_series_index] = val
+        for column in electrodes_table.colnames:
+            if column in ["x", "y", "z", "rel_x", "rel_y", "rel_z"]:
+                continue
+            values = _get_electrodes_column_values(electrodes_table, column, electrodes_indices)
+            if len(values) == 0 or isinstance(values[0], ElectrodeGroup):
+                continue
+            elif column == "group_name":
+                # Extractors channel groups must be integers, but Nwb electrodes group_name can be strings
+                _, group_inds = np.unique(np.asarray(electrodes_table[column][:]), return_inverse=True)
+                properties["group"] = group_inds[electrodes_indices]
+            elif column == "location":
+                properties["brain_area"] = values
+            else:
+                properties[column] = values
 
         # Set the properties in the recorder
         for property_name, values in properties.items():
@@ -377,6 +347,18 @@ class NwbRecordingExtractor(BaseRecording):
         }
 
 
+def _get_electrodes_column_values(electrodes_table, column: str, electrodes_indices: np.ndarray) -> np.ndarray:
+    """Reads a column of the electrodes table in one read and selects the given rows."""
+    values = electrodes_table[column][:]
+    if not isinstance(values, np.ndarray):
+        # e.g., ElectrodeGroup references or ragged columns
+        array = np.empty((len(values),), dtype=object)
+        for i, v in enumerate(values):
+            array[i] = v
+        values = array
+    return values[electrodes_indices]
+
+
 class NwbRecordingSegment(BaseRecordingSegment):
     def __init__(self, nwbfile, electrical_series_name, num_frames, times_kwargs):
         BaseRecordingSegment.__init__(self, **times_kwargs)
@@ -384,6 +366,7 @@ class NwbRecordingSegment(BaseRecordingSegment):
         self._electrical_series_name = electrical_series_name
         self.electrical_series = retrieve_electrical_series(self._nwbfile, self._electrical_series_name)
         self._num_samples = num_frames
+        self._trace_reader = None
 
     def get_num_samples(self):
         """Returns the number of samples in this signal block
@@ -399,23 +382,26 @@ class NwbRecordingSegment(BaseRecordingSegment):
         if end_frame is None:
             end_frame = self.get_num_samples()
 
-        electrical_series_data = self.electrical_series.data
-        if isinstance(channel_indices, slice):
-            traces = electrical_series_data[start_frame:end_frame, channel_indices]
-        else:
-            # channel_indices is np.ndarray
-            if np.array(channel_indices).size > 1 and np.any(np.diff(channel_indices) < 0):
-                # get around h5py constraint that it does not allow datasets
-                # to be indexed out of order
-                sorted_channel_indices = np.sort(channel_indices)
-                resorted_indices = np.array([list(sorted_channel_indices).index(ch) for ch in channel_indices])
-                recordings = electrical_series_data[start_frame:end_frame, sorted_channel_indices]
-                traces = recordings[:, resorted_indices]
-            else:
-                traces = electrical_series_data[start_frame:end_frame, channel_indices]
+        if self._trace_reader is None:
+            from chunked_trace_reader import ChunkedTraceReader
+
+            # chunk-aligned reads with an LRU of decoded chunks and read-ahead.
+            # Channels are selected in memory, so out-of-order channel indices
+            # need no special handling.
+            self._trace_reader = ChunkedTraceReader(self.electrical_series.data)
+        traces = self._trace_reader.get_traces(start_frame, end_frame, channel_indices)
 
         return traces
 
+    def close(self):
+        """Stops the read-ahead thread of the trace reader."""
+        trace_reader = getattr(self, '_trace_reader', None)
+        if trace_reader is not None:
+            trace_reader.close()
+
+    def __del__(self):
+        self.close()
+
 
 class NwbSortingExtractor(BaseSorting):
     """Load an NWBFile as a SortingExtractor.
@@ -436,6 +422,9 @@ class NwbSortingExtractor(BaseSorting):
     stream_cache_path: str or Path or None, default: None
         Local path for caching. If None it uses cwd
     units_path: str or None, default: None
+    preload_spike_trains: bool, default: False
+        If True, all spike times are read and converted to frames in one vectorized pass
+        when the extractor is created, and spike trains are returned as views.
 
     Returns
     -------
@@ -456,7 +445,8 @@ class NwbSortingExtractor(BaseSorting):
         samples_for_rate_estimation: int = 100000,
         stream_mode: str | None = None,
         stream_cache_path: str | Path | None = None,
-        units_path: str | None = None
+        units_path: str | None = None,
+        preload_spike_trains: bool = False,
     ):
         try:
             from pynwb import NWBHDF5IO, NWBFile
@@ -483,10 +473,11 @@ class NwbSortingExtractor(BaseSorting):
             file = h5py.File(file_path_)
             self.io = NWBHDF5IO(file=file, mode="r", load_namespaces=True)
         elif stream_mode == "remfile":
-            import remfile
             import h5py
+            from remote_file import open_remote_file
 
-            remf = remfile.File(file_path)
+            # shares the block cache with other readers of the same url
+            remf = open_remote_file(file_path)
             file = h5py.File(remf, 'r')
             self.io = NWBHDF5IO(file=file, mode="r", load_namespaces=True)
 
@@ -538,7 +529,7 @@ class NwbSortingExtractor(BaseSorting):
         BaseSorting.__init__(self, sampling_frequency=sampling_frequency, unit_ids=units_ids)
         sorting_segment = NwbSortingSegment(
             nwbfile=self._nwbfile, sampling_frequency=sampling_frequency, timestamps=timestamps,
-            units_path=units_path
+            units_path=units_path, preload_spike_trains=preload_spike_trains
         )
         self.add_sorting_segment(sorting_segment)
 
@@ -556,17 +547,59 @@ class NwbSortingExtractor(BaseSorting):
             "samples_for_rate_estimation": samples_for_rate_estimation,
             "stream_mode": stream_mode,
             "stream_cache_path": stream_cache_path,
+            "units_path": units_path,
+            "preload_spike_trains": preload_spike_trains,
         }
 
 
 class NwbSortingSegment(BaseSortingSegment):
-    def __init__(self, nwbfile, sampling_frequency, timestamps, units_path: Optional[str] = None):
+    def __init__(
+        self,
+        nwbfile,
+        sampling_frequency,
+        timestamps,
+        units_path: Optional[str] = None,
+        preload_spike_trains: bool = False,
+    ):
         BaseSortingSegment.__init__(self)
         self._nwbfile = nwbfile
         self._sampling_frequency = sampling_frequency
         self._timestamps = timestamps
         self._units_path = units_path
 
+        # The ragged spike_times column is read once as two flat arrays:
+        # the concatenated spike times and the end offset of each unit
+        self._spike_times: Optional[np.ndarray] = None
+        self._spike_times_index: Optional[np.ndarray] = None
+        self._unit_id_to_row: Optional[Dict] = None
+        # All spike frames, only set when preloading
+        self._spike_frames: Optional[np.ndarray] = None
+        self._spike_frames_are_sorted = False
+        if preload_spike_trains:
+            self._preload_spike_frames()
+
+    def _load_spike_times(self):
+        if self._spike_times is not None:
+            return
+        units_object = _get_units_object(self._nwbfile, self._units_path)
+        spike_times_index = units_object["spike_times"]
+        self._spike_times_index = np.asarray(spike_times_index.data[:], dtype=np.int64)
+        self._spike_times = np.asarray(spike_times_index.target.data[:])
+        self._unit_id_to_row = {unit_id: row for row, unit_id in enumerate(units_object.id[:])}
+
+    def _preload_spike_frames(self):
+        self._load_spike_times()
+        self._spike_frames = self._times_to_frames(self._spike_times)
+        # frames may decrease only across unit boundaries for the trains to be sorted
+        decreasing = np.flatnonzero(np.diff(self._spike_frames) < 0) + 1
+        self._spike_frames_are_sorted = bool(np.all(np.isin(decreasing, self._spike_times_index)))
+
+    def _times_to_frames(self, times: np.ndarray) -> np.ndarray:
+        if self._timestamps is not None:
+            return np.searchsorted(self._timestamps, times).astype("int64")
+        else:
+            return np.round(times * self._sampling_frequency).astype("int64")
+
     def get_unit_spike_train(
         self,
         unit_id,
@@ -578,13 +611,20 @@ class NwbSortingSegment(BaseSortingSegment):
             start_frame = 0
         if end_frame is None:
             end_frame = np.inf
-        units_object = _get_units_object(self._nwbfile, self._units_path)
-        times = units_object["spike_times"][list(units_object.id[:]).index(unit_id)][:]
-
-        if self._timestamps is not None:
-            frames = np.searchsorted(times, self.timestamps).astype("int64")
+        self._load_spike_times()
+        row = self._unit_id_to_row[unit_id]
+        i1 = self._spike_times_index[row - 1] if row > 0 else 0
+        i2 = self._spike_times_index[row]
+
+        if self._spike_frames is not None:
+            frames = self._spike_frames[i1:i2]
+            if self._spike_frames_are_sorted:
+                # return a view rather than a masked copy
+                j1 = np.searchsorted(frames, start_frame, side="left")
+                j2 = np.searchsorted(frames, end_frame, side="left")
+                return frames[j1:j2]
         else:
-            frames = np.round(times * self._sampling_frequency).astype("int64")
+            frames = self._times_to_frames(self._spike_times[i1:i2])
         return frames[(frames >= start_frame) & (frames < end_frame)]
 
 
@@ -627,12 +667,11 @@ def read_nwb(file_path, load_recording=True, load_sorting=False, electrical_seri
 
 
 def _get_units_object(nwbfile, units_path: Optional[str] = None):
+    from nwb_object_index import get_nwb_object
+
     if not units_path:
         return nwbfile.units
     parts = [p for p in units_path.split("/") if p]
     if parts[0] != 'processing':
         raise ValueError(f'Not a supported units path: {units_path}')
-    x = nwbfile.processing
-    for p in parts[1:]:
-        x = x[p]
-    return x
+    return get_nwb_object(nwbfile, units_path)
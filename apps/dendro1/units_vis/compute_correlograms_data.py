@@ -1,66 +1,422 @@
-from typing import Union
-import spikeinterface as si
+from typing import TYPE_CHECKING, Union, List, Tuple, Optional
 import numpy as np
 
+if TYPE_CHECKING:
+    import spikeinterface as si
 
-def compute_correlogram_data(*, sorting: si.BaseSorting, unit_id1: int, unit_id2: Union[int, None] = None, window_size_msec: float, bin_size_msec: float):
+
+# Maximum number of spike pairs whose time differences are held in memory at once
+_MAX_PAIRS_PER_BLOCK = 4 * 1024 * 1024
+
+
+def compute_correlogram_data(
+    *,
+    sorting: "si.BaseSorting",
+    unit_id1: int,
+    unit_id2: Union[int, None] = None,
+    window_size_msec: float,
+    bin_size_msec: float,
+    use_numba: bool = False
+):
     times1 = sorting.get_unit_spike_train(unit_id=unit_id1, segment_index=0)
-    num_bins = int(window_size_msec / bin_size_msec)
-    if num_bins % 2 == 0:
-        num_bins = num_bins - 1  # odd number of bins
-    num_bins_half = int((num_bins + 1) / 2)
-    bin_edges_msec = np.array((np.arange(num_bins + 1) - num_bins / 2) * bin_size_msec, dtype=np.float32)
-    bin_counts = np.zeros((num_bins,), dtype=np.int32)
     if unit_id2 is None or unit_id1 == unit_id2:
-        # autocorrelogram
-        offset = 1
-        while True:
-            if offset >= len(times1):
-                break
-            deltas_msec = (times1[offset:] - times1[:-offset]) / sorting.get_sampling_frequency() * 1000
-            deltas_msec = deltas_msec[deltas_msec <= bin_edges_msec[-1]]
-            if len(deltas_msec) == 0:
-                break
-            for i in range(num_bins_half):
-                start_msec = bin_edges_msec[num_bins_half - 1 + i]
-                end_msec = bin_edges_msec[num_bins_half + i]
-                ct = len(deltas_msec[(start_msec <= deltas_msec) & (deltas_msec < end_msec)])
-                bin_counts[num_bins_half - 1 + i] += ct
-                bin_counts[num_bins_half - 1 - i] += ct
-            offset = offset + 1
+        times2 = None
     else:
-        # cross-correlogram
         times2 = sorting.get_unit_spike_train(segment_index=0, unit_id=unit_id2)
-        all_times = np.concatenate((times1, times2))
-        all_labels = np.concatenate((1 * np.ones(times1.shape), 2 * np.ones(times2.shape)))
-        sort_inds = np.argsort(all_times)
-        all_times = all_times[sort_inds]
-        all_labels = all_labels[sort_inds]
-        offset = 1
-        while True:
-            if offset >= len(all_times):
-                break
-            deltas_msec = (all_times[offset:] - all_times[:-offset]) / sorting.get_sampling_frequency() * 1000
-
-            deltas12_msec = deltas_msec[(all_labels[offset:] == 2) & (all_labels[:-offset] == 1)]
-            deltas21_msec = deltas_msec[(all_labels[offset:] == 1) & (all_labels[:-offset] == 2)]
-            deltas11_msec = deltas_msec[(all_labels[offset:] == 1) & (all_labels[:-offset] == 1)]
-            deltas22_msec = deltas_msec[(all_labels[offset:] == 2) & (all_labels[:-offset] == 2)]
-
-            deltas12_msec = deltas12_msec[deltas12_msec <= bin_edges_msec[-1]]
-            deltas21_msec = deltas21_msec[deltas21_msec <= bin_edges_msec[-1]]
-            deltas11_msec = deltas11_msec[deltas11_msec <= bin_edges_msec[-1]]
-            deltas22_msec = deltas22_msec[deltas22_msec <= bin_edges_msec[-1]]
-
-            if (len(deltas12_msec) + len(deltas21_msec) + len(deltas11_msec) + len(deltas22_msec)) == 0:
-                break
-
-            for i in range(num_bins_half):
-                start_msec = bin_edges_msec[num_bins_half - 1 + i]
-                end_msec = bin_edges_msec[num_bins_half + i]
-                ct12 = len(deltas12_msec[(start_msec <= deltas12_msec) & (deltas12_msec < end_msec)])
-                ct21 = len(deltas21_msec[(start_msec <= deltas21_msec) & (deltas21_msec < end_msec)])
-                bin_counts[num_bins_half - 1 + i] += ct12
-                bin_counts[num_bins_half - 1 - i] += ct21
-            offset = offset + 1
+    return compute_correlogram_data_from_spike_trains(
+        times1=times1,
+        times2=times2,
+        sampling_frequency=sorting.get_sampling_frequency(),
+        window_size_msec=window_size_msec,
+        bin_size_msec=bin_size_msec,
+        use_numba=use_numba
+    )
+
+
+def compute_correlogram_data_from_spike_trains(
+    *,
+    times1: np.ndarray,
+    times2: Union[np.ndarray, None] = None,
+    sampling_frequency: float,
+    window_size_msec: float,
+    bin_size_msec: float,
+    use_numba: bool = False
+):
+    """Computes an autocorrelogram (times2 is None) or a cross-correlogram.
+
+    Rather than looping over offsets into the spike train, the partners of
+    each spike within the window are found with a single searchsorted and the
+    time differences are histogrammed with np.bincount, which is O(N log N)
+    plus the number of pairs within the window.
+
+    Args:
+        times1 (np.ndarray): Spike frames of the first unit.
+        times2 (np.ndarray, optional): Spike frames of the second unit, or None for an autocorrelogram.
+        sampling_frequency (float): Sampling frequency in Hz.
+        window_size_msec (float): Width of the correlogram window in milliseconds.
+        bin_size_msec (float): Bin size in milliseconds.
+        use_numba (bool): Use a compiled numba kernel instead of the vectorized NumPy implementation.
+
+    Returns:
+        dict: bin_edges_sec and bin_counts
+    """
+    bin_edges_msec = _get_bin_edges_msec(window_size_msec=window_size_msec, bin_size_msec=bin_size_msec)
+    num_bins = len(bin_edges_msec) - 1
+    num_bins_half = int((num_bins + 1) / 2)
+    # The center bin and the bins to its right. The comparisons are done in
+    # float64 against the float32 edges, as in the original offset loop.
+    half_bin_edges_msec = bin_edges_msec[num_bins_half - 1:].astype(np.float64)
+    max_lag_frames = _get_max_lag_frames(half_bin_edges_msec[-1], sampling_frequency)
+    sampling_frequency = float(sampling_frequency)
+
+    bin_counts = np.zeros((num_bins,), dtype=np.int64)
+    times1 = _sorted_spike_train(times1)
+    if times2 is None:
+        # autocorrelogram: each pair contributes symmetrically
+        if use_numba:
+            half_counts = _get_numba_kernels()["autocorrelogram"](times1, sampling_frequency, half_bin_edges_msec, max_lag_frames)
+        else:
+            half_counts = _autocorrelogram_half_counts(times1, sampling_frequency, half_bin_edges_msec, max_lag_frames)
+        bin_counts[num_bins_half - 1:] += half_counts
+        bin_counts[num_bins_half - 1::-1] += half_counts
+    else:
+        # cross-correlogram: pairs where the unit 2 spike follows the unit 1
+        # spike go to the right half, the others to the left half
+        times2 = _sorted_spike_train(times2)
+        if use_numba:
+            counts_12, counts_21 = _get_numba_kernels()["crosscorrelogram"](times1, times2, sampling_frequency, half_bin_edges_msec, max_lag_frames)
+        else:
+            counts_12, counts_21 = _crosscorrelogram_half_counts(times1, times2, sampling_frequency, half_bin_edges_msec, max_lag_frames)
+        bin_counts[num_bins_half - 1:] += counts_12
+        bin_counts[num_bins_half - 1::-1] += counts_21
     return {"bin_edges_sec": (bin_edges_msec / 1000).astype(np.float32), "bin_counts": bin_counts.astype(np.int32)}
+
+
+def compute_autocorrelograms(
+    *,
+    spike_trains: List[np.ndarray],
+    sampling_frequency: float,
+    window_size_msec: float,
+    bin_size_msec: float,
+    num_workers: Optional[int] = 1
+):
+    """Computes the autocorrelograms of many units, optionally on a process pool.
+
+    In parallel mode the spike trains are published once through
+    multiprocessing.shared_memory and each worker computes the
+    autocorrelograms for a range of units. The results are identical to the
+    serial path.
+
+    Args:
+        spike_trains (List[np.ndarray]): Spike frames of each unit.
+        sampling_frequency (float): Sampling frequency in Hz.
+        window_size_msec (float): Width of the correlogram window in milliseconds.
+        bin_size_msec (float): Bin size in milliseconds.
+        num_workers (int, optional): Number of worker processes. If None, uses
+            the number of CPUs available to this process. 1 means serial.
+
+    Returns:
+        dict: bin_edges_sec, and bin_counts with shape (K, num_bins)
+    """
+    if num_workers is None:
+        from cpu_count import get_num_available_cpus
+
+        num_workers = get_num_available_cpus()
+    num_units = len(spike_trains)
+    spike_trains = [np.asarray(x, dtype=np.int64) for x in spike_trains]
+    bin_edges_msec = _get_bin_edges_msec(window_size_msec=window_size_msec, bin_size_msec=bin_size_msec)
+    num_bins = len(bin_edges_msec) - 1
+    offsets = np.concatenate(([0], np.cumsum([len(x) for x in spike_trains]))).astype(np.int64)
+    if num_workers <= 1 or num_units <= 1:
+        bin_counts = np.zeros((num_units, num_bins), dtype=np.int32)
+        for i, times in enumerate(spike_trains):
+            bin_counts[i] = compute_correlogram_data_from_spike_trains(
+                times1=times,
+                sampling_frequency=sampling_frequency,
+                window_size_msec=window_size_msec,
+                bin_size_msec=bin_size_msec
+            )["bin_counts"]
+    else:
+        bin_counts = _compute_autocorrelograms_in_pool(
+            spike_trains=spike_trains,
+            offsets=offsets,
+            sampling_frequency=sampling_frequency,
+            window_size_msec=window_size_msec,
+            bin_size_msec=bin_size_msec,
+            num_workers=num_workers
+        )
+    return {"bin_edges_sec": (bin_edges_msec / 1000).astype(np.float32), "bin_counts": bin_counts}
+
+
+def _compute_autocorrelograms_in_pool(
+    *,
+    spike_trains: List[np.ndarray],
+    offsets: np.ndarray,
+    sampling_frequency: float,
+    window_size_msec: float,
+    bin_size_msec: float,
+    num_workers: int
+) -> np.ndarray:
+    from concurrent.futures import ProcessPoolExecutor
+    from multiprocessing import shared_memory
+
+    num_units = len(spike_trains)
+    num_spikes = int(offsets[-1])
+    shm = shared_memory.SharedMemory(create=True, size=max(1, num_spikes * 8))
+    try:
+        all_times = np.ndarray((num_spikes,), dtype=np.int64, buffer=shm.buf)
+        for i, times in enumerate(spike_trains):
+            all_times[offsets[i]:offsets[i + 1]] = times
+        del all_times
+
+        # Split the units into contiguous ranges with roughly equal numbers of
+        # spikes, a few per worker so that the load stays balanced
+        num_tasks = min(num_units, num_workers * 4)
+        boundaries = np.searchsorted(offsets[1:], np.linspace(0, num_spikes, num_tasks + 1)[1:-1], side="left") + 1
+        boundaries = np.unique(np.concatenate(([0], boundaries, [num_units])))
+        tasks = [
+            (shm.name, num_spikes, offsets[u1:u2 + 1], float(sampling_frequency), window_size_msec, bin_size_msec)
+            for u1, u2 in zip(boundaries[:-1], boundaries[1:])
+        ]
+        with ProcessPoolExecutor(max_workers=num_workers) as executor:
+            results = list(executor.map(_autocorrelograms_worker, tasks))
+    finally:
+        shm.close()
+        shm.unlink()
+    return np.concatenate(results, axis=0)
+
+
+def _autocorrelograms_worker(task) -> np.ndarray:
+    from multiprocessing import shared_memory
+
+    shm_name, num_spikes, offsets, sampling_frequency, window_size_msec, bin_size_msec = task
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        all_times = np.ndarray((num_spikes,), dtype=np.int64, buffer=shm.buf)
+        bin_counts = [
+            compute_correlogram_data_from_spike_trains(
+                times1=all_times[offsets[i]:offsets[i + 1]],
+                sampling_frequency=sampling_frequency,
+                window_size_msec=window_size_msec,
+                bin_size_msec=bin_size_msec
+            )["bin_counts"]
+            for i in range(len(offsets) - 1)
+        ]
+        del all_times
+    finally:
+        shm.close()
+    return np.array(bin_counts, dtype=np.int32).reshape((len(offsets) - 1, -1))
+
+
+def compute_correlogram_matrix(
+    *,
+    spike_trains: List[np.ndarray],
+    sampling_frequency: float,
+    window_size_msec: float,
+    bin_size_msec: float,
+    pairs: Optional[List[Tuple[int, int]]] = None
+):
+    """Computes the correlograms of many pairs of units in one pass.
+
+    All spike trains are merged into a single stream sorted by time and then
+    by unit index, and every pair of spikes within the window is histogrammed
+    once into the correlograms of both (unit_i, unit_j) and (unit_j, unit_i).
+    The correlogram of a unit with itself is its autocorrelogram, and the
+    correlogram of (i, j) matches compute_correlogram_data with unit_id1=i and
+    unit_id2=j.
+
+    Args:
+        spike_trains (List[np.ndarray]): Spike frames of each unit.
+        sampling_frequency (float): Sampling frequency in Hz.
+        window_size_msec (float): Width of the correlogram window in milliseconds.
+        bin_size_msec (float): Bin size in milliseconds.
+        pairs (List[Tuple[int, int]], optional): Pairs of indices into spike_trains
+            to compute. If None, all K x K pairs are computed.
+
+    Returns:
+        dict: bin_edges_sec, and bin_counts with shape (K, K, num_bins), or
+            (len(pairs), num_bins) when pairs is given.
+    """
+    num_units = len(spike_trains)
+    bin_edges_msec = _get_bin_edges_msec(window_size_msec=window_size_msec, bin_size_msec=bin_size_msec)
+    num_bins = len(bin_edges_msec) - 1
+    num_bins_half = int((num_bins + 1) / 2)
+    half_bin_edges_msec = bin_edges_msec[num_bins_half - 1:].astype(np.float64)
+    max_lag_frames = _get_max_lag_frames(half_bin_edges_msec[-1], sampling_frequency)
+    sampling_frequency = float(sampling_frequency)
+
+    # row of the output for each ordered pair of units, or -1 if not requested
+    if pairs is None:
+        num_rows = num_units * num_units
+        pair_rows = np.arange(num_rows).reshape((num_units, num_units))
+        used_units = np.arange(num_units)
+    else:
+        unique_pairs = list(dict.fromkeys((int(i), int(j)) for i, j in pairs))
+        num_rows = len(unique_pairs)
+        pair_rows = np.full((num_units, num_units), -1, dtype=np.int64)
+        for row, (i, j) in enumerate(unique_pairs):
+            pair_rows[i, j] = row
+        used_units = np.unique(np.array(unique_pairs, dtype=np.int64).reshape(-1))
+
+    # merged, label-sorted spike stream of the units that are involved
+    times = np.concatenate([np.asarray(spike_trains[u], dtype=np.int64) for u in used_units] + [np.zeros((0,), dtype=np.int64)])
+    labels = np.concatenate([np.full((len(spike_trains[u]),), u, dtype=np.int64) for u in used_units] + [np.zeros((0,), dtype=np.int64)])
+    sort_inds = np.lexsort((labels, times))
+    times = times[sort_inds]
+    labels = labels[sort_inds]
+
+    flat_counts = np.zeros((num_rows * num_bins,), dtype=np.int64)
+    starts = np.arange(1, len(times) + 1)
+    ends = np.searchsorted(times, times + max_lag_frames, side="right")
+    for i_inds, j_inds in _iter_window_pairs(starts, ends):
+        deltas_msec = (times[j_inds] - times[i_inds]) / sampling_frequency * 1000
+        inds = _half_bin_indices(deltas_msec, half_bin_edges_msec)
+        in_window = inds >= 0
+        inds = inds[in_window]
+        labels_i = labels[i_inds[in_window]]
+        labels_j = labels[j_inds[in_window]]
+        # the later spike belongs to labels_j: right half of (i, j), left half of (j, i)
+        rows_ij = pair_rows[labels_i, labels_j]
+        rows_ji = pair_rows[labels_j, labels_i]
+        flat_inds = np.concatenate((
+            rows_ij[rows_ij >= 0] * num_bins + (num_bins_half - 1) + inds[rows_ij >= 0],
+            rows_ji[rows_ji >= 0] * num_bins + (num_bins_half - 1) - inds[rows_ji >= 0]
+        ))
+        flat_counts += np.bincount(flat_inds, minlength=num_rows * num_bins)
+
+    bin_counts = flat_counts.reshape((num_rows, num_bins)).astype(np.int32)
+    if pairs is None:
+        bin_counts = bin_counts.reshape((num_units, num_units, num_bins))
+    else:
+        bin_counts = bin_counts[[pair_rows[int(i), int(j)] for i, j in pairs]]
+    return {"bin_edges_sec": (bin_edges_msec / 1000).astype(np.float32), "bin_counts": bin_counts}
+
+
+def _get_bin_edges_msec(*, window_size_msec: float, bin_size_msec: float) -> np.ndarray:
+    num_bins = int(window_size_msec / bin_size_msec)
+    if num_bins % 2 == 0:
+        num_bins = num_bins - 1  # odd number of bins
+    return np.array((np.arange(num_bins + 1) - num_bins / 2) * bin_size_msec, dtype=np.float32)
+
+
+def _get_max_lag_frames(max_lag_msec: float, sampling_frequency: float) -> int:
+    # Conservative bound on the frame difference of a pair that can land in a
+    # bin; pairs beyond the last bin edge are discarded when binning.
+    return int(np.ceil(max_lag_msec / 1000 * sampling_frequency)) + 1
+
+
+def _sorted_spike_train(times: np.ndarray) -> np.ndarray:
+    times = np.asarray(times)
+    if len(times) > 1 and np.any(times[1:] < times[:-1]):
+        times = np.sort(times)
+    return times
+
+
+def _iter_window_pairs(starts: np.ndarray, ends: np.ndarray, max_pairs_per_block: int = _MAX_PAIRS_PER_BLOCK):
+    """Yields (i, j) index arrays for all j in [starts[i], ends[i]), in blocks of bounded size."""
+    num_partners = ends - starts
+    cumulative = np.concatenate(([0], np.cumsum(num_partners)))
+    n = len(starts)
+    block_start = 0
+    while block_start < n:
+        block_end = int(np.searchsorted(cumulative, cumulative[block_start] + max_pairs_per_block, side="right")) - 1
+        block_end = min(max(block_end, block_start + 1), n)
+        counts = num_partners[block_start:block_end]
+        total = int(cumulative[block_end] - cumulative[block_start])
+        if total > 0:
+            i_inds = np.repeat(np.arange(block_start, block_end), counts)
+            within = np.arange(total) - np.repeat(cumulative[block_start:block_end] - cumulative[block_start], counts)
+            j_inds = np.repeat(starts[block_start:block_end], counts) + within
+            yield i_inds, j_inds
+        block_start = block_end
+
+
+def _half_bin_indices(deltas_msec: np.ndarray, half_bin_edges_msec: np.ndarray) -> np.ndarray:
+    """Returns the half-correlogram bin of each non-negative time difference, or -1 if out of range."""
+    inds = np.searchsorted(half_bin_edges_msec, deltas_msec, side="right") - 1
+    inds[inds >= len(half_bin_edges_msec) - 1] = -1
+    return inds
+
+
+def _autocorrelogram_half_counts(times: np.ndarray, sampling_frequency: float, half_bin_edges_msec: np.ndarray, max_lag_frames: int) -> np.ndarray:
+    num_bins_half = len(half_bin_edges_msec) - 1
+    half_counts = np.zeros((num_bins_half,), dtype=np.int64)
+    starts = np.arange(1, len(times) + 1)
+    ends = np.searchsorted(times, times + max_lag_frames, side="right")
+    for i_inds, j_inds in _iter_window_pairs(starts, ends):
+        deltas_msec = (times[j_inds] - times[i_inds]) / sampling_frequency * 1000
+        inds = _half_bin_indices(deltas_msec, half_bin_edges_msec)
+        half_counts += np.bincount(inds[inds >= 0], minlength=num_bins_half)
+    return half_counts
+
+
+def _crosscorrelogram_half_counts(times1: np.ndarray, times2: np.ndarray, sampling_frequency: float, half_bin_edges_msec: np.ndarray, max_lag_frames: int):
+    num_bins_half = len(half_bin_edges_msec) - 1
+    counts_12 = np.zeros((num_bins_half,), dtype=np.int64)
+    counts_21 = np.zeros((num_bins_half,), dtype=np.int64)
+    starts = np.searchsorted(times2, times1 - max_lag_frames, side="left")
+    ends = np.searchsorted(times2, times1 + max_lag_frames, side="right")
+    for i_inds, j_inds in _iter_window_pairs(starts, ends):
+        frame_deltas = times2[j_inds] - times1[i_inds]
+        # a coincident pair is counted once, in the center bin
+        is_12 = frame_deltas >= 0
+        inds_12 = _half_bin_indices(frame_deltas[is_12] / sampling_frequency * 1000, half_bin_edges_msec)
+        inds_21 = _half_bin_indices(-frame_deltas[~is_12] / sampling_frequency * 1000, half_bin_edges_msec)
+        counts_12 += np.bincount(inds_12[inds_12 >= 0], minlength=num_bins_half)
+        counts_21 += np.bincount(inds_21[inds_21 >= 0], minlength=num_bins_half)
+    return counts_12, counts_21
+
+
+_numba_kernels = None
+
+
+def _get_numba_kernels():
+    global _numba_kernels
+    if _numba_kernels is not None:
+        return _numba_kernels
+    try:
+        import numba
+    except ImportError:
+        raise ImportError("use_numba=True requires numba: pip install numba")
+
+    @numba.njit
+    def autocorrelogram(times, sampling_frequency, half_bin_edges_msec, max_lag_frames):
+        num_bins_half = len(half_bin_edges_msec) - 1
+        half_counts = np.zeros(num_bins_half, dtype=np.int64)
+        n = len(times)
+        for i in range(n):
+            j = i + 1
+            while j < n and times[j] - times[i] <= max_lag_frames:
+                delta_msec = (times[j] - times[i]) / sampling_frequency * 1000
+                k = np.searchsorted(half_bin_edges_msec, delta_msec, side="right") - 1
+                if k < num_bins_half:
+                    half_counts[k] += 1
+                j += 1
+        return half_counts
+
+    @numba.njit
+    def crosscorrelogram(times1, times2, sampling_frequency, half_bin_edges_msec, max_lag_frames):
+        num_bins_half = len(half_bin_edges_msec) - 1
+        counts_12 = np.zeros(num_bins_half, dtype=np.int64)
+        counts_21 = np.zeros(num_bins_half, dtype=np.int64)
+        n2 = len(times2)
+        j_start = 0
+        for i in range(len(times1)):
+            while j_start < n2 and times2[j_start] < times1[i] - max_lag_frames:
+                j_start += 1
+            j = j_start
+            while j < n2 and times2[j] <= times1[i] + max_lag_frames:
+                frame_delta = times2[j] - times1[i]
+                if frame_delta >= 0:
+                    k = np.searchsorted(half_bin_edges_msec, frame_delta / sampling_frequency * 1000, side="right") - 1
+                    if k < num_bins_half:
+                        counts_12[k] += 1
+                else:
+                    k = np.searchsorted(half_bin_edges_msec, -frame_delta / sampling_frequency * 1000, side="right") - 1
+                    if k < num_bins_half:
+                        counts_21[k] += 1
+                j += 1
+        return counts_12, counts_21
+
+    _numba_kernels = {"autocorrelogram": autocorrelogram, "crosscorrelogram": crosscorrelogram}
+    return _numba_kernels
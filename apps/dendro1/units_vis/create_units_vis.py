@@ -1,10 +1,12 @@
 from typing import List, Union, Optional
+import time
 import numpy as np
 import h5py
 import spikeinterface as si
 import sortingview.views as vv
-import remfile
-from .compute_correlograms_data import compute_correlogram_data
+from .compute_correlograms_data import compute_autocorrelograms, compute_correlogram_matrix
+from .raster_pyramid import RasterPyramid
+from .units_data import UnitsData, get_units_data, load_units_data
 
 # with remfile support
 # and support for units_path
@@ -12,13 +14,57 @@ from .compute_correlograms_data import compute_correlogram_data
 from .NwbExtractors import NwbSortingExtractor
 
 
-def create_units_vis(url, *, units_path: Optional[str] = None, sampling_frequency: Optional[float] = None):
-    sorting = NwbSortingExtractor(url, stream_mode="remfile", units_path=units_path, sampling_frequency=sampling_frequency)
-    remf = remfile.File(url)
-    with h5py.File(remf, "r") as file:
-        v_rp = create_raster_plot(sorting=sorting)
-        v_ac = create_autocorrelograms(sorting=sorting)
+def create_units_vis(
+    url,
+    *,
+    units_path: Optional[str] = None,
+    sampling_frequency: Optional[float] = None,
+    include_cross_correlograms: bool = False,
+    num_workers: Optional[int] = 1,
+    max_raster_points: int = 2_000_000,
+    exact_raster_window_sec: float = 300,
+    single_pass: bool = False,
+):
+    """Creates the units visualization (autocorrelograms, units table and raster plot).
+
+    By default the spike trains are loaded with NwbSortingExtractor (pynwb).
+    With single_pass=True, the file is opened once with h5py, the spike
+    times are loaded once into a UnitsData (flat spike frames plus offsets)
+    and every stage is computed from it. The time of each stage is printed.
+    """
+    from remote_file import open_remote_file, get_remote_file_stats
+
+    timer = time.time()
+    with open_remote_file(url) as remf, h5py.File(remf, "r") as file:
+        if single_pass:
+            sorting = load_units_data(file, units_path=units_path, sampling_frequency=sampling_frequency)
+        else:
+            sorting = NwbSortingExtractor(
+                url,
+                stream_mode="remfile",
+                units_path=units_path,
+                sampling_frequency=sampling_frequency,
+                preload_spike_trains=True,
+            )
+        timer = _print_stage_time("Loading spike trains", timer)
+        v_rp = create_raster_plot(
+            sorting=sorting, max_num_points=max_raster_points, exact_window_sec=exact_raster_window_sec
+        )
+        timer = _print_stage_time("Raster plot", timer)
+        v_ac = create_autocorrelograms(sorting=sorting, num_workers=num_workers)
+        timer = _print_stage_time("Autocorrelograms", timer)
         v_u = create_units_table(unit_ids=sorting.get_unit_ids(), file=file, units_path=units_path)
+        timer = _print_stage_time("Units table", timer)
+
+    if include_cross_correlograms:
+        v_cc = create_cross_correlograms(sorting=sorting)
+        v_ac = vv.TabLayout(
+            items=[
+                vv.TabLayoutItem(label="Autocorrelograms", view=v_ac),
+                vv.TabLayoutItem(label="Cross correlograms", view=v_cc),
+            ]
+        )
+        timer = _print_stage_time("Cross correlograms", timer)
 
     v_right = vv.Splitter(
         item1=vv.LayoutItem(v_u), item2=vv.LayoutItem(v_rp), direction="vertical"
@@ -30,103 +76,252 @@ def create_units_vis(url, *, units_path: Optional[str] = None, sampling_frequenc
         direction="horizontal",
     )
 
+    print(f"Remote file stats: {get_remote_file_stats(url)}")
+
     return v
 
 
-def create_raster_plot(*, sorting: si.BaseSorting, height=500):
-    plot_items: List[vv.RasterPlotItem] = []
-    min_spike_time = np.inf
-    max_spike_time = -np.inf
-    for unit_id in sorting.get_unit_ids():
-        spike_times_sec = (
-            np.array(sorting.get_unit_spike_train(segment_index=0, unit_id=unit_id))
-            / sorting.get_sampling_frequency()
-        )
-        min_spike_time = min(min_spike_time, np.min(spike_times_sec))
-        max_spike_time = max(max_spike_time, np.max(spike_times_sec))
-        plot_items.append(
-            vv.RasterPlotItem(
-                unit_id=unit_id, spike_times_sec=spike_times_sec.astype(np.float32)
-            )
-        )
+def _print_stage_time(stage: str, timer: float) -> float:
+    now = time.time()
+    print(f"{stage}: {now - timer:.2f} sec")
+    return now
+
 
+def create_raster_plot(
+    *,
+    sorting: Union[si.BaseSorting, UnitsData],
+    height=500,
+    max_num_points: int = 2_000_000,
+    exact_window_sec: float = 300,
+    max_points_per_bin: int = 8,
+):
+    """Creates the raster plot of all units.
+
+    If there are at most max_num_points spikes, all of them are plotted.
+    Otherwise the raster is a tab layout with an overview of the whole
+    session, from the finest level of a RasterPyramid that fits in
+    max_num_points, and the exact spikes of the first exact_window_sec
+    seconds (also limited to max_num_points), so that the payload does not
+    grow with the length of the session. In the overview each occupied bin is
+    drawn as up to max_points_per_bin points spread over the bin, one per
+    spike, so busier bins are drawn denser.
+    """
+    units_data = get_units_data(sorting)
+    unit_ids = units_data.get_unit_ids()
+    spike_times_sec = units_data.spike_frames / units_data.get_sampling_frequency()
+    unit_indices = units_data.get_unit_indices()
+
+    min_spike_time = np.min(spike_times_sec) if len(spike_times_sec) > 0 else 0
+    max_spike_time = np.max(spike_times_sec) if len(spike_times_sec) > 0 else 0
     # Let's start at 0
     if min_spike_time > 0:
         min_spike_time = 0
 
-    view = vv.RasterPlot(
+    if len(spike_times_sec) <= max_num_points:
+        return _create_raster_plot_view(
+            unit_ids=unit_ids,
+            spike_times_sec=spike_times_sec,
+            unit_indices=unit_indices,
+            start_time_sec=min_spike_time,
+            end_time_sec=max_spike_time,
+            height=height,
+        )
+
+    pyramid = RasterPyramid(
+        spike_times_sec=spike_times_sec,
+        unit_indices=unit_indices,
         start_time_sec=min_spike_time,
         end_time_sec=max_spike_time,
+    )
+    level = pyramid.get_level(max_num_points=max_num_points, max_points_per_bin=max_points_per_bin)
+    overview_times_sec, overview_unit_indices = level.get_plot_points(
+        start_time_sec=min_spike_time, max_points_per_bin=max_points_per_bin
+    )
+    v_overview = _create_raster_plot_view(
+        unit_ids=unit_ids,
+        spike_times_sec=overview_times_sec,
+        unit_indices=overview_unit_indices,
+        start_time_sec=min_spike_time,
+        end_time_sec=max_spike_time,
+        height=height,
+    )
+
+    # the window is shortened if it would contain more than max_num_points spikes
+    window_end_sec = min(min_spike_time + exact_window_sec, max_spike_time)
+    in_window = spike_times_sec < window_end_sec
+    if np.count_nonzero(in_window) > max_num_points:
+        window_end_sec = np.sort(spike_times_sec[in_window])[max_num_points]
+        in_window = spike_times_sec < window_end_sec
+    v_exact = _create_raster_plot_view(
+        unit_ids=unit_ids,
+        spike_times_sec=spike_times_sec[in_window],
+        unit_indices=unit_indices[in_window],
+        start_time_sec=min_spike_time,
+        end_time_sec=window_end_sec,
+        height=height,
+    )
+
+    print(
+        f"Raster plot: {len(spike_times_sec)} spikes, overview with {len(overview_times_sec)} points "
+        f"({level.bin_size_sec:g} sec bins, up to {max_points_per_bin} points per bin), exact spikes up to {window_end_sec:.1f} sec"
+    )
+    return vv.TabLayout(
+        items=[
+            vv.TabLayoutItem(label=f"Raster ({level.bin_size_sec:g} sec bins)", view=v_overview),
+            vv.TabLayoutItem(label=f"Raster (exact, {window_end_sec - min_spike_time:.0f} sec)", view=v_exact),
+        ]
+    )
+
+
+def _create_raster_plot_view(
+    *,
+    unit_ids,
+    spike_times_sec: np.ndarray,
+    unit_indices: np.ndarray,
+    start_time_sec: float,
+    end_time_sec: float,
+    height,
+):
+    # unit_indices must be non-decreasing
+    ends = np.searchsorted(unit_indices, np.arange(len(unit_ids)), side="right")
+    starts = np.concatenate([[0], ends[:-1]]).astype(np.int64)
+    spike_times_sec = spike_times_sec.astype(np.float32)
+    plot_items: List[vv.RasterPlotItem] = [
+        vv.RasterPlotItem(unit_id=unit_id, spike_times_sec=spike_times_sec[i1:i2])
+        for unit_id, i1, i2 in zip(unit_ids, starts, ends)
+    ]
+    view = vv.RasterPlot(
+        start_time_sec=start_time_sec,
+        end_time_sec=end_time_sec,
         plots=plot_items,
         height=height,
     )
     return view
 
 
-def create_autocorrelograms(*, sorting: si.BaseSorting):
+def create_autocorrelograms(*, sorting: Union[si.BaseSorting, UnitsData], num_workers: Optional[int] = 1):
+    unit_ids = sorting.get_unit_ids()
+    spike_trains = [
+        sorting.get_unit_spike_train(segment_index=0, unit_id=unit_id)
+        for unit_id in unit_ids
+    ]
+    a = compute_autocorrelograms(
+        spike_trains=spike_trains,
+        sampling_frequency=sorting.get_sampling_frequency(),
+        window_size_msec=50,
+        bin_size_msec=1,
+        num_workers=num_workers,
+    )
+    bin_edges_sec = a["bin_edges_sec"]
     autocorrelogram_items: List[vv.AutocorrelogramItem] = []
-    for unit_id in sorting.get_unit_ids():
-        a = compute_correlogram_data(
-            sorting=sorting,
-            unit_id1=unit_id,
-            unit_id2=None,
-            window_size_msec=50,
-            bin_size_msec=1,
-        )
-        bin_edges_sec = a["bin_edges_sec"]
-        bin_counts = a["bin_counts"]
+    for i, unit_id in enumerate(unit_ids):
         autocorrelogram_items.append(
             vv.AutocorrelogramItem(
-                unit_id=unit_id, bin_edges_sec=bin_edges_sec, bin_counts=bin_counts
+                unit_id=unit_id, bin_edges_sec=bin_edges_sec, bin_counts=a["bin_counts"][i]
             )
         )
     view = vv.Autocorrelograms(autocorrelograms=autocorrelogram_items)
     return view
 
 
+def create_cross_correlograms(*, sorting: Union[si.BaseSorting, UnitsData], unit_ids: Optional[List[Union[int, str]]] = None):
+    if unit_ids is None:
+        unit_ids = list(sorting.get_unit_ids())
+    spike_trains = [
+        sorting.get_unit_spike_train(segment_index=0, unit_id=unit_id)
+        for unit_id in unit_ids
+    ]
+    a = compute_correlogram_matrix(
+        spike_trains=spike_trains,
+        sampling_frequency=sorting.get_sampling_frequency(),
+        window_size_msec=50,
+        bin_size_msec=1,
+    )
+    bin_edges_sec = a["bin_edges_sec"]
+    bin_counts = a["bin_counts"]
+    cross_correlogram_items: List[vv.CrossCorrelogramItem] = []
+    for i, unit_id1 in enumerate(unit_ids):
+        for j, unit_id2 in enumerate(unit_ids):
+            cross_correlogram_items.append(
+                vv.CrossCorrelogramItem(
+                    unit_id1=unit_id1,
+                    unit_id2=unit_id2,
+                    bin_edges_sec=bin_edges_sec,
+                    bin_counts=bin_counts[i, j],
+                )
+            )
+    view = vv.CrossCorrelograms(cross_correlograms=cross_correlogram_items)
+    return view
+
+
 def create_units_table(*, unit_ids: List[Union[int, str]], file: h5py.File, units_path: Optional[str] = None):
     if units_path is None:
         units_path = "/units"
-    colnames = file[units_path].attrs["colnames"]
+    units_group = file[units_path]
+    colnames = [c.decode("utf-8") if isinstance(c, bytes) else str(c) for c in units_group.attrs["colnames"]]
+    unit_rows = _get_unit_rows(units_group["id"][()], unit_ids)
+    num_rows = units_group["id"].shape[0]
     columns: List[vv.UnitsTableColumn] = []
 
-    values_for_columns = {}
+    # each column is read with a single bulk read and reordered to the unit_ids
+    values_for_columns = []
     for c in colnames:
-        a = file[units_path][c]
-        if a.ndim == 1 and a.shape[0] == len(unit_ids):
+        if f"{c}_index" in units_group:
+            # ragged column: only the index is read, and the number of elements of each unit is shown
+            index = units_group[f"{c}_index"][()]
+            if index.ndim != 1 or index.shape[0] != num_rows:
+                continue
+            print(f"Found ragged column {c}")
+            dd = "int"
+            label = f"{c} (count)"
+            values = np.diff(index.astype(np.int64), prepend=0)
+        else:
+            a = units_group[c]
+            if a.ndim != 1 or a.shape[0] != num_rows:
+                continue
+            dd, values = _read_units_table_column(a)
+            if dd is None:
+                print(f"Skipping column {c} with dtype {a.dtype}")
+                continue
             print(f"Found column {c}")
-            if a.dtype == np.float32:
-                dd = "float"
-                values = a[()].tolist()
-            elif a.dtype == np.float64:
-                dd = "float"
-                values = a[()].astype(np.float32).tolist()
-            elif a.dtype == np.int32:
-                dd = "int"
-                values = a[()].tolist()
-            elif a.dtype == np.int64:
-                dd = "int"
-                values = a[()].astype(np.int32).tolist()
-            elif a.dtype == np.int16:
-                dd = "int"
-                values = a[()].astype(np.int32).tolist()
-            elif a.dtype == np.dtype("O"):
-                dd = "string"
-                values = [v.decode("utf-8") for v in a[()]]
-            elif a.dtype == np.dtype("S"):
-                dd = "string"
-                values = [v.decode("utf-8") for v in a[()]]
-            else:
-                dd = None
-                values = None
-            columns.append(vv.UnitsTableColumn(key=c, label=c, dtype=dd))
-            values_for_columns[c] = values
+            label = c
+        columns.append(vv.UnitsTableColumn(key=c, label=label, dtype=dd))
+        values_for_columns.append(values[unit_rows].tolist())
 
+    keys = [c.key for c in columns]
     rows: List[vv.UnitsTableRow] = []
-    for unit_id in unit_ids:
+    for i, unit_id in enumerate(unit_ids):
         values = {"unitId": unit_id}
-        for c in columns:
-            values[c.key] = values_for_columns[c.key][unit_id]
+        for key, column_values in zip(keys, values_for_columns):
+            values[key] = column_values[i]
         rows.append(vv.UnitsTableRow(unit_id=unit_id, values=values))
     view = vv.UnitsTable(columns=columns, rows=rows)
     return view
+
+
+def _read_units_table_column(a: h5py.Dataset):
+    # Returns the units table dtype and the values of a 1D column, or (None, None) if not supported
+    if a.dtype.kind == "f":
+        return "float", a[()].astype(np.float32)
+    if a.dtype.kind in ["i", "u"]:
+        return "int", a[()].astype(np.int32)
+    if a.dtype.kind == "S":
+        return "string", np.char.decode(a[()], "utf-8")
+    if h5py.check_string_dtype(a.dtype) is not None:
+        return "string", a.asstr()[()]
+    return None, None
+
+
+def _get_unit_rows(ids: np.ndarray, unit_ids: List[Union[int, str]]) -> np.ndarray:
+    # Row of each unit id in the units table, found by position in the id column
+    unit_ids_array = np.asarray(unit_ids)
+    if len(unit_ids_array) == 0:
+        return np.zeros((0,), dtype=np.int64)
+    if len(ids) == 0:
+        raise ValueError("The units table is empty")
+    sorter = np.argsort(ids, kind="stable")
+    positions = np.searchsorted(ids, unit_ids_array, sorter=sorter)
+    rows = sorter[np.minimum(positions, len(ids) - 1)]
+    if not np.array_equal(ids[rows], unit_ids_array):
+        raise ValueError("Not all unit ids were found in the units table")
+    return rows
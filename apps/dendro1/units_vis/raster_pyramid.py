@@ -0,0 +1,120 @@
+from typing import List
+import numpy as np
+
+
+class RasterPyramidLevel:
+    """The occupied (unit, time bin) pairs of all units at one time scale, with their spike counts."""
+    def __init__(self, *, bin_size_sec: float, unit_indices: np.ndarray, bin_indices: np.ndarray, counts: np.ndarray):
+        self.bin_size_sec = bin_size_sec
+        self.unit_indices = unit_indices
+        self.bin_indices = bin_indices
+        self.counts = counts
+
+    @property
+    def num_points(self) -> int:
+        return len(self.counts)
+
+    def get_num_plot_points(self, *, max_points_per_bin: int = 1) -> int:
+        """Number of points of get_plot_points with the same max_points_per_bin."""
+        return int(np.sum(np.minimum(self.counts, max_points_per_bin)))
+
+    def get_plot_points(self, *, start_time_sec: float, max_points_per_bin: int = 1):
+        """Returns raster points that show the spike counts of the bins.
+
+        Each bin gets min(count, max_points_per_bin) points, evenly spread
+        over the bin, so that the density of the plot follows the spike
+        count up to the cap.
+
+        Args:
+            start_time_sec (float): Start time of the first bin.
+            max_points_per_bin (int): Largest number of points of a bin.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The times of the points (sorted within each unit) and their unit indices (non-decreasing).
+        """
+        num_points = np.minimum(self.counts, max_points_per_bin)
+        total = int(np.sum(num_points))
+        bin_indices = np.repeat(self.bin_indices, num_points)
+        unit_indices = np.repeat(self.unit_indices, num_points)
+        repeated_num_points = np.repeat(num_points, num_points)
+        # position of each point within its bin
+        j = np.arange(total) - np.repeat(np.cumsum(num_points) - num_points, num_points)
+        times_sec = start_time_sec + (bin_indices + (j + 0.5) / repeated_num_points) * self.bin_size_sec
+        return times_sec, unit_indices
+
+
+class RasterPyramid:
+    """Binned spike counts of all units at several time scales.
+
+    The finest level is computed with a single pass over the flat spike
+    array, and each coarser level (bins larger by a constant factor) is
+    reduced from the previous one, so the cost does not depend on the number
+    of units. Only the occupied bins are stored, so the size of a level is
+    bounded by both the number of spikes and num_units * num_bins.
+    """
+    def __init__(
+        self,
+        *,
+        spike_times_sec: np.ndarray,
+        unit_indices: np.ndarray,
+        start_time_sec: float,
+        end_time_sec: float,
+        finest_bin_size_sec: float = 0.001,
+        factor: int = 4,
+    ):
+        """
+        Args:
+            spike_times_sec (np.ndarray): The spike times of all units, grouped by unit and sorted within each unit.
+            unit_indices (np.ndarray): The unit index of each spike, non-decreasing.
+            start_time_sec (float): Start time of the first bin.
+            end_time_sec (float): End time of the session.
+            finest_bin_size_sec (float): Bin size of the finest level.
+            factor (int): Ratio of the bin sizes of consecutive levels.
+        """
+        self.start_time_sec = start_time_sec
+        self.end_time_sec = end_time_sec
+        duration_sec = max(end_time_sec - start_time_sec, finest_bin_size_sec)
+
+        bin_size_sec = finest_bin_size_sec
+        num_bins = int(np.floor(duration_sec / bin_size_sec)) + 1
+        bin_indices = np.floor((spike_times_sec - start_time_sec) / bin_size_sec).astype(np.int64)
+        np.clip(bin_indices, 0, num_bins - 1, out=bin_indices)
+        keys = unit_indices.astype(np.int64) * num_bins + bin_indices
+        if len(keys) > 1 and np.any(keys[1:] < keys[:-1]):
+            keys = np.sort(keys)
+        keys, counts = _run_lengths(keys, np.ones(len(keys), dtype=np.int64))
+
+        self.levels: List[RasterPyramidLevel] = []
+        while True:
+            self.levels.append(
+                RasterPyramidLevel(
+                    bin_size_sec=bin_size_sec, unit_indices=keys // num_bins, bin_indices=keys % num_bins, counts=counts
+                )
+            )
+            if num_bins == 1:
+                break
+            # the keys stay sorted when coarsening, so no sort is needed
+            coarse_num_bins = (num_bins + factor - 1) // factor
+            keys = (keys // num_bins) * coarse_num_bins + (keys % num_bins) // factor
+            keys, counts = _run_lengths(keys, counts)
+            num_bins = coarse_num_bins
+            bin_size_sec = bin_size_sec * factor
+
+    def get_level(self, *, max_num_points: int, max_points_per_bin: int = 1) -> RasterPyramidLevel:
+        """Returns the finest level whose plot points fit in max_num_points (or the coarsest level).
+
+        With the default max_points_per_bin=1 this is the number of occupied
+        bins, see RasterPyramidLevel.get_plot_points.
+        """
+        for level in self.levels:
+            if level.get_num_plot_points(max_points_per_bin=max_points_per_bin) <= max_num_points:
+                return level
+        return self.levels[-1]
+
+
+def _run_lengths(keys: np.ndarray, weights: np.ndarray):
+    # Unique values of sorted keys, with the summed weights of each run
+    if len(keys) == 0:
+        return keys, weights
+    starts = np.concatenate([[0], np.flatnonzero(keys[1:] != keys[:-1]) + 1])
+    return keys[starts], np.add.reduceat(weights, starts)
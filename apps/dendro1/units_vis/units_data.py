@@ -0,0 +1,146 @@
+from typing import List, Union, Optional
+import numpy as np
+import h5py
+
+
+class UnitsData:
+    """The spike trains of all units, held as one flat array of spike frames plus the end offset of each unit.
+
+    It has the subset of the sorting interface used by the units_vis
+    stages (get_unit_ids, get_sampling_frequency, get_unit_spike_train),
+    and spike trains are returned as views into the flat array.
+    """
+    def __init__(
+        self,
+        *,
+        unit_ids: List[Union[int, str]],
+        spike_frames: np.ndarray,
+        spike_frames_index: np.ndarray,
+        sampling_frequency: float,
+    ):
+        """
+        Args:
+            unit_ids (List[Union[int, str]]): The unit IDs.
+            spike_frames (np.ndarray): The spike frames of all units, concatenated.
+            spike_frames_index (np.ndarray): End offset of the spike frames of each unit.
+            sampling_frequency (float): Sampling frequency in Hz.
+        """
+        self.unit_ids = list(unit_ids)
+        self.spike_frames = spike_frames
+        self.spike_frames_index = np.asarray(spike_frames_index, dtype=np.int64)
+        self.sampling_frequency = sampling_frequency
+        self._row_for_unit_id = {unit_id: row for row, unit_id in enumerate(self.unit_ids)}
+
+    def get_unit_ids(self) -> List[Union[int, str]]:
+        return self.unit_ids
+
+    def get_sampling_frequency(self) -> float:
+        return self.sampling_frequency
+
+    def get_num_spikes(self) -> np.ndarray:
+        return np.diff(self.spike_frames_index, prepend=0)
+
+    def get_unit_indices(self) -> np.ndarray:
+        """Returns the unit index of each spike in spike_frames."""
+        return np.repeat(np.arange(len(self.unit_ids)), self.get_num_spikes())
+
+    def get_unit_spike_train(self, unit_id, segment_index: int = 0) -> np.ndarray:
+        row = self._row_for_unit_id[unit_id]
+        i1 = self.spike_frames_index[row - 1] if row > 0 else 0
+        i2 = self.spike_frames_index[row]
+        return self.spike_frames[i1:i2]
+
+    def get_spike_trains(self, unit_ids: Optional[List[Union[int, str]]] = None) -> List[np.ndarray]:
+        if unit_ids is None:
+            unit_ids = self.unit_ids
+        return [self.get_unit_spike_train(unit_id) for unit_id in unit_ids]
+
+
+def get_units_data(sorting) -> UnitsData:
+    """Returns the spike trains of a sorting (or UnitsData, returned as is) as UnitsData."""
+    if isinstance(sorting, UnitsData):
+        return sorting
+    unit_ids = sorting.get_unit_ids()
+    spike_trains = [sorting.get_unit_spike_train(segment_index=0, unit_id=unit_id) for unit_id in unit_ids]
+    if len(spike_trains) > 0:
+        spike_frames = np.concatenate(spike_trains)
+    else:
+        spike_frames = np.zeros((0,), dtype=np.int64)
+    return UnitsData(
+        unit_ids=unit_ids,
+        spike_frames=spike_frames,
+        spike_frames_index=np.cumsum([len(st) for st in spike_trains]),
+        sampling_frequency=sorting.get_sampling_frequency(),
+    )
+
+
+def load_units_data(
+    file: h5py.File,
+    *,
+    units_path: Optional[str] = None,
+    sampling_frequency: Optional[float] = None,
+    samples_for_rate_estimation: int = 100000,
+) -> UnitsData:
+    """Loads the spike trains of a units table with h5py, without pynwb.
+
+    The ids and the ragged spike_times column are each read with a single
+    bulk read, and the spike times are converted to frames in one pass, as
+    in NwbSortingExtractor with preload_spike_trains=True.
+
+    Args:
+        file (h5py.File): The open NWB file.
+        units_path (str, optional): Path to the units table. Defaults to /units.
+        sampling_frequency (float, optional): Sampling frequency. If None, uses the ElectricalSeries in /acquisition.
+        samples_for_rate_estimation (int): Number of timestamps used to estimate the rate if the ElectricalSeries has no rate.
+
+    Returns:
+        UnitsData: The spike trains.
+    """
+    if units_path is None:
+        units_path = "/units"
+    units_group = file[units_path]
+    unit_ids = units_group["id"][()].tolist()
+    spike_times = units_group["spike_times"][()]
+    spike_times_index = units_group["spike_times_index"][()].astype(np.int64)
+
+    timestamps = None
+    if sampling_frequency is None:
+        electrical_series = _get_electrical_series_group(file)
+        if "starting_time" in electrical_series and "rate" in electrical_series["starting_time"].attrs:
+            sampling_frequency = float(electrical_series["starting_time"].attrs["rate"])
+        elif "timestamps" in electrical_series:
+            timestamps = electrical_series["timestamps"][()]
+            sampling_frequency = 1 / np.median(np.diff(timestamps[:samples_for_rate_estimation]))
+    if sampling_frequency is None:
+        raise ValueError("Couldn't load sampling frequency. Please provide it with the 'sampling_frequency' argument")
+
+    if timestamps is not None:
+        spike_frames = np.searchsorted(timestamps, spike_times).astype("int64")
+    else:
+        spike_frames = np.round(spike_times * sampling_frequency).astype("int64")
+    return UnitsData(
+        unit_ids=unit_ids,
+        spike_frames=spike_frames,
+        spike_frames_index=spike_times_index,
+        sampling_frequency=sampling_frequency,
+    )
+
+
+def _get_electrical_series_group(file: h5py.File) -> h5py.Group:
+    # the only ElectricalSeries in /acquisition, as in retrieve_electrical_series
+    electrical_series_list = []
+    if "acquisition" in file:
+        for name, item in file["acquisition"].items():
+            neurodata_type = item.attrs.get("neurodata_type", None)
+            if isinstance(neurodata_type, bytes):
+                neurodata_type = neurodata_type.decode("utf-8")
+            if neurodata_type == "ElectricalSeries":
+                electrical_series_list.append(item)
+    if len(electrical_series_list) > 1:
+        raise ValueError(
+            f"More than one acquisition found! You must specify 'sampling_frequency'. \n"
+            f"Options in current file are: {[e.name for e in electrical_series_list]}"
+        )
+    if len(electrical_series_list) == 0:
+        raise ValueError("No acquisitions found in the .nwb file.")
+    return electrical_series_list[0]
@@ -6,6 +6,10 @@ from dendro.sdk import ProcessorBase, InputFile, OutputFile
 from dendro.sdk import BaseModel, Field
 
 
+# Bump when the output changes, so that results in the result cache are not reused
+result_cache_version = "1"
+
+
 class UnitsVisContext(BaseModel):
     input: InputFile = Field(description="Input NWB file")
     output: OutputFile = Field(description="Output .figurl file")
@@ -17,6 +21,26 @@ class UnitsVisContext(BaseModel):
         default=None,
         description="Sampling frequency. If None, will try to read from the NWB file",
     )
+    include_cross_correlograms: bool = Field(
+        default=False,
+        description="Whether to include cross correlograms for all pairs of units",
+    )
+    num_workers: Optional[int] = Field(
+        default=None,
+        description="Number of processes for computing correlograms. If None, uses the number of CPUs available to the job",
+    )
+    max_raster_points: int = Field(
+        default=2000000,
+        description="Maximum number of points in the raster plot. Longer sessions are shown binned, plus the exact spikes of a window",
+    )
+    exact_raster_window_sec: float = Field(
+        default=300,
+        description="Duration of the window of exact spikes when the raster plot is binned",
+    )
+    single_pass: bool = Field(
+        default=False,
+        description="Open the NWB file once with h5py and compute all of the views from spike times loaded once",
+    )
 
 
 class UnitsVisProcessor(ProcessorBase):
@@ -28,17 +52,50 @@ class UnitsVisProcessor(ProcessorBase):
 
     @staticmethod
     def run(context: UnitsVisContext):
+        from result_cache import create_output_with_result_cache
         from .create_units_vis import create_units_vis
 
         url = context.input.get_url()
         units_path = context.units_path if context.units_path else None
         sampling_frequency = context.sampling_frequency
-
-        view = create_units_vis(url, units_path=units_path, sampling_frequency=sampling_frequency)
-        figurl = view.url(label="Units visualization")
+        include_cross_correlograms = context.include_cross_correlograms
+        num_workers = context.num_workers
+        max_raster_points = context.max_raster_points
+        exact_raster_window_sec = context.exact_raster_window_sec
+        single_pass = context.single_pass
 
         output_fname = "output.figurl"
-        with open(output_fname, "w") as f:
-            f.write(figurl)
+
+        def create_output():
+            view = create_units_vis(
+                url,
+                units_path=units_path,
+                sampling_frequency=sampling_frequency,
+                include_cross_correlograms=include_cross_correlograms,
+                num_workers=num_workers,
+                max_raster_points=max_raster_points,
+                exact_raster_window_sec=exact_raster_window_sec,
+                single_pass=single_pass,
+            )
+            figurl = view.url(label="Units visualization")
+            with open(output_fname, "w") as f:
+                f.write(figurl)
+
+        # num_workers does not affect the output
+        create_output_with_result_cache(
+            output_fname=output_fname,
+            create_output=create_output,
+            processor_name=UnitsVisProcessor.name,
+            processor_version=result_cache_version,
+            get_input_urls=lambda: [url],
+            parameters=dict(
+                units_path=units_path,
+                sampling_frequency=sampling_frequency,
+                include_cross_correlograms=include_cross_correlograms,
+                max_raster_points=max_raster_points,
+                exact_raster_window_sec=exact_raster_window_sec,
+                single_pass=single_pass,
+            ),
+        )
 
         context.output.upload(output_fname)
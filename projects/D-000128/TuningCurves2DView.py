@@ -13,15 +13,34 @@ class TuningCurves2DView:
         y_bin_positions: np.ndarray,
         unit_ids: List[Union[str, int]],
         unit_num_spikes: List[int],
+        compress: bool = True,
     ):
+        """
+        Args:
+            rate_maps (List[np.ndarray]): One (num_x_bins, num_y_bins) rate map per unit.
+            x_bin_positions (np.ndarray): Centers of the x bins.
+            y_bin_positions (np.ndarray): Centers of the y bins.
+            unit_ids (List[Union[str, int]]): The unit IDs.
+            unit_num_spikes (List[int]): Number of spikes of each unit.
+            compress (bool): Whether to zlib-compress the arrays (sent as data_gzip_b64, which the figurl viewers decode).
+        """
         self.rate_maps = rate_maps
         self.x_bin_positions = x_bin_positions
         self.y_bin_positions = y_bin_positions
         self.unit_ids = unit_ids
         self.unit_num_spikes = unit_num_spikes
+        self.compress = compress
 
     def get_view_url(self, *, label: str):
-        view_data = figurl.serialize_data(
+        view_data = self.get_view_data()
+        data_uri = kcl.store_json(view_data)
+        v = 'https://figurl-tuning-curves-1.surge.sh'
+        view_url = f"https://figurl.org/f?v={v}&d={data_uri}&label={label}"
+        return view_url
+
+    def get_view_data(self) -> dict:
+        """Returns the serialized view data."""
+        return figurl.serialize_data(
             {
                 "type": "tuning_curves_2d",
                 "tuning_curves_2d": [
@@ -34,9 +53,6 @@ class TuningCurves2DView:
                 ],
                 "x_bin_positions": self.x_bin_positions.astype(np.float32),
                 "y_bin_positions": self.y_bin_positions.astype(np.float32),
-            }
+            },
+            compress_npy=self.compress
         )
-        data_uri = kcl.store_json(view_data)
-        v = 'https://figurl-tuning-curves-1.surge.sh'
-        view_url = f"https://figurl.org/f?v={v}&d={data_uri}&label={label}"
-        return view_url
@@ -0,0 +1,68 @@
+import json
+import time
+import zlib
+import base64
+import numpy as np
+from TuningCurves2DView import TuningCurves2DView
+
+
+# Compares the payload size and serialization time of the tuning curves view
+# data with and without zlib compression of the arrays, on synthetic rate maps
+
+
+def main():
+    num_units = 300
+    num_bins = 100
+    rate_maps, x_bin_positions, y_bin_positions = _create_rate_maps(num_units=num_units, num_bins=num_bins)
+    kwargs = dict(
+        rate_maps=[rate_maps[i] for i in range(num_units)],
+        x_bin_positions=x_bin_positions,
+        y_bin_positions=y_bin_positions,
+        unit_ids=list(range(num_units)),
+        unit_num_spikes=[1000] * num_units,
+    )
+    print(f'{num_units} units, {num_bins} x {num_bins} bins')
+    print(f'{"compress":<10}{"size (MB)":>12}{"time (sec)":>12}{"max error":>12}')
+    for compress in [False, True]:
+        V = TuningCurves2DView(**kwargs, compress=compress)
+        timer = time.time()
+        payload = json.dumps(V.get_view_data())
+        elapsed = time.time() - timer
+        max_error = _get_max_error(json.loads(payload), rate_maps)
+        print(f'{str(compress):<10}{len(payload) / 1e6:>12.2f}{elapsed:>12.3f}{max_error:>12.3g}')
+
+
+def _create_rate_maps(*, num_units: int, num_bins: int):
+    # gaussian place fields with noise, and a ring of unoccupied bins
+    x = np.linspace(0, 1, num_bins)
+    y = np.linspace(0, 1, num_bins)
+    xx, yy = np.meshgrid(x, y, indexing='ij')
+    rng = np.random.default_rng(0)
+    centers = rng.uniform(0, 1, size=(num_units, 2))
+    peaks = rng.uniform(1, 30, size=num_units)
+    rate_maps = peaks[:, None, None] * np.exp(
+        -((xx - centers[:, 0, None, None]) ** 2 + (yy - centers[:, 1, None, None]) ** 2) / (2 * 0.1 ** 2)
+    )
+    rate_maps += rng.exponential(0.5, size=rate_maps.shape)
+    rate_maps[:, (xx - 0.5) ** 2 + (yy - 0.5) ** 2 > 0.25] = np.nan
+    return rate_maps.astype(np.float32), x, y
+
+
+def _get_max_error(view_data: dict, rate_maps: np.ndarray) -> float:
+    values = np.stack([_decode_ndarray(a['values']) for a in view_data['tuning_curves_2d']])
+    if not np.array_equal(np.isnan(values), np.isnan(rate_maps)):
+        return np.inf
+    return float(np.nanmax(np.abs(values - rate_maps)))
+
+
+def _decode_ndarray(x: dict) -> np.ndarray:
+    # (figurl.deserialize_data does not decode data_gzip_b64)
+    if 'data_gzip_b64' in x:
+        data = zlib.decompress(base64.b64decode(x['data_gzip_b64']))
+    else:
+        data = base64.b64decode(x['data_b64'])
+    return np.frombuffer(data, dtype=x['dtype']).reshape(x['shape'])
+
+
+if __name__ == '__main__':
+    main()
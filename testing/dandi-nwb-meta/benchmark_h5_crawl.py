@@ -0,0 +1,121 @@
+import os
+import sys
+import json
+import time
+import tempfile
+import h5py
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'range-http-server'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'apps', 'dendro1'))
+
+from range_http_server import start_range_http_server  # noqa: E402
+from remote_file import open_remote_file  # noqa: E402
+from dandi_nwb_meta import _crawl_h5_metadata, _dtype_to_str  # noqa: E402
+
+
+# Compares the single-pass metadata crawl with the previous recursive crawl
+# (a walk for the groups and another for the datasets, reading every
+# attribute through a JSON round trip) on a synthetic, deeply nested file with
+# soft and hard links, served over HTTP range requests.
+
+
+def main():
+    depth = 6
+    fanout = 3
+    with tempfile.TemporaryDirectory() as tmpdir:
+        # the same file under two names, so that the two crawls don't share the block cache
+        for fname in ['nested1.h5', 'nested2.h5']:
+            _create_nested_file(os.path.join(tmpdir, fname), depth=depth, fanout=fanout)
+        server, base_url = start_range_http_server(tmpdir)
+        try:
+            legacy, legacy_elapsed, legacy_requests = _time_crawl(
+                f'{base_url}/nested1.h5', server, _legacy_crawl_h5_metadata
+            )
+            new, new_elapsed, new_requests = _time_crawl(
+                f'{base_url}/nested2.h5', server, lambda f: _crawl_h5_metadata(f).dict()
+            )
+        finally:
+            server.shutdown()
+    print(f'Synthetic file: depth {depth}, fanout {fanout}, {len(new["groups"])} groups, {len(new["datasets"])} datasets')
+    print(f'Previous crawl: {legacy_elapsed:.2f} sec, {legacy_requests} requests')
+    print(f'Single-pass crawl: {new_elapsed:.2f} sec, {new_requests} requests')
+    print(f'Outputs match: {legacy == new}')
+
+
+def _time_crawl(url: str, server, crawl):
+    request_count_before = server.request_count
+    timer = time.time()
+    with h5py.File(open_remote_file(url), 'r') as h5_file:
+        result = crawl(h5_file)
+    elapsed = time.time() - timer
+    return result, elapsed, server.request_count - request_count_before
+
+
+def _create_nested_file(path: str, *, depth: int, fanout: int):
+    with h5py.File(path, 'w') as f:
+        f.attrs['description'] = 'synthetic nested file'
+
+        def _fill(group: h5py.Group, level: int):
+            group.attrs['level'] = level
+            group.attrs['neurodata_type'] = 'Group'
+            group.create_dataset('data', data=np.arange(10, dtype=np.float32)).attrs['unit'] = 'volts'
+            group.create_dataset('no_attrs', data=np.zeros((2, 3), dtype=np.int16))
+            if level == depth:
+                return
+            for i in range(fanout):
+                _fill(group.create_group(f'g{i}'), level + 1)
+
+        _fill(f, 1)
+        # as in NWB files, e.g. the device of an ElectrodeGroup
+        f['g0/device'] = h5py.SoftLink('/g1')
+        f['g2/data_link'] = f['g1/data']
+
+
+def _legacy_crawl_h5_metadata(h5_file: h5py.File) -> dict:
+    groups = []
+    datasets = []
+
+    def _process_node(node: h5py.Group):
+        groups.append({'path': node.name, 'attrs': json.loads(_legacy_attrs_to_json(node))})
+        for child in node.values():
+            if isinstance(child, h5py.Group):
+                _process_node(child)
+
+    def _process_node_datasets(node: h5py.Group):
+        for child in node.values():
+            if isinstance(child, h5py.Dataset):
+                datasets.append({
+                    'path': child.name,
+                    'attrs': json.loads(_legacy_attrs_to_json(child)),
+                    'shape': [int(dim) for dim in child.shape],
+                    'dtype': _dtype_to_str(child)
+                })
+            elif isinstance(child, h5py.Group):
+                _process_node_datasets(child)
+
+    _process_node(h5_file)
+    _process_node_datasets(h5_file)
+    return {'groups': groups, 'datasets': datasets}
+
+
+def _legacy_attrs_to_json(group) -> str:
+    attrs_dict = {}
+    for attr_name in group.attrs:
+        value = group.attrs[attr_name]
+        if isinstance(value, np.ndarray):
+            value = value.tolist()
+        elif isinstance(value, np.int64):
+            value = int(value)
+        elif isinstance(value, h5py.Reference):
+            value = str(value)
+        try:
+            json.dumps(value)
+        except TypeError:
+            value = "Not JSON serializable"
+        attrs_dict[attr_name] = value
+    return json.dumps(attrs_dict)
+
+
+if __name__ == '__main__':
+    main()
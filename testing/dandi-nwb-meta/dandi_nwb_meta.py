@@ -1,87 +1,273 @@
 import os
-import dandi.dandiarchive as da
+import sys
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import urlparse
 import json
 import h5py
-from typing import List
+from typing import List, Dict, Tuple, Set
 from typing import Union
 from pydantic import BaseModel, Field
 import numpy as np
-import remfile
 import gzip
+from dandi_nwb_meta_columnar import write_columnar_dandiset, ColumnarDandiNwbMeta
 
+# the remote file layer is shared with the dendro1 app
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'apps', 'dendro1'))
+
+from remote_file import open_remote_file, get_remote_file_stats, configure_remote_files, close_remote_files  # noqa: E402
+
+
+# The crawl reads only the HDF5 metadata, so each worker process needs a
+# much smaller block cache than the remote file default
+worker_max_cache_bytes = 64 * 1024 * 1024
+
+
+def process_dandiset(
+    dandiset_id: str,
+    output_fname: str,
+    *,
+    num_workers: int = 1,
+    max_assets_per_second_per_host: Union[float, None] = None
+):
+    """Crawls the HDF5 metadata of all NWB assets in a dandiset.
+
+    Args:
+        dandiset_id (str): The dandiset identifier, e.g. '000713'.
+        output_fname (str): Output .json, .json.gz or .h5 file (columnar layout, see dandi_nwb_meta_columnar). Assets already in this file are not crawled again.
+        num_workers (int): Number of assets to crawl concurrently.
+        max_assets_per_second_per_host (float, optional): Limits how often a new asset crawl is started against the same host, across all workers.
+
+    Assets that fail to crawl are reported and left out of the output, so
+    that they are crawled again on the next run.
+    """
+    # Previous results are indexed by asset_id as plain dicts. They are
+    # written back out as they are, so they are never parsed into models.
+    existing_assets_by_id = _load_existing_assets_by_id(output_fname)
+    cache_dir = f'cache/{dandiset_id}'
+    cached_asset_ids = set(os.listdir(cache_dir)) if os.path.isdir(cache_dir) else set()
+    # imported here so that the metadata crawl can be used without dandi
+    import dandi.dandiarchive as da
 
-def process_dandiset(dandiset_id: str, output_fname: str):
-    if os.path.exists(output_fname):
-        if output_fname.endswith(".gz"):
-            with open(output_fname, "rb") as f:
-                existing = json.loads(gzip.decompress(f.read()))
-                existing = DandiNwbMetaDandiset(**existing)
-        else:
-            with open(output_fname, "r") as f:
-                existing = json.load(f)
-                existing = DandiNwbMetaDandiset(**existing)
-    else:
-        existing = None
     parsed_url = da.parse_dandi_url(f"https://dandiarchive.org/dandiset/{dandiset_id}")
-    X = DandiNwbMetaDandiset(
-        dandiset_id=dandiset_id, dandiset_version="draft", nwb_assets=[]
-    )
+    # results are collected by position so that the output order matches the asset order
+    results: List[Union[dict, None]] = []
+    tasks: List[Tuple[int, dict]] = []
     with parsed_url.navigate() as (client, dandiset, assets):
         asset_num = 0
         for asset in dandiset.get_assets():
             asset_num += 1
             if asset.path.endswith(".nwb"):
-                item = next(
-                    (x for x in existing.nwb_assets if x.asset_id == asset.identifier),
-                    None,
-                ) if existing else None
+                item = existing_assets_by_id.get(asset.identifier)
                 if item:
-                    print(f"{asset_num}: {X.dandiset_id} | {asset.path} | already processed")
-                    X.nwb_assets.append(item)
+                    print(f"{asset_num}: {dandiset_id} | {asset.path} | already processed")
+                    results.append(item)
                     continue
-                if os.path.exists(f'cache/{dandiset_id}/{asset.identifier}'):
-                    with open(f'cache/{dandiset_id}/{asset.identifier}', 'r') as f:
-                        item = json.load(f)
-                        item = DandiNwbMetaAsset(**item)
-                        print(f"{asset_num}: {X.dandiset_id} | {asset.path} | from cache")
-                        X.nwb_assets.append(item)
+                if asset.identifier in cached_asset_ids:
+                    item = _load_cached_asset(f'{cache_dir}/{asset.identifier}')
+                    if item:
+                        print(f"{asset_num}: {dandiset_id} | {asset.path} | from cache")
+                        results.append(item)
                         continue
-                print(f"{asset_num}: {X.dandiset_id} | {asset.path}")
-                A = DandiNwbMetaAsset(
+                tasks.append((len(results), dict(
+                    dandiset_id=dandiset_id,
+                    asset_num=asset_num,
                     asset_id=asset.identifier,
                     asset_path=asset.path,
-                    nwb_metadata=DandiNWbMetaAssetNwbMetadata(groups=[], datasets=[]),
-                )
-                file = remfile.File(asset.download_url, verbose=False)
-                with h5py.File(file, "r") as h5_file:
-                    all_groups_in_h5_file = _get_h5_groups(h5_file)
-                    for group in all_groups_in_h5_file:
-                        A.nwb_metadata.groups.append(
-                            H5MetadataGroup(
-                                path=group.name, attrs=json.loads(_attrs_to_json(group))
-                            )
-                        )
-                    all_datasets_in_h5_file = _get_h5_datasets(h5_file)
-                    for dataset in all_datasets_in_h5_file:
-                        dtype = _dtype_to_str(dataset)
-                        A.nwb_metadata.datasets.append(
-                            H5MetadataDataset(
-                                path=dataset.name,
-                                attrs=json.loads(_attrs_to_json(dataset)),
-                                shape=_format_shape(dataset),
-                                dtype=dtype,
-                            )
-                        )
-                X.nwb_assets.append(A)
-                os.makedirs(f'cache/{dandiset_id}', exist_ok=True)
-                with open(f'cache/{dandiset_id}/{asset.identifier}', 'w') as f:
-                    json.dump(A.dict(), f, indent=2)
-    if output_fname.endswith(".gz"):
+                    download_url=asset.download_url
+                )))
+                results.append(None)
+    failed_assets = _crawl_assets(
+        tasks,
+        results,
+        num_workers=num_workers,
+        max_assets_per_second_per_host=max_assets_per_second_per_host
+    )
+    if failed_assets:
+        print(f"Failed to crawl {len(failed_assets)} of {len(tasks)} assets:")
+        for a in failed_assets:
+            print(f"  {a['asset_num']}: {a['asset_path']} | {a['error']}")
+    X = {
+        'dandiset_id': dandiset_id,
+        'dandiset_version': 'draft',
+        'nwb_assets': [item for item in results if item is not None]
+    }
+    if output_fname.endswith(".h5"):
+        write_columnar_dandiset(X, output_fname)
+    elif output_fname.endswith(".gz"):
         with gzip.open(output_fname, "wb") as f:
-            f.write(json.dumps(X.dict()).encode())
+            f.write(json.dumps(X).encode())
     else:
         with open(output_fname, "w") as f:
-            json.dump(X.dict(), f, indent=2)
+            json.dump(X, f, indent=2)
+
+
+def _load_existing_assets_by_id(output_fname: str) -> Dict[str, dict]:
+    """Returns the assets of a previous output file keyed by asset_id."""
+    if not os.path.exists(output_fname):
+        return {}
+    if output_fname.endswith(".h5"):
+        with ColumnarDandiNwbMeta(output_fname) as m:
+            existing = m.load_dandiset()
+    elif output_fname.endswith(".gz"):
+        with open(output_fname, "rb") as f:
+            existing = json.loads(gzip.decompress(f.read()))
+    else:
+        with open(output_fname, "r") as f:
+            existing = json.load(f)
+    return {a['asset_id']: a for a in existing['nwb_assets']}
+
+
+def _load_cached_asset(path: str) -> Union[dict, None]:
+    """Returns the cached metadata of an asset, or None if the cache file is unreadable."""
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # e.g., a partially written file from before cache writes were atomic
+        return None
+
+
+def _crawl_assets(
+    tasks: List[Tuple[int, dict]],
+    results: list,
+    *,
+    num_workers: int,
+    max_assets_per_second_per_host: Union[float, None]
+) -> List[dict]:
+    """Crawls the assets described by tasks and stores their metadata at the given positions in results.
+
+    Assets are crawled in separate processes because h5py holds a global lock
+    while it reads from a Python file object, so threads would not overlap the
+    network round trips. At most num_workers assets are in flight at a time.
+    An asset that fails (including when its worker process dies) is recorded
+    and its position in results is left as None.
+
+    Returns:
+        List[dict]: The asset_num, asset_id, asset_path and error of each failed asset.
+    """
+    failed_assets: List[dict] = []
+    if len(tasks) == 0:
+        return failed_assets
+    rate_limiter = _HostRateLimiter(
+        hosts={urlparse(task['download_url']).netloc for _, task in tasks},
+        min_interval_sec=1 / max_assets_per_second_per_host if max_assets_per_second_per_host else 0
+    )
+    timer = time.time()
+    num_completed = 0
+    executor = _create_worker_pool(num_workers, rate_limiter)
+    try:
+        in_flight: Dict[Future, Tuple[int, dict]] = {}
+        next_task = 0
+        while next_task < len(tasks) or in_flight:
+            while next_task < len(tasks) and len(in_flight) < num_workers:
+                i, task = tasks[next_task]
+                next_task += 1
+                in_flight[executor.submit(_process_asset, **task)] = (i, task)
+            done, _ = wait(list(in_flight.keys()), return_when=FIRST_COMPLETED)
+            pool_broken = False
+            for future in done:
+                i, task = in_flight.pop(future)
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    print(f"{task['asset_num']}: error crawling {task['asset_path']}: {e!r}")
+                    failed_assets.append(dict(
+                        asset_num=task['asset_num'],
+                        asset_id=task['asset_id'],
+                        asset_path=task['asset_path'],
+                        error=repr(e)
+                    ))
+                    pool_broken = pool_broken or isinstance(e, BrokenProcessPool)
+                num_completed += 1
+            if pool_broken:
+                # A worker process died, which fails all of the assets in
+                # flight, so continue with a new pool
+                for future, (i, task) in in_flight.items():
+                    failed_assets.append(dict(
+                        asset_num=task['asset_num'],
+                        asset_id=task['asset_id'],
+                        asset_path=task['asset_path'],
+                        error=repr(BrokenProcessPool('A worker process terminated abruptly'))
+                    ))
+                    num_completed += 1
+                in_flight = {}
+                executor.shutdown(wait=False)
+                executor = _create_worker_pool(num_workers, rate_limiter)
+            elapsed_min = (time.time() - timer) / 60
+            print(f"Crawled {num_completed} of {len(tasks)} assets ({len(failed_assets)} failed) | {num_completed / elapsed_min:.1f} assets/min")
+    finally:
+        executor.shutdown()
+    return failed_assets
+
+
+def _create_worker_pool(num_workers: int, rate_limiter: "_HostRateLimiter") -> ProcessPoolExecutor:
+    return ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker, initargs=(rate_limiter,))
+
+
+_worker_rate_limiter: Union["_HostRateLimiter", None] = None
+
+
+def _init_worker(rate_limiter: "_HostRateLimiter"):
+    global _worker_rate_limiter
+    _worker_rate_limiter = rate_limiter
+    configure_remote_files(max_cache_bytes=worker_max_cache_bytes)
+
+
+def _process_asset(
+    *,
+    dandiset_id: str,
+    asset_num: int,
+    asset_id: str,
+    asset_path: str,
+    download_url: str
+) -> dict:
+    """Crawls the HDF5 metadata of a single asset and writes it to the cache."""
+    if _worker_rate_limiter is not None:
+        # in the worker, so that the limit applies to when the crawl actually starts
+        _worker_rate_limiter.wait(download_url)
+    print(f"{asset_num}: {dandiset_id} | {asset_path}")
+    try:
+        with open_remote_file(download_url) as file, h5py.File(file, "r") as h5_file:
+            A = DandiNwbMetaAsset(
+                asset_id=asset_id,
+                asset_path=asset_path,
+                nwb_metadata=_crawl_h5_metadata(h5_file),
+            )
+        print(f"{asset_num}: remote file stats: {get_remote_file_stats(download_url)}")
+    finally:
+        # release the HTTP session and cached blocks of this asset
+        close_remote_files(download_url)
+    item = A.dict()
+    # Write to a temporary file and rename it so that an interrupted run
+    # never leaves a partial cache file behind
+    os.makedirs(f'cache/{dandiset_id}', exist_ok=True)
+    tmp_path = f'cache/{dandiset_id}/.{asset_id}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(item, f, indent=2)
+    os.replace(tmp_path, f'cache/{dandiset_id}/{asset_id}')
+    return item
+
+
+class _HostRateLimiter:
+    """Spaces out the start of asset crawls against the same host, across worker processes."""
+    def __init__(self, *, hosts: Set[str], min_interval_sec: float):
+        self._min_interval_sec = min_interval_sec
+        # the earliest time at which the next crawl may start, per host, in shared memory
+        self._next_start_times = {host: multiprocessing.Value('d', 0.0) for host in hosts}
+
+    def wait(self, url: str):
+        if self._min_interval_sec <= 0:
+            return
+        next_start_time = self._next_start_times[urlparse(url).netloc]
+        with next_start_time.get_lock():
+            start_time = max(time.time(), next_start_time.value)
+            next_start_time.value = start_time + self._min_interval_sec
+        delay = start_time - time.time()
+        if delay > 0:
+            time.sleep(delay)
 
 
 class H5MetadataGroup(BaseModel):
@@ -113,49 +299,45 @@ class DandiNwbMetaDandiset(BaseModel):
     nwb_assets: List[DandiNwbMetaAsset] = Field(description="List of assets")
 
 
-def _get_h5_groups(h5_file: h5py.File) -> list:
-    """Returns a list of all groups in an h5 file.
+def _crawl_h5_metadata(h5_file: h5py.File) -> DandiNWbMetaAssetNwbMetadata:
+    """Collects the groups and datasets of an h5 file, with their attributes, in a single pass.
+
+    The links of each group are followed in order, as h5py lists them, so the
+    paths are the same as those of a separate recursion for groups and for
+    datasets: objects reached through soft links (e.g. the device of an NWB
+    ElectrodeGroup) are listed under the link path, and objects with several
+    hard links are listed under each of them. Dangling links are skipped.
 
     Args:
         h5_file (h5py.File): The h5 file.
 
     Returns:
-        list: A list of all groups in the h5 file.
+        DandiNWbMetaAssetNwbMetadata: The groups (in depth-first order, starting with the root) and datasets.
     """
     groups = []
+    datasets = []
 
     def _process_node(node: h5py.Group):
-        groups.append(node)
+        groups.append(H5MetadataGroup(path=node.name, attrs=_attrs_to_dict(node)))
         for child in node.values():
             if isinstance(child, h5py.Group):
                 _process_node(child)
-    _process_node(h5_file)
-    return groups
-
-
-def _get_h5_datasets(h5_file: h5py.File) -> list:
-    """Returns a list of all datasets in an h5 file.
-
-    Args:
-        h5_file (h5py.File): The h5 file.
-
-    Returns:
-        list: A list of all datasets in the h5 file.
-    """
-    datasets = []
+            elif isinstance(child, h5py.Dataset):
+                datasets.append(
+                    H5MetadataDataset(
+                        path=child.name,
+                        attrs=_attrs_to_dict(child),
+                        shape=_format_shape(child),
+                        dtype=_dtype_to_str(child),
+                    )
+                )
 
-    def _process_node(node: h5py.Group):
-        for child in node.values():
-            if isinstance(child, h5py.Dataset):
-                datasets.append(child)
-            elif isinstance(child, h5py.Group):
-                _process_node(child)
     _process_node(h5_file)
-    return datasets
+    return DandiNWbMetaAssetNwbMetadata(groups=groups, datasets=datasets)
 
 
-def _attrs_to_json(group: Union[h5py.Group, h5py.Dataset]) -> str:
-    """Converts the attributes of an HDF5 group or dataset to a JSON-serializable format."""
+def _attrs_to_dict(group: Union[h5py.Group, h5py.Dataset]) -> dict:
+    """Converts the attributes of an HDF5 group or dataset to JSON-compatible values."""
     attrs_dict = {}
     for attr_name in group.attrs:
         value = group.attrs[attr_name]
@@ -170,15 +352,51 @@ def _attrs_to_json(group: Union[h5py.Group, h5py.Dataset]) -> str:
         elif isinstance(value, h5py.Reference):
             value = str(value)
 
-        # check if json serializable
-        try:
-            json.dumps(value)
-        except TypeError:
-            value = "Not JSON serializable"
-
-        attrs_dict[attr_name] = value
-
-    return json.dumps(attrs_dict)
+        attrs_dict[attr_name] = _to_json_value(value)
+
+    return attrs_dict
+
+
+_not_json_serializable = object()
+
+
+def _to_json_value(value):
+    """Returns the value as json.loads(json.dumps(value)) would, or "Not JSON serializable"."""
+    value = _to_json_value_or_marker(value)
+    return "Not JSON serializable" if value is _not_json_serializable else value
+
+
+def _to_json_value_or_marker(value):
+    if value is None or isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        return str(value)
+    if isinstance(value, int):
+        return int(value)
+    if isinstance(value, float):
+        return float(value)
+    if isinstance(value, (list, tuple)):
+        out = []
+        for v in value:
+            v = _to_json_value_or_marker(v)
+            if v is _not_json_serializable:
+                return _not_json_serializable
+            out.append(v)
+        return out
+    if isinstance(value, dict):
+        out = {}
+        for k, v in value.items():
+            if k is None or isinstance(k, (bool, int, float)):
+                # json converts these keys to strings
+                k = json.loads(json.dumps({k: 0})).popitem()[0]
+            elif not isinstance(k, str):
+                return _not_json_serializable
+            v = _to_json_value_or_marker(v)
+            if v is _not_json_serializable:
+                return _not_json_serializable
+            out[str(k)] = v
+        return out
+    return _not_json_serializable
 
 
 def _dtype_to_str(dataset: h5py.Dataset) -> str:
@@ -0,0 +1,270 @@
+import json
+from typing import List, Union
+import h5py
+import numpy as np
+
+
+# Columnar layout of the dandi_nwb_meta output:
+#
+# /                 attrs: format, format_version, dandiset_id, dandiset_version
+# /assets           asset_id, asset_path
+# /groups           asset_index, path, attrs
+# /datasets         asset_index, path, attrs, dtype, ndim, shape
+#
+# Each table is a group with one dataset per column. Rows of groups and
+# datasets refer to their asset by position in /assets. String columns are
+# stored as a single utf-8 byte array (<name>_data) plus end offsets
+# (<name>_index), like ragged columns in NWB. attrs are JSON strings, and
+# shape is padded with -1 up to the largest ndim. All columns are compressed.
+
+columnar_format = 'dandi_nwb_meta_columnar'
+columnar_format_version = 1
+
+
+def write_columnar_dandiset(X: dict, output_fname: str):
+    """Writes dandiset metadata (as in the JSON output) in the columnar layout.
+
+    Args:
+        X (dict): The dandiset metadata, with dandiset_id, dandiset_version and nwb_assets.
+        output_fname (str): The output .h5 file.
+    """
+    assets = X['nwb_assets']
+    group_asset_indices = []
+    group_paths = []
+    group_attrs = []
+    dataset_asset_indices = []
+    dataset_paths = []
+    dataset_attrs = []
+    dataset_dtypes = []
+    dataset_shapes = []
+    for i, a in enumerate(assets):
+        for g in a['nwb_metadata']['groups']:
+            group_asset_indices.append(i)
+            group_paths.append(g['path'])
+            group_attrs.append(json.dumps(g['attrs']))
+        for d in a['nwb_metadata']['datasets']:
+            dataset_asset_indices.append(i)
+            dataset_paths.append(d['path'])
+            dataset_attrs.append(json.dumps(d['attrs']))
+            dataset_dtypes.append(d['dtype'])
+            dataset_shapes.append(d['shape'])
+    max_ndim = max([len(s) for s in dataset_shapes], default=0)
+    shape = np.full((len(dataset_shapes), max_ndim), -1, dtype=np.int64)
+    for i, s in enumerate(dataset_shapes):
+        shape[i, :len(s)] = s
+    with h5py.File(output_fname, 'w') as f:
+        f.attrs['format'] = columnar_format
+        f.attrs['format_version'] = columnar_format_version
+        f.attrs['dandiset_id'] = X['dandiset_id']
+        f.attrs['dandiset_version'] = X['dandiset_version']
+        assets_group = f.create_group('assets')
+        _write_string_column(assets_group, 'asset_id', [a['asset_id'] for a in assets])
+        _write_string_column(assets_group, 'asset_path', [a['asset_path'] for a in assets])
+        groups_group = f.create_group('groups')
+        _write_column(groups_group, 'asset_index', np.array(group_asset_indices, dtype=np.int32))
+        _write_string_column(groups_group, 'path', group_paths)
+        _write_string_column(groups_group, 'attrs', group_attrs)
+        datasets_group = f.create_group('datasets')
+        _write_column(datasets_group, 'asset_index', np.array(dataset_asset_indices, dtype=np.int32))
+        _write_string_column(datasets_group, 'path', dataset_paths)
+        _write_string_column(datasets_group, 'attrs', dataset_attrs)
+        _write_string_column(datasets_group, 'dtype', dataset_dtypes)
+        _write_column(datasets_group, 'ndim', np.array([len(s) for s in dataset_shapes], dtype=np.int8))
+        _write_column(datasets_group, 'shape', shape)
+
+
+class ColumnarDandiNwbMeta:
+    """Query access to dandiset metadata in the columnar layout.
+
+    Queries only read the columns used by their predicates, plus the columns
+    that are returned for the matching rows.
+
+    Example:
+        with ColumnarDandiNwbMeta('000713.h5') as m:
+            rows = m.find_datasets(path='/acquisition/ElectricalSeries/data', ndim=2)
+    """
+    def __init__(self, fname: str):
+        """
+        Args:
+            fname (str): Path to the .h5 file written by write_columnar_dandiset.
+        """
+        self._file = h5py.File(fname, 'r')
+        if self._file.attrs.get('format') != columnar_format:
+            self._file.close()
+            raise ValueError(f'Not a {columnar_format} file: {fname}')
+        self._columns = {}
+
+    @property
+    def dandiset_id(self) -> str:
+        return self._file.attrs['dandiset_id']
+
+    @property
+    def dandiset_version(self) -> str:
+        return self._file.attrs['dandiset_version']
+
+    def find_datasets(
+        self,
+        *,
+        path: Union[str, None] = None,
+        path_prefix: Union[str, None] = None,
+        dtype: Union[str, None] = None,
+        ndim: Union[int, None] = None,
+        shape: Union[List[int], None] = None,
+        asset_id: Union[str, None] = None,
+        include_attrs: bool = False
+    ) -> List[dict]:
+        """Returns the datasets that match all of the given predicates.
+
+        Args:
+            path (str, optional): Exact dataset path.
+            path_prefix (str, optional): Dataset path prefix.
+            dtype (str, optional): Dataset dtype, e.g. 'float32'.
+            ndim (int, optional): Number of dimensions.
+            shape (List[int], optional): Exact shape. Use -1 to match any size along a dimension.
+            asset_id (str, optional): Asset identifier.
+            include_attrs (bool): Whether to read and return the attributes.
+
+        Returns:
+            List[dict]: One dict per matching dataset with asset_id, asset_path, path, dtype, shape (and attrs).
+        """
+        table = 'datasets'
+        mask = np.ones((self._get_num_rows(table),), dtype=bool)
+        if asset_id is not None:
+            mask &= self._get_asset_mask(table, asset_id)
+        if ndim is not None or shape is not None:
+            ndims = self._get_column(table, 'ndim')
+            if ndim is not None:
+                mask &= ndims == ndim
+            if shape is not None:
+                mask &= ndims == len(shape)
+                shapes = self._get_column(table, 'shape')
+                for dim, size in enumerate(shape):
+                    if size >= 0 and dim < shapes.shape[1]:
+                        mask &= shapes[:, dim] == size
+        if dtype is not None:
+            mask &= self._get_column(table, 'dtype') == dtype
+        if path is not None:
+            mask &= self._get_column(table, 'path') == path
+        if path_prefix is not None:
+            mask &= np.char.startswith(self._get_column(table, 'path').astype(str), path_prefix)
+        rows = np.nonzero(mask)[0]
+        return self._get_rows(table, rows, include_attrs=include_attrs)
+
+    def find_groups(
+        self,
+        *,
+        path: Union[str, None] = None,
+        path_prefix: Union[str, None] = None,
+        asset_id: Union[str, None] = None,
+        include_attrs: bool = False
+    ) -> List[dict]:
+        """Returns the groups that match all of the given predicates, see find_datasets."""
+        table = 'groups'
+        mask = np.ones((self._get_num_rows(table),), dtype=bool)
+        if asset_id is not None:
+            mask &= self._get_asset_mask(table, asset_id)
+        if path is not None:
+            mask &= self._get_column(table, 'path') == path
+        if path_prefix is not None:
+            mask &= np.char.startswith(self._get_column(table, 'path').astype(str), path_prefix)
+        rows = np.nonzero(mask)[0]
+        return self._get_rows(table, rows, include_attrs=include_attrs)
+
+    def load_dandiset(self) -> dict:
+        """Returns all of the metadata, in the same form as the JSON output."""
+        asset_ids = self._get_column('assets', 'asset_id')
+        asset_paths = self._get_column('assets', 'asset_path')
+        assets = [
+            {
+                'asset_id': asset_id,
+                'asset_path': asset_path,
+                'nwb_metadata': {'groups': [], 'datasets': []}
+            }
+            for asset_id, asset_path in zip(asset_ids, asset_paths)
+        ]
+        for table in ['groups', 'datasets']:
+            num_rows = self._get_num_rows(table)
+            rows = self._get_rows(table, np.arange(num_rows), include_attrs=True, include_asset=False)
+            asset_indices = self._get_column(table, 'asset_index')
+            for asset_index, row in zip(asset_indices, rows):
+                assets[asset_index]['nwb_metadata'][table].append(row)
+        return {
+            'dandiset_id': self.dandiset_id,
+            'dandiset_version': self.dandiset_version,
+            'nwb_assets': assets
+        }
+
+    def close(self):
+        self._columns = {}
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _get_num_rows(self, table: str) -> int:
+        return len(self._file[table]['asset_index'])
+
+    def _get_column(self, table: str, name: str) -> np.ndarray:
+        key = f'{table}/{name}'
+        if key not in self._columns:
+            group = self._file[table]
+            if f'{name}_data' in group:
+                self._columns[key] = _read_string_column(group, name)
+            else:
+                self._columns[key] = group[name][()]
+        return self._columns[key]
+
+    def _get_asset_mask(self, table: str, asset_id: str) -> np.ndarray:
+        asset_indices = np.nonzero(self._get_column('assets', 'asset_id') == asset_id)[0]
+        return np.isin(self._get_column(table, 'asset_index'), asset_indices)
+
+    def _get_rows(self, table: str, rows: np.ndarray, *, include_attrs: bool, include_asset: bool = True) -> List[dict]:
+        if len(rows) == 0:
+            return []
+        columns = {'path': self._get_column(table, 'path')[rows]}
+        if table == 'datasets':
+            columns['dtype'] = self._get_column(table, 'dtype')[rows]
+            ndims = self._get_column(table, 'ndim')[rows]
+            shapes = self._get_column(table, 'shape')[rows]
+            columns['shape'] = [s[:n].tolist() for s, n in zip(shapes, ndims)]
+        if include_attrs:
+            # parse all of the attrs with a single call
+            columns['attrs'] = json.loads('[' + ','.join(self._get_column(table, 'attrs')[rows]) + ']')
+        if include_asset:
+            asset_indices = self._get_column(table, 'asset_index')[rows]
+            columns['asset_id'] = self._get_column('assets', 'asset_id')[asset_indices]
+            columns['asset_path'] = self._get_column('assets', 'asset_path')[asset_indices]
+        names = list(columns.keys())
+        values = [c.tolist() if isinstance(c, np.ndarray) else c for c in columns.values()]
+        return [dict(zip(names, row)) for row in zip(*values)]
+
+
+def _write_column(group: h5py.Group, name: str, values: np.ndarray):
+    if values.size > 0:
+        group.create_dataset(name, data=values, chunks=True, compression='gzip', shuffle=True)
+    else:
+        group.create_dataset(name, data=values)
+
+
+def _write_string_column(group: h5py.Group, name: str, values: List[str]):
+    encoded = [v.encode('utf-8') for v in values]
+    lengths = np.array([len(v) for v in encoded], dtype=np.int64)
+    _write_column(group, f'{name}_data', np.frombuffer(b''.join(encoded), dtype=np.uint8))
+    _write_column(group, f'{name}_index', np.cumsum(lengths))
+
+
+def _read_string_column(group: h5py.Group, name: str) -> np.ndarray:
+    data = group[f'{name}_data'][()].tobytes()
+    ends = group[f'{name}_index'][()].tolist()
+    starts = [0] + ends[:-1]
+    text = data.decode('utf-8')
+    values = np.empty((len(ends),), dtype=object)
+    if len(text) == len(data):
+        # ascii, so the byte offsets are also character offsets
+        values[:] = [text[start:end] for start, end in zip(starts, ends)]
+    else:
+        values[:] = [data[start:end].decode('utf-8') for start, end in zip(starts, ends)]
+    return values
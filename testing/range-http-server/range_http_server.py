@@ -0,0 +1,118 @@
+import os
+import sys
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from functools import partial
+
+
+# A local stand-in for S3 / the DANDI archive that serves files from a
+# directory and supports single-range requests (Range: bytes=start-end).
+# It counts the requests it receives, which makes it useful for checking
+# how many round trips a remote reader makes. For testing error handling, it
+# can also ignore the Range header (ignore_range, replying 200 with the whole
+# file) or truncate the next few range responses (num_short_responses).
+#
+# Usage:
+#   python range_http_server.py <directory> [port]
+#
+# Or from Python:
+#   server, base_url = start_range_http_server(directory)
+#   ...
+#   server.shutdown()
+
+
+class RangeRequestHandler(SimpleHTTPRequestHandler):
+    def send_head(self):
+        range_header = self.headers.get('Range')
+        if range_header is None or self.server.ignore_range:
+            return super().send_head()
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404, 'File not found')
+            return None
+        file_size = os.path.getsize(path)
+        try:
+            units, byte_range = range_header.split('=')
+            start_str, end_str = byte_range.split('-')
+            if units != 'bytes' or ',' in byte_range:
+                raise ValueError()
+            if start_str == '':
+                start = max(0, file_size - int(end_str))
+                end = file_size - 1
+            else:
+                start = int(start_str)
+                end = int(end_str) if end_str else file_size - 1
+        except ValueError:
+            self.send_error(400, 'Invalid range')
+            return None
+        end = min(end, file_size - 1)
+        if start > end:
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{file_size}')
+            self.end_headers()
+            return None
+        num_bytes = end - start + 1
+        if self.server.num_short_responses > 0 and num_bytes > 1:
+            self.server.num_short_responses -= 1
+            num_bytes = num_bytes // 2
+        f = open(path, 'rb')
+        f.seek(start)
+        self.send_response(206)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Range', f'bytes {start}-{end}/{file_size}')
+        self.send_header('Content-Length', str(num_bytes))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.end_headers()
+        self._range_remaining = num_bytes
+        return f
+
+    def copyfile(self, source, outputfile):
+        remaining = getattr(self, '_range_remaining', None)
+        if remaining is None:
+            try:
+                super().copyfile(source, outputfile)
+            except (BrokenPipeError, ConnectionResetError):
+                # clients abort full GET requests once they have the Content-Length
+                pass
+            return
+        self._range_remaining = None
+        while remaining > 0:
+            buf = source.read(min(64 * 1024, remaining))
+            if not buf:
+                break
+            outputfile.write(buf)
+            remaining -= len(buf)
+
+    def do_GET(self):
+        self.server.request_count += 1
+        super().do_GET()
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class RangeHTTPServer(ThreadingHTTPServer):
+    def __init__(self, directory: str, port: int = 0, verbose: bool = False):
+        super().__init__(('127.0.0.1', port), partial(RangeRequestHandler, directory=directory))
+        self.request_count = 0
+        self.verbose = verbose
+        self.ignore_range = False
+        self.num_short_responses = 0
+
+
+def start_range_http_server(directory: str, port: int = 0, verbose: bool = False):
+    """Starts the server on a background thread and returns (server, base_url)."""
+    server = RangeHTTPServer(directory, port=port, verbose=verbose)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    return server, f'http://{host}:{port}'
+
+
+if __name__ == '__main__':
+    directory = sys.argv[1] if len(sys.argv) > 1 else '.'
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+    server = RangeHTTPServer(directory, port=port, verbose=True)
+    print(f'Serving {directory} at http://127.0.0.1:{port}')
+    server.serve_forever()